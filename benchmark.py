@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------
+# micro benchmarks for yolo-6d
+# ---------------------
+
+from __future__ import print_function
+
+import argparse
+import random
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageMath
+
+from utils import augment
+
+
+def time_it(func, iters):
+    """
+    Return the average wall time of func() in milliseconds
+    """
+    func()  # warm up
+    start = time.time()
+    for _ in range(iters):
+        func()
+    return (time.time() - start) * 1000.0 / iters
+
+def random_image(h, w, seed=0):
+    rng = np.random.RandomState(seed)
+    return rng.randint(0, 256, size=(h, w, 3)).astype(np.uint8)
+
+def random_mask(h, w, seed=0):
+    mask = np.zeros((h, w), np.uint8)
+    mask[h // 4: 3 * h // 4, w // 4: 3 * w // 4] = 255
+    return mask
+
+# ======================== PIL reference ===================================
+
+def pil_distort_image(im, hue, sat, val):
+    im = im.convert('HSV')
+    cs = list(im.split())
+    cs[1] = cs[1].point(lambda i: i * sat)
+    cs[2] = cs[2].point(lambda i: i * val)
+
+    def change_hue(x):
+        x += hue*255
+        if x > 255:
+            x -= 255
+        if x < 0:
+            x += 255
+        return x
+    cs[0] = cs[0].point(change_hue)
+    im = Image.merge(im.mode, tuple(cs))
+    return im.convert('RGB')
+
+def pil_change_background(img, mask, bg):
+    # ImageMath.eval was renamed to unsafe_eval in Pillow 10.3
+    image_math_eval = getattr(ImageMath, 'unsafe_eval', None) or ImageMath.eval
+    ow, oh = img.size
+    bg = bg.resize((ow, oh)).convert('RGB')
+
+    imcs = list(img.split())
+    bgcs = list(bg.split())
+    maskcs = list(mask.split())
+    fics = list(Image.new(img.mode, img.size).split())
+
+    for c in range(len(imcs)):
+        negmask = maskcs[c].point(lambda i: 1 - i / 255)
+        posmask = maskcs[c].point(lambda i: i / 255)
+        fics[c] = image_math_eval("a * c + b * d", a=imcs[c], b=bgcs[c], c=posmask, d=negmask).convert('L')
+    return Image.merge(img.mode, tuple(fics))
+
+def np_sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+def np_corner_confidence(gt_corners, pr_corners, th=80, sharpness=2.0, im_width=640, im_height=480, eps=1e-5):
+    dist = np.reshape(gt_corners - pr_corners, (9, 2)) * np.array([im_width, im_height])
+    dist = np.sqrt(np.sum(np.square(dist), 1))
+    conf = (np.exp(sharpness * (1.0 - dist / th)) - 1.0) / (np.exp(sharpness) - 1.0 + eps)
+    return np.mean(conf * (dist < th))
+
+def legacy_region_loss(output, target, noobject_scale, object_scale, coord_scale, sil_thresh, quirks=True):
+    """
+    NumPy port of Region_Loss / build_targets before the vectorization, checked
+    against that graph. Its quirks: the label grid was indexed [column, row],
+    both grid offsets were the column, and the predicted corners were reshaped
+    from [18, N] to [N, 18] without a transpose, which mixes the corners of
+    different cells in the confidence targets.
+    quirks: False fixes the three of them, the semantics of the current loss
+    Returns (total, conf, coord)
+    """
+    nB, nH, nW = output.shape[:3]
+    N = nB * nH * nW
+    scale = np.tile([nW, nH], 9)
+    coords = np.concatenate([np_sigmoid(output[..., :2]), output[..., 2:18]], 3)  # [B, H, W, 18]
+    column = np.tile(np.arange(nW), nB * nH)
+    row    = np.tile(np.repeat(np.arange(nH), nW), nB)
+    offset = np.stack([column, column if quirks else row], 1)
+    pred_corners = (coords.reshape(N, 18) + np.tile(offset, 9)) / scale
+    if quirks:
+        pred_corners = pred_corners.T.reshape(-1, 18)  # the old [18, N] -> [N, 18] reshape
+    conf = np_sigmoid(output[..., 18])
+
+    conf_mask = np.zeros((nB, nH, nW))
+    tconf     = np.zeros((nB, nH, nW))
+    response  = np.zeros((nB, nH, nW))
+    tcoords   = np.zeros((nB, nH, nW, 18))
+    for b in range(nB):
+        gt = target[b][1:19]
+        cur_confs = np.array([np_corner_confidence(gt, pred_corners[b * nH * nW + n]) for n in range(nH * nW)])
+        conf_mask[b] = (np.maximum(cur_confs, 0) < sil_thresh).reshape(nH, nW) * noobject_scale
+        gx, gy = int(gt[0] * nW), int(gt[1] * nH)
+        cell = (gx, gy) if quirks else (gy, gx)
+        response[b][cell] = 1
+        tcoords[b][cell] = gt * scale - np.tile([gx, gy], 9)
+        conf_mask[b] += response[b] * object_scale
+        tconf[b] = response[b] * np_corner_confidence(gt, pred_corners[b * nH * nW + gy * nW + gx])
+
+    coord_err  = np.sum(np.square((coords - tcoords) * response[..., np.newaxis]))
+    loss_coord = coord_scale * coord_err / N / 2.0
+    loss_conf  = np.sum(np.square(conf * np.sqrt(conf_mask) - tconf * conf)) / N / 2.0
+    return loss_conf + loss_coord, loss_conf, loss_coord
+
+def random_target(batch_size, rng):
+    target = np.zeros((batch_size, 21), np.float32)
+    center = rng.uniform(0.2, 0.8, (batch_size, 1, 2))
+    corners = np.clip(center + rng.uniform(-0.1, 0.1, (batch_size, 9, 2)), 0, 0.999)
+    corners[:, 0] = center[:, 0]
+    target[:, 1:19] = corners.reshape(batch_size, 18)
+    return target
+
+# ======================== Benchmarks ======================================
+
+def bench_photometric(args):
+    """
+    Per image cost of background compositing (640x480) and
+    hue/saturation/exposure distortion (416x416), PIL vs numpy
+    """
+    img  = random_image(480, 640, seed=0)
+    bg   = random_image(375, 500, seed=1)
+    mask = random_mask(480, 640)
+    sized = random_image(416, 416, seed=2)
+    hue, sat, val = 0.05, 1.3, 0.8
+
+    pil_img, pil_bg, pil_sized = Image.fromarray(img), Image.fromarray(bg), Image.fromarray(sized)
+    pil_mask = Image.fromarray(mask).convert('RGB')
+
+    def pil_path():
+        pil_change_background(pil_img, pil_mask, pil_bg)
+        pil_distort_image(pil_sized, hue, sat, val)
+
+    def numpy_path():
+        augment.change_background(img, mask, cv2.resize(bg, (640, 480)))
+        augment.distort_image(sized, hue, sat, val)
+
+    before = time_it(pil_path, args.iters)
+    after  = time_it(numpy_path, args.iters)
+
+    ref = np.asarray(pil_distort_image(pil_sized, hue, sat, val)).astype(np.int32)
+    out = augment.distort_image(sized, hue, sat, val).astype(np.int32)
+    print('   photometric: PIL {:.3f} ms/img, numpy {:.3f} ms/img, speed up {:.1f}x'.format(
+        before, after, before / max(after, 1e-9)))
+    print('   mean abs diff to PIL distortion: {:.2f} (uint8 levels)'.format(np.mean(np.abs(ref - out))))
+
+def bench_warp(args):
+    """
+    Per sample geometric cost: composite at 640x480 then PIL crop + resize
+    versus a single warp of image and mask with compositing at 416x416
+    """
+    img  = random_image(480, 640, seed=0)
+    bg   = random_image(375, 500, seed=1)
+    mask = random_mask(480, 640)
+    shape = (416, 416)
+    crop  = (-40, 30, 600, 410)
+    labels = np.random.RandomState(0).uniform(0, 1, (1, 21))
+
+    pil_img, pil_bg = Image.fromarray(img), Image.fromarray(bg)
+    pil_mask = Image.fromarray(mask).convert('RGB')
+
+    def pil_path():
+        out = pil_change_background(pil_img, pil_mask, pil_bg)
+        out = out.crop((crop[0], crop[1], crop[0] + crop[2] - 1, crop[1] + crop[3] - 1))
+        np.asarray(out.resize(shape))
+        for i in range(labels.shape[0]):
+            for j in range(1, 19, 2):
+                min(0.999, max(0, labels[i][j] * 640. / crop[2] - float(crop[0]) / crop[2]))
+                min(0.999, max(0, labels[i][j+1] * 480. / crop[3] - float(crop[1]) / crop[3]))
+
+    def warp_path():
+        matrix = augment.crop_matrix(crop, shape)
+        sized  = augment.warp_image(img, matrix, shape)
+        sized_mask = augment.warp_image(mask, matrix, shape, cv2.INTER_NEAREST)
+        augment.change_background(sized, sized_mask, cv2.resize(bg, shape))
+        augment.warp_labels(labels, crop, (640, 480))
+
+    before = time_it(pil_path, args.iters)
+    after  = time_it(warp_path, args.iters)
+    print('   geometric: composite + PIL crop/resize {:.3f} ms/img, single warp {:.3f} ms/img, speed up {:.1f}x'.format(
+        before, after, before / max(after, 1e-9)))
+
+def check_loss_parity(sess, net, output, target, rtol=1e-4):
+    """
+    Raise AssertionError unless Region_Loss matches legacy_region_loss:
+    every term once its quirks are fixed, and the coordinate term of the old
+    loss as it was when the object centers lie on the diagonal of the grid,
+    where the [column, row] label indexing lands on the same cell.
+    The confidence term keeps the old quirks and is only reported.
+    Return the relative difference of the confidence term to the old loss
+    """
+    # feed the network output directly to check the loss alone
+    total, conf, coord, cls = sess.run(net.total_loss[:4], feed_dict={net.logit: output, net.target: target})
+    loss  = np.array([total - cls, conf, coord])  # the old loss had no class term
+    fixed = np.array(legacy_region_loss(output, target, net.noobj_scale, net.obj_scale, net.coord_scale, net.thresh, quirks=False))
+    old   = np.array(legacy_region_loss(output, target, net.noobj_scale, net.obj_scale, net.coord_scale, net.thresh))
+    assert np.allclose(loss, fixed, rtol=rtol), 'Region_Loss {} != old loss without its quirks {}'.format(loss, fixed)
+    assert np.isclose(coord, old[2], rtol=rtol), 'coordinate term {} != old loss {}'.format(coord, old[2])
+    return abs(conf - old[1]) / old[1]
+
+def bench_loss(args):
+    """
+    Parity of Region_Loss with the loss it replaced (legacy_region_loss), then
+    graph build time and train step time of the whole network at several batch sizes.
+    Exits with an AssertionError when the losses differ
+    """
+    import tensorflow as tf
+    import yolo.config as cfg
+    from yolo.yolo_6d_net import YOLO6D_net
+
+    rng = np.random.RandomState(0)
+    cfg.DISP = False
+    for batch_size in args.batch_sizes:
+        tf.reset_default_graph()
+        start = time.time()
+        net = YOLO6D_net()
+        train_op = tf.train.AdamOptimizer(1e-4).minimize(net.total_loss[0])
+        build_time = time.time() - start
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            output = rng.normal(0, 1, [batch_size] + net.logit.get_shape().as_list()[1:]).astype(np.float32)
+            target = random_target(batch_size, rng)
+            target[:, 2] = target[:, 1]  # centers on the diagonal (square grid)
+            conf_diff = check_loss_parity(sess, net, output, target)
+
+            images = rng.uniform(0, 255, [batch_size] + net.input_images.get_shape().as_list()[1:]).astype(np.float32)
+            feed_dict = {net.input_images: images, net.target: target}
+            step_time = time_it(lambda: sess.run(train_op, feed_dict=feed_dict), args.iters)
+
+        print('   batch {:3d}: build {:.2f} s, {} graph ops, step {:.1f} ms, loss matches, confidence term {:.1%} off the old quirks'.format(
+            batch_size, build_time, len(tf.get_default_graph().get_operations()), step_time, conf_diff))
+
+def xla_run(xla, training, batch_size, iters, queue):
+    """
+    One configuration in a fresh process, so the peak RSS is its own
+    """
+    import resource
+    import tensorflow as tf
+    import yolo.config as cfg
+    from yolo.yolo_6d_net import YOLO6D_net
+
+    rng = np.random.RandomState(0)
+    cfg.DISP = False
+    start = time.time()
+    net = YOLO6D_net(is_training=training, xla=xla)
+    images = rng.uniform(0, 255, [batch_size] + net.input_images.get_shape().as_list()[1:]).astype(np.float32)
+    feed_dict = {net.input_images: images}
+    if training:
+        fetch = tf.train.AdamOptimizer(1e-4).minimize(net.total_loss[0])
+        feed_dict[net.target] = random_target(batch_size, rng)
+    else:
+        fetch = net.logit
+    build_time = time.time() - start
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        # the first run compiles the XLA clusters
+        start = time.time()
+        sess.run(fetch, feed_dict=feed_dict)
+        first_time = time.time() - start
+        step_time = time_it(lambda: sess.run(fetch, feed_dict=feed_dict), iters)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # KB on Linux
+    queue.put((build_time, first_time, step_time, peak_rss))
+
+def bench_xla(args):
+    """
+    Forward pass and full train step with and without XLA: graph build time,
+    first run (includes XLA compilation), steady state time and peak memory
+    """
+    import multiprocessing
+
+    ctx = multiprocessing.get_context('spawn')
+    for batch_size in args.batch_sizes:
+        for training in (False, True):
+            results = {}
+            for xla in (False, True):
+                queue = ctx.Queue()
+                proc = ctx.Process(target=xla_run, args=(xla, training, batch_size, args.iters, queue))
+                proc.start()
+                results[xla] = queue.get()
+                proc.join()
+            for xla in (False, True):
+                build_time, first_time, step_time, peak_rss = results[xla]
+                print('   batch {:3d} {:>10} {:>6}: build {:.2f} s, first run {:.2f} s, step {:.1f} ms, peak RSS {:.0f} MB'.format(
+                    batch_size, 'train step' if training else 'forward', 'XLA' if xla else 'plain',
+                    build_time, first_time, step_time, peak_rss))
+            print('   batch {:3d} {:>10}: XLA speed up {:.2f}x'.format(
+                batch_size, 'train step' if training else 'forward', results[False][2] / max(results[True][2], 1e-9)))
+
+def slice_reorg(inputs):
+    """
+    Former passthrough reorg: four strided slices and a concat
+    """
+    import tensorflow as tf
+    outputs_1 = inputs[:, ::2, ::2, :]
+    outputs_2 = inputs[:, ::2, 1::2, :]
+    outputs_3 = inputs[:, 1::2, ::2, :]
+    outputs_4 = inputs[:, 1::2, 1::2, :]
+    return tf.concat([outputs_1, outputs_2, outputs_3, outputs_4], axis = 3)
+
+def bench_reorg(args):
+    """
+    Passthrough branch (reorg of the 26_conv output, forward and backward) and
+    full forward pass, strided slices + concat versus space_to_depth.
+    Use --batch_sizes 1 32 for the deployment and training batch sizes
+    """
+    import tensorflow as tf
+    import yolo.config as cfg
+    from yolo.yolo_6d_net import YOLO6D_net
+
+    class SliceReorgNet(YOLO6D_net):
+        def reorg(self, inputs, stride = 2):
+            return slice_reorg(inputs)
+
+    rng = np.random.RandomState(0)
+    cfg.DISP = False
+    cell = cfg.IMAGE_SIZE // 16
+    for batch_size in args.batch_sizes:
+        tf.reset_default_graph()
+        # a variable, so grappler cannot constant fold the branch away
+        features = tf.Variable(rng.normal(0, 1, (batch_size, cell, cell, 64)).astype(np.float32))
+        branches = {}
+        for name, reorg in (('slices', slice_reorg), ('space_to_depth', lambda x: tf.space_to_depth(x, 2))):
+            output = reorg(features)
+            branches[name] = (output, tf.gradients(tf.reduce_sum(tf.square(output)), features)[0])
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            before, after = sess.run([branches['slices'][0], branches['space_to_depth'][0]])
+            diff = np.max(np.abs(before - after))
+            times = dict((name, (time_it(lambda: sess.run(fetch[0].op), args.iters),
+                                 time_it(lambda: sess.run(fetch[1].op), args.iters)))
+                         for name, fetch in branches.items())
+        print('   batch {:3d} passthrough: slices {:.3f} ms fwd / {:.3f} ms fwd+bwd, space_to_depth {:.3f} ms / {:.3f} ms, max diff {:.1e}'.format(
+            batch_size, times['slices'][0], times['slices'][1], times['space_to_depth'][0], times['space_to_depth'][1], diff))
+
+        images = rng.uniform(0, 255, (batch_size, cfg.IMAGE_SIZE, cfg.IMAGE_SIZE, 3)).astype(np.float32)
+        forward = {}
+        for name, net_class in (('slices', SliceReorgNet), ('space_to_depth', YOLO6D_net)):
+            tf.reset_default_graph()
+            net = net_class(is_training=False)
+            with tf.Session() as sess:
+                sess.run(tf.global_variables_initializer())
+                forward[name] = time_it(lambda: sess.run(net.logit.op, feed_dict={net.input_images: images}), args.iters)
+        print('   batch {:3d} forward: slices {:.1f} ms, space_to_depth {:.1f} ms'.format(
+            batch_size, forward['slices'], forward['space_to_depth']))
+
+def bench_decode(args):
+    """
+    Evaluation decode of a batch of output maps: fetch the whole map and
+    decode image by image in NumPy (get_predict_boxes), or the whole batch
+    at once (decode_batch, with and without the 3x3 refinement), versus the
+    in-graph decode head (net.detections) on the same random output maps
+    """
+    import tensorflow as tf
+    import yolo.config as cfg
+    from utils.decode import decode_batch
+    from utils.utils import get_predict_boxes
+    from yolo.yolo_6d_net import YOLO6D_net
+
+    rng = np.random.RandomState(0)
+    cfg.DISP = False
+    shape = [cfg.CELL_SIZE, cfg.CELL_SIZE, 20]
+    for batch_size in args.batch_sizes:
+        tf.reset_default_graph()
+        net = YOLO6D_net(is_training=False, top_k=1)
+        # a variable holds the output map, so both paths start from it inside the session
+        value = rng.normal(0, 1, [batch_size] + shape).astype(np.float32)
+        output = tf.Variable(value)
+        fetch_map  = tf.identity(output)
+        detections = net.decode_layer(output, 1)[0]
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+
+            def numpy_decode():
+                maps = sess.run(fetch_map)
+                return [np.array(get_predict_boxes(m * cfg.OUTPUT_SCALE, cfg.NUM_CLASSES)) for m in maps]
+
+            def batch_decode(refine):
+                return decode_batch(sess.run(fetch_map) * cfg.OUTPUT_SCALE, refine=refine)[0]
+
+            boxes = np.array(numpy_decode()) * np.tile([cfg.IMAGE_WIDTH, cfg.IMAGE_HEIGHT], 9)
+            dets  = sess.run(detections)
+            diff  = max(np.max(np.abs(boxes - dets[:, 0, :18])),
+                        np.max(np.abs(boxes - batch_decode(False).reshape(batch_size, 18))))
+            before  = time_it(numpy_decode, args.iters)
+            batched = time_it(lambda: batch_decode(False), args.iters)
+            refined = time_it(lambda: batch_decode(True), args.iters)
+            after   = time_it(lambda: sess.run(detections), args.iters)
+            print('   batch {:3d}: fetch {} -> {} floats, per image {:.3f} ms, decode_batch {:.3f} ms ({:.3f} ms refined), '
+                  'in-graph {:.3f} ms, max diff {:.1e} px'.format(
+                batch_size, value.size, dets.size, before, batched, refined, after, diff))
+
+
+def bench_pnp(args):
+    """
+    Poses of random views of a LINEMOD sized box from noisy keypoints:
+    cv2.solvePnP frame by frame (utils.pnp) versus batch_pnp.
+    --batch_sizes are the noise levels in pixels, --iters x 1000 frames
+    """
+    import yolo.config as cfg
+    from utils.batch_pnp import batch_pnp, reprojection_error, rodrigues
+
+    rng = np.random.RandomState(0)
+    K = np.array([[572.4114, 0., 325.2611], [0., 573.5704, 242.0489], [0., 0., 1.]])
+    corners = np.array([[x, y, z] for x in (-0.04, 0.04) for y in (-0.05, 0.05) for z in (-0.03, 0.03)])
+    points3D = np.r_[np.zeros((1, 3)), corners]
+    num = args.iters * 1000
+    R = rodrigues(rng.normal(0, 1, (num, 3)))
+    t = np.c_[rng.uniform(-0.1, 0.1, (num, 2)), rng.uniform(0.5, 1.2, num)]
+    uv = np.einsum('ij,bnj->bni', K, np.einsum('bij,nj->bni', R, points3D) + t[:, np.newaxis])
+    uv = uv[:, :, :2] / uv[:, :, 2:]
+
+    for noise in args.batch_sizes:
+        points2D = uv + rng.normal(0, noise, uv.shape)
+        start = time.time()
+        poses = [cv2.solvePnP(points3D.astype(np.float32), points2D[b].astype(np.float32).reshape(-1, 1, 2),
+                              K.astype(np.float32), np.zeros((8, 1), np.float32))[1:] for b in range(num)]
+        R_cv = np.array([cv2.Rodrigues(rvec)[0] for rvec, _ in poses])
+        t_cv = np.array([tvec.reshape(3) for _, tvec in poses])
+        before = time.time() - start
+        start = time.time()
+        R_b, t_b = batch_pnp(points3D, points2D, K)
+        after = time.time() - start
+        start = time.time()
+        R_r, t_r = batch_pnp(points3D, points2D, K, refine_px=cfg.PNP_REFINE_PX)
+        refined = time.time() - start
+        solutions = ((R_cv, t_cv), (R_b, t_b[:, :, 0]), (R_r, t_r[:, :, 0]))
+        errors = [reprojection_error(points3D, points2D, K, R_, t_) for R_, t_ in solutions]
+        shifts = [np.linalg.norm(t_ - t, axis=1) * 100 for _, t_ in solutions]
+        print('   noise {:4.1f} px: poses/s cv2 {:.0f}, batch_pnp {:.0f} ({:.1f}x), with restarts above {:.0f} px {:.0f}; '
+              'median reprojection {:.3f} / {:.3f} / {:.3f} px, translation error > 10 cm {} / {} / {}'.format(
+            noise, num / before, num / after, before / after, cfg.PNP_REFINE_PX, num / refined,
+            *([np.median(e) for e in errors] + [np.sum(s > 10) for s in shifts])))
+
+
+def bench_metrics(args):
+    """
+    ADD / ADD-S of --iters x 20 random pose pairs on a 5000 vertex mesh:
+    dense per-vertex distances versus MeshMetric, --batch_sizes are the
+    farthest point subsample sizes (0: all the vertices)
+    """
+    from utils.batch_pnp import rodrigues
+    from utils.pose_metrics import MeshMetric, nearest_distances
+
+    rng = np.random.RandomState(0)
+    surface = rng.normal(0, 1, (5000, 3))
+    surface = surface / np.linalg.norm(surface, axis=1, keepdims=True) * [0.04, 0.05, 0.03]
+    vertices = np.c_[surface, np.ones(len(surface))].T
+    num = args.iters * 20
+    R_gt = rodrigues(rng.normal(0, 1, (num, 3)))
+    R_pr = np.matmul(rodrigues(rng.normal(0, 0.1, (num, 3))), R_gt)
+    t_gt = np.c_[rng.uniform(-0.1, 0.1, (num, 2)), rng.uniform(0.5, 1.2, num)][:, :, np.newaxis]
+    t_pr = t_gt + rng.normal(0, 0.01, t_gt.shape)
+
+    start = time.time()
+    dense_3d_gt = np.matmul(np.concatenate((R_gt, t_gt), 2), vertices)
+    dense_3d_pr = np.matmul(np.concatenate((R_pr, t_pr), 2), vertices)
+    dense = np.mean(np.linalg.norm(dense_3d_gt - dense_3d_pr, axis=1), 1)
+    dense_ms = (time.time() - start) * 1000 / num
+    start = time.time()
+    naive = np.array([np.mean(nearest_distances(None, dense_3d_pr[b].T, dense_3d_gt[b].T)) for b in range(num)])
+    naive_ms = (time.time() - start) * 1000 / num
+    print('   dense over {} vertices: ADD {:.3f} ms, ADD-S brute force {:.3f} ms per frame'.format(
+        len(surface), dense_ms, naive_ms))
+
+    for num_points in args.batch_sizes:
+        for symmetric, reference in ((False, dense), (True, naive)):
+            start = time.time()
+            metric = MeshMetric(vertices, symmetric, num_points)
+            build = time.time() - start
+            start = time.time()
+            values = metric.distances(metric.transform(R_gt, t_gt), R_pr, t_pr)
+            ms = (time.time() - start) * 1000 / num
+            bound = metric.error_bound(R_gt, R_pr)
+            print('   {:<5} on {:4d} points: {:.3f} ms per frame ({:.1f}x, built in {:.2f} s), '
+                  'max diff {:.2e} m, bound {:.2e} m'.format(
+                'ADD-S' if symmetric else 'ADD', len(metric.index), ms, (naive_ms if symmetric else dense_ms) / ms,
+                build, np.max(np.abs(values - reference)), np.max(bound)))
+
+
+TASKS = {
+    'photometric': bench_photometric,
+    'warp': bench_warp,
+    'loss': bench_loss,
+    'reorg': bench_reorg,
+    'xla': bench_xla,
+    'decode': bench_decode,
+    'pnp': bench_pnp,
+    'metrics': bench_metrics,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--task', default='photometric', type=str, choices=sorted(TASKS.keys()))
+    parser.add_argument('--iters', default=50, type=int)
+    parser.add_argument('--batch_sizes', default=[4, 16, 64], type=int, nargs='+')
+    parser.add_argument('--image_size', default=0, type=int, help='network input of the loss and xla tasks, 0: IMAGE_SIZE')
+    args = parser.parse_args()
+
+    if args.image_size:
+        import yolo.config as cfg
+        cfg.set_image_size(args.image_size)
+    random.seed(0)
+    TASKS[args.task](args)
+
+if __name__ == "__main__":
+
+    main()
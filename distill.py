@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------
+# distill a trained yolo-6d (teacher) into a lighter student network
+# ---------------------
+
+from __future__ import print_function
+
+import argparse
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import yolo.config as cfg
+from export import load_inference_model
+from linemod import Linemod
+from train import Solver, update_config_paths
+from utils.evaluation import PoseEvaluator, evaluate_frames, mesh_vertices
+from yolo.yolo_6d_net import YOLO6D_net
+
+
+class DistillSolver(Solver):
+    """
+    Solver of the student: every batch also goes through the frozen teacher,
+    whose output map the student learns to mimic next to the ground truth
+    """
+
+    def __init__(self, net, data, arg=None):
+        Solver.__init__(self, net, data, arg)
+        # the teacher lives in a graph and session of its own, created after
+        # the loader processes like the student session
+        teacher_file = os.path.join(cfg.WEIGHTS_DIR, arg.teacher_weights)
+        print('\n----------Loading teacher from: {}--'.format(teacher_file))
+        self.teacher_sess, self.teacher = load_inference_model(teacher_file, arg.teacher_netcfg)
+
+    def restore(self):
+        """
+        Continue from the student checkpoint when there is one
+        """
+        if tf.train.checkpoint_exists(self.weight_file):
+            print('\n----------Restoring student from: {}------batch: {}--'.format(self.weight_file, self.batch_size))
+            tf.train.Saver(self.net.variables).restore(self.sess, self.weight_file)
+        else:
+            print('\n----------Training the student from scratch------batch: {}--'.format(self.batch_size))
+
+    def get_feed_dict(self, images, gt_label):
+        feed_dict = Solver.get_feed_dict(self, images, gt_label)
+        feed_dict[self.net.teacher_logit] = self.teacher_sess.run(
+            self.teacher.logit, feed_dict={self.teacher.input_images: images})
+        return feed_dict
+
+    def compare(self, num_frames=0):
+        """
+        Latency (one frame at a time) and accuracy of student and teacher on the valid list
+        """
+        self.net.evaluation()
+        frames = self.data.load_test_list()
+        if num_frames > 0:
+            frames = frames[:num_frames]
+        vertices = mesh_vertices(self.meshname)
+        models = [('teacher', self.teacher_sess, self.teacher), ('student', self.sess, self.net)]
+        rows = []
+        for name, sess, net in models:
+            evaluator = PoseEvaluator(vertices, self.vx_threshold, self.internal_calibration, symmetric=self.symmetric)
+            run = lambda image: sess.run(net.logit, feed_dict={net.input_images: image})
+            ms = evaluate_frames(self.data, frames, run, evaluator)
+            params = sum(np.prod(v.get_shape().as_list()) for v in net.variables) or \
+                sum(w.size + b.size for w, b in net.weights.values())  # folded teacher
+            rows.append((name, params, ms, evaluator.summary()))
+
+        print('\n   {:>8}{:>10}{:>12}{:>10}{:>10}{:>10}{:>14}'.format(
+            '', 'params', 'ms/frame', '2D 5px', 'ADD', '5cm5deg', 'corner err'))
+        for name, params, ms, stats in rows:
+            print('   {:>8}{:>9.1f}M{:>12.2f}{:>9.2f}%{:>9.2f}%{:>9.2f}%{:>14.2f}'.format(
+                name, params / 1e6, ms, stats['acc'], stats['acc3d'], stats['acc5cm5deg'], stats['mean_corner_err']))
+        return rows
+
+    def __del__(self):
+        if hasattr(self, 'teacher_sess'):
+            self.teacher_sess.close()
+        Solver.__del__(self)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datacfg', default='cfg/ape.data', type=str)
+    parser.add_argument('--gpu', default='2', type=str)
+    parser.add_argument('--data_dir', default="data", type=str)
+    parser.add_argument('--teacher_weights', default="yolo_6d.ckpt", type=str)
+    parser.add_argument('--teacher_netcfg', default=cfg.NET_CFG, type=str)
+    parser.add_argument('--weights', default="yolo_6d_student.ckpt", type=str, help='student checkpoint, restored when it exists')
+    parser.add_argument('--netcfg', default=os.path.join('cfg', 'yolo-pose-tiny.cfg'), type=str, help='Darknet cfg of the student')
+    parser.add_argument('--batch', default=0, type=int)
+    parser.add_argument('--workers', default=0, type=int)
+    parser.add_argument('--shards', default='', type=str)
+    parser.add_argument('--image_size', default=cfg.IMAGE_SIZE, type=int, help='network input, a multiple of 32')
+    parser.add_argument('--eval_frames', default=0, type=int, help='valid frames of the final comparison, 0: all')
+    parser.add_argument('--eval_only', action='store_true', help='skip training, compare the saved student with the teacher')
+    args = parser.parse_args()
+    args.pre = False
+
+    if args.data_dir != cfg.DATA_DIR:
+        update_config_paths(args.data_dir, args.weights)
+    cfg.set_image_size(args.image_size)
+
+    gpu_device = '/gpu:' + args.gpu
+    with tf.device(gpu_device):
+        student = YOLO6D_net(cfgfile=args.netcfg, distill=True)
+        datasets = Linemod('train', arg=args.datacfg, shards=args.shards)
+        solver = DistillSolver(student, datasets, arg=args)
+
+        if not args.eval_only:
+            print("\n-----------------------------start distillation----------------------------")
+            solver.train()
+    solver.compare(args.eval_frames)
+
+if __name__ == "__main__":
+
+    main()
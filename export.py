@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------
+# export an inference graph: batch norm folded, no loss, constant weights
+# ---------------------
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+import yolo.config as cfg
+from utils.timer import Timer
+from yolo.yolo_6d_net import YOLO6D_net
+
+try:
+    from tensorflow.tools.graph_transforms import TransformGraph
+except ImportError:
+    TransformGraph = None
+
+
+def read_layers(sess, net):
+    """
+    Return the variable values of every conv layer of net, in creation order
+    """
+    fetches = [dict((k, v) for k, v in layer.items() if k != 'name') for layer in net.layers]
+    values  = sess.run(fetches)
+    for layer, value in zip(net.layers, values):
+        value['name'] = layer['name']
+    return values
+
+def fold_batch_norm(layers, epsilon=1e-05):
+    """
+    conv * scale / sqrt(var + eps) + shift - mean * scale / sqrt(var + eps) + biases
+    Return {layer name: (weight, biases)} for YOLO6D_net(weights=...)
+    """
+    weights = {}
+    for layer in layers:
+        weight, biases = layer['weight'], layer['biases']
+        if 'scale' in layer:
+            factor = layer['scale'] / np.sqrt(layer['rolling_variance'] + epsilon)
+            weight = weight * factor  # broadcast on the output channels
+            biases = biases + layer['shift'] - layer['rolling_mean'] * factor
+        weights[layer['name']] = (weight.astype(np.float32), biases.astype(np.float32))
+    return weights
+
+def load_inference_model(weights_file, cfgfile=None):
+    """
+    Restore a checkpoint and return (session, net) of its batch norm folded
+    inference graph, built in a graph of its own
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        net = YOLO6D_net(is_training=False, cfgfile=cfgfile)
+        with tf.Session() as sess:
+            tf.train.Saver(net.variables).restore(sess, weights_file)
+            layers = read_layers(sess, net)
+
+    graph = tf.Graph()
+    with graph.as_default():
+        folded_net = YOLO6D_net(is_training=False, weights=fold_batch_norm(layers), cfgfile=cfgfile)
+    return tf.Session(graph=graph), folded_net
+
+def optimize_graph_def(graph_def, outputs=('logit',)):
+    """
+    Keep only what the outputs need and fold constant subgraphs
+    """
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, list(outputs))
+    if TransformGraph is not None:
+        graph_def = TransformGraph(graph_def, ['images'], list(outputs),
+                                   ['fold_constants(ignore_errors=true)', 'strip_unused_nodes', 'sort_by_execution_order'])
+    return graph_def
+
+def load_frozen_graph(path):
+    """
+    Return (graph, input tensor, output tensor) of an exported .pb file
+    """
+    graph_def = tf.GraphDef()
+    with tf.gfile.GFile(path, 'rb') as f:
+        graph_def.ParseFromString(f.read())
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name='')
+    return graph, graph.get_tensor_by_name('images:0'), graph.get_tensor_by_name('logit:0')
+
+def check_parity(sess, net, frozen_file, batch_size=2, iters=5):
+    """
+    Compare the training graph and the exported graph on the same input
+    Return (max abs diff, max abs output, ms per forward before, after)
+    """
+    rng = np.random.RandomState(0)
+    images = rng.uniform(0, 255, (batch_size, cfg.IMAGE_SIZE, cfg.IMAGE_SIZE, 3)).astype(np.float32)
+
+    graph, input_images, logit = load_frozen_graph(frozen_file)
+    frozen_sess = tf.Session(graph=graph)
+
+    # warm up, the first run of a session also optimizes the graph
+    sess.run(net.logit, feed_dict={net.input_images: images})
+    frozen_sess.run(logit, feed_dict={input_images: images})
+
+    before, after = Timer(), Timer()
+    for _ in range(iters):
+        before.tic()
+        ref = sess.run(net.logit, feed_dict={net.input_images: images})
+        before.toc()
+        after.tic()
+        out = frozen_sess.run(logit, feed_dict={input_images: images})
+        after.toc()
+    frozen_sess.close()
+    return np.max(np.abs(ref - out)), np.max(np.abs(ref)), before.average_time * 1000, after.average_time * 1000
+
+def export(weights_file, output_file, saved_model_dir=''):
+    cfg.DISP = False
+
+    # 1. restore the checkpoint into the batch norm folded inference graph,
+    #    constant weights, no loss or optimizer nodes
+    folded_sess, folded_net = load_inference_model(weights_file)
+    graph = folded_sess.graph
+    with graph.as_default():
+        outputs = {'logit': folded_net.logit}
+        if folded_net.detections is not None:
+            outputs['detections']      = folded_net.detections
+            outputs['detection_cells'] = folded_net.detection_cells
+        graph_def = optimize_graph_def(graph.as_graph_def(), sorted(outputs))
+
+    # 2. the plain inference graph of the checkpoint, the reference of the parity check
+    net = YOLO6D_net(is_training=False)
+    sess = tf.Session()
+    tf.train.Saver(net.variables).restore(sess, weights_file)
+    num_ops_before = len(sess.graph.get_operations())
+
+    output_dir = os.path.dirname(output_file)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    tf.train.write_graph(graph_def, output_dir or '.', os.path.basename(output_file), as_text=False)
+    print('   frozen graph ({} ops, was {}) written to {}'.format(len(graph_def.node), num_ops_before, output_file))
+
+    if saved_model_dir:
+        with graph.as_default():
+            tf.saved_model.simple_save(folded_sess, saved_model_dir,
+                                       inputs={'images': folded_net.input_images},
+                                       outputs=outputs)
+        print('   SavedModel written to {}'.format(saved_model_dir))
+    folded_sess.close()
+
+    # 3. the exported graph must give the same output
+    diff, scale, before, after = check_parity(sess, net, output_file)
+    sess.close()
+    print('   parity: max abs diff {:.3e} (max abs output {:.3e})'.format(diff, scale))
+    print('   forward: {:.1f} ms before, {:.1f} ms after'.format(before, after))
+    return diff <= 1e-3 * max(scale, 1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', default='yolo_6d.ckpt', type=str)
+    parser.add_argument('--data_dir', default='data', type=str)
+    parser.add_argument('--weight_dir', default='weights', type=str)
+    parser.add_argument('--output', default=os.path.join('data', 'export', 'yolo_6d.pb'), type=str)
+    parser.add_argument('--saved_model', default='', type=str)
+    parser.add_argument('--netcfg', default=cfg.NET_CFG, type=str, help='Darknet cfg of the network')
+    parser.add_argument('--image_size', default=cfg.IMAGE_SIZE, type=int, help='network input, a multiple of 32')
+    args = parser.parse_args()
+
+    weight_file = os.path.join(args.data_dir, args.weight_dir, args.weights)
+    cfg.set_image_size(args.image_size)
+    cfg.NET_CFG = args.netcfg
+    if not export(weight_file, args.output, args.saved_model):
+        print('   exported graph does not match the checkpoint')
+        sys.exit(1)
+
+if __name__ == "__main__":
+
+    main()
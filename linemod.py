@@ -6,20 +6,48 @@
 # @Email: fmo@nullmax.ai
 # ---------------------
 
+import glob
 import os
 import random
+import cv2
 import numpy as np
-from PIL import Image, ImageChops, ImageMath
+from PIL import Image
 
 import yolo.config as cfg
+from utils import augment
+from utils.bg_pool import BackgroundPool
+from utils.shards import ShardReader, shard_dir
 from utils.utils import *
 
 
 
+def get_label_path(imgpath):
+    return imgpath.replace('images', 'labels').replace('JPEGImages', 'labels').replace('.jpg', '.txt').replace('.png','.txt')
+
+def get_mask_path(imgpath):
+    return imgpath.replace('JPEGImages', 'mask').replace('/00', '/').replace('.jpg', '.png')
+
+def datacfg_list(datacfg):
+    """
+    .data files of a comma separated list, 'all' is every cfg/*.data (the 13 LINEMOD objects)
+    """
+    if datacfg == 'all':
+        return sorted(glob.glob(os.path.join('cfg', '*.data')))
+    return [d for d in datacfg.split(',') if d]
+
+def load_dataset(phase, datacfg, shards=None):
+    """
+    Linemod of one .data file, MultiLinemod of several (see datacfg_list)
+    """
+    datacfgs = datacfg_list(datacfg)
+    if len(datacfgs) == 1:
+        return Linemod(phase, arg=datacfgs[0], shards=shards)
+    return MultiLinemod(phase, datacfgs, shards=shards)
+
 
 class Linemod(object):
 
-    def __init__(self, phase, arg=None):
+    def __init__(self, phase, arg=None, shards=None):
         # Set parameters for training and testing
         self.data_options = read_data_cfg(arg)
         self.trainlist    = self.data_options['train']
@@ -29,17 +57,22 @@ class Linemod(object):
         self.diam         = float(self.data_options['diam'])
         self.dataset_name = self.data_options['name']
         self.vx_threshold = self.diam * 0.1
+        self.symmetric    = self.dataset_name in cfg.SYMMETRIC_OBJECTS  # scored with ADD-S
 
         self.phase        = phase
         self.datasets_dir = os.path.join('LINEMOD', self.dataset_name)
         self.batch_size   = cfg.BATCH_SIZE
         self.image_size   = cfg.IMAGE_SIZE
-        self.image_width  = 640   # axis x
-        self.image_height = 480   # axis y
+        self.image_width  = cfg.IMAGE_WIDTH   # axis x
+        self.image_height = cfg.IMAGE_HEIGHT  # axis y
         self.bg_files     = None
+        self.bg_pool      = None
+        self.flip         = False
+        self.shards       = None
 
         self.cell_size       = cfg.CELL_SIZE
         self.boxes_per_cell  = cfg.BOXES_PER_CELL
+        self.max_objects     = cfg.MAX_OBJECTS
         self.num_classes     = cfg.NUM_CLASSES
         self.shuffle         = cfg.SHUFFLE
         self.train_imgname   = None
@@ -49,8 +82,16 @@ class Linemod(object):
         self.test_gt_labels  = None
         self.gt_labels       = None
         self.batch           = 0
+        self.test_batch      = 0
+        self.truths          = None
+        self.test_indices    = None
         print("\n---------------Loading dataset---------------")
         self.prepare(self.phase)  # get the image files name and label files name
+        if shards:
+            # serve images, masks and labels from pre-decoded shards (see pack_shards.py)
+            split = 'train' if self.phase == 'train' else 'valid'
+            self.shards = ShardReader(shard_dir(shards, self.dataset_name, split))
+            print("   reading {} frames from {}".format(len(self.shards), self.shards.directory))
         # print(len(self.bg_files))
         print("----------Loading dataset complete-----------\n")
 
@@ -60,6 +101,7 @@ class Linemod(object):
         self.gt_labels: A list of all ground true labels(which elements are lists like [[1,xx,xx,...],[1,xx,xx,...]] with integer and float numbers)
         these two matched respectively
         self.bg_files: A list of VOC images path
+        self.bg_pool:  VOC images pre-resized to the network input (when cfg.BG_POOL_SIZE > 0)
         """
         if phase == 'train':
             with open(self.trainlist, 'r') as f:
@@ -68,7 +110,13 @@ class Linemod(object):
             if self.shuffle:
                 random.shuffle(self.imgname)
 
-            self.bg_files = get_all_files('VOCdevkit/VOC2012/JPEGImages')
+            if cfg.BG_POOL_SIZE > 0:
+                pool_file = 'bg_pool_{}x{}_{}.u8'.format(self.image_size, self.image_size, cfg.BG_POOL_SIZE)
+                makedirs(cfg.CACHE_DIR)
+                self.bg_pool = BackgroundPool(os.path.join(cfg.CACHE_DIR, pool_file), cfg.BG_DIR,
+                                              cfg.BG_POOL_SIZE, (self.image_size, self.image_size))
+            else:
+                self.bg_files = get_all_files(cfg.BG_DIR)
 
         elif phase == 'test':
             with open(self.testlist, 'r') as f:
@@ -78,103 +126,139 @@ class Linemod(object):
             print('\n   Wrong phase...\n   Try again...')
 
     def next_batches(self):
-        images   = np.zeros((self.batch_size, 416, 416, 3), np.float32)
-        gt_label = np.zeros((self.batch_size, 21), np.float32)
-        labels   = np.zeros((self.batch_size, 13, 13, 20), np.float32)
+        images, gt_label = self.get_batch(self.batch)
+        self.batch += 1
+        return images, gt_label
+
+    def get_batch(self, batch_idx):
+        """
+        Build the batch_idx-th batch of the (already shuffled) image list.
+        Only reads self.imgname and the backgrounds, so it can be called from
+        prefetching worker processes as well (see utils/loader.py)
+        """
+        shape    = (self.image_size, self.image_size)
+        images   = np.zeros((self.batch_size, self.image_size, self.image_size, 3), np.float32)
+        gt_label = np.zeros((self.batch_size, self.max_objects * 21), np.float32)
 
         jitter     = 0.2
         hue        = 0.1
         saturation = 1.5
         exposure   = 1.5
 
-        random_bg_index = random.randint(0, len(self.bg_files) - 1)
-        bgpath = self.bg_files[random_bg_index]
+        bg = self.random_background()
 
         for idx in range(self.batch_size):
-            images[idx], gt_label[idx] = self.load_data_detection(self.imgname[idx + self.batch * self.batch_size], (416, 416),
-                                                   jitter, hue, saturation, exposure, bgpath)
-            labels[idx] = self.get_label(gt_label[idx])
+            images[idx], gt_label[idx] = self.load_data_detection(self.imgname[idx + batch_idx * self.batch_size], shape,
+                                                   jitter, hue, saturation, exposure, bg)
 
-        images   = np.array(images) # nB X 416 X 416 X 3
-        gt_label = np.array(gt_label) # nB X 21
-        labels   = np.array(labels)   # nB X 13 X 13 X 20
+        images   = np.array(images) # nB X size X size X 3
+        gt_label = np.array(gt_label) # nB X (max_objects * 21), zero padded, the label grid is built inside the network
 
-        self.batch += 1
-        return images, gt_label, labels
-
-    def get_label(self, label):
-        # label: [21, ]
-        output = np.zeros([13, 13, 20], np.float32)
-        nW, nH = 13, 13
-        x0  = label[1] * nW
-        y0  = label[2] * nH
-        gx0 = int(x0)
-        gy0 = int(y0)
-        x1  = label[3] * nW
-        y1  = label[4] * nH
-        x2  = label[5] * nW
-        y2  = label[6] * nH
-        x3  = label[7] * nW
-        y3  = label[8] * nH
-        x4  = label[9] * nW
-        y4  = label[10] * nH
-        x5  = label[11] * nW
-        y5  = label[12] * nH
-        x6  = label[13] * nW
-        y6  = label[14] * nH
-        x7  = label[15] * nW
-        y7  = label[16] * nH
-        x8  = label[17] * nW
-        y8  = label[18] * nH
-        cls = label[0]
-
-        output[gx0][gy0][0]  = 1
-        output[gx0][gy0][1]  = x0 - gx0
-        output[gx0][gy0][2]  = y0 - gy0
-        output[gx0][gy0][3]  = x1 - gx0
-        output[gx0][gy0][4]  = y1 - gy0
-        output[gx0][gy0][5]  = x2 - gx0
-        output[gx0][gy0][6]  = y2 - gy0
-        output[gx0][gy0][7]  = x3 - gx0
-        output[gx0][gy0][8]  = y3 - gy0
-        output[gx0][gy0][9]  = x4 - gx0
-        output[gx0][gy0][10] = y4 - gy0
-        output[gx0][gy0][11] = x5 - gx0
-        output[gx0][gy0][12] = y5 - gy0
-        output[gx0][gy0][13] = x6 - gx0
-        output[gx0][gy0][14] = y6 - gy0
-        output[gx0][gy0][15] = x7 - gx0
-        output[gx0][gy0][16] = y7 - gy0
-        output[gx0][gy0][17] = x8 - gx0
-        output[gx0][gy0][18] = y8 - gy0
-        output[gx0][gy0][19] = cls
-
-        return output
-
-    def scale_image_channel(self, im, c, v):
-        cs = list(im.split())
-        cs[c] = cs[c].point(lambda i: i * v)
-        out = Image.merge(im.mode, tuple(cs))
-        return out
+        return images, gt_label
+
+    def next_batches_test(self):
+        """
+        Next batch of the valid list, resized without augmentation.
+        The labels of the batch are kept for get_truths()
+        """
+        self.load_test_list()
+        images = np.zeros((self.batch_size, self.image_size, self.image_size, 3), np.float32)
+        truths = np.zeros((self.batch_size, 21), np.float32)
+        start  = self.test_batch * self.batch_size
+        for idx in range(self.batch_size):
+            imgpath = self.test_imgname[(start + idx) % len(self.test_imgname)]
+            images[idx], truths[idx] = self.load_test_sample(imgpath)
+
+        self.truths = truths
+        self.test_indices = (start + np.arange(self.batch_size)) % len(self.test_imgname)
+        self.test_batch += 1
+        return images, truths
+
+    def load_test_list(self):
+        """
+        Return the image paths of the valid list
+        """
+        if self.test_imgname is None:
+            with open(self.testlist, 'r') as f:
+                self.test_imgname = [x.strip() for x in f.readlines() if x.strip()]
+        return self.test_imgname
+
+    def num_test_batches(self):
+        return (len(self.load_test_list()) + self.batch_size - 1) // self.batch_size
+
+    def get_test_batch(self, batch_idx):
+        """
+        The batch_idx-th batch of the valid list, without wrapping around:
+        the last one holds the remaining frames. Can be built by prefetching
+        worker processes like get_batch
+        Return images [n, size, size, 3], truths [n, 21] and the indices of
+        the frames in the valid list [n]
+        """
+        frames  = self.load_test_list()
+        indices = np.arange(batch_idx * self.batch_size, min((batch_idx + 1) * self.batch_size, len(frames)))
+        images  = np.zeros((len(indices), self.image_size, self.image_size, 3), np.float32)
+        truths  = np.zeros((len(indices), 21), np.float32)
+        for idx, frame in enumerate(indices):
+            images[idx], truths[idx] = self.load_test_sample(frames[frame])
+        return images, truths, indices
+
+    def load_test_truths(self):
+        """
+        Return the first label of every frame of the valid list [F, 21], without reading the images
+        """
+        frames = self.load_test_list()
+        truths = np.zeros((len(frames), 21), np.float32)
+        for idx, imgpath in enumerate(frames):
+            shards = self.shard_reader(imgpath)
+            labels = shards.read(imgpath)[2] if shards is not None else read_truths(get_label_path(imgpath))
+            if len(labels):
+                truths[idx] = labels[0]
+        return truths
+
+    def gt_cache_dir(self):
+        """
+        Where the ground truth poses of the valid list are cached, next to the list
+        """
+        return os.path.splitext(self.testlist)[0] + '_gt'
+
+    def get_truths(self):
+        return self.truths
+
+    def load_test_sample(self, imgpath):
+        """
+        Return the image resized to the network input [size, size, 3] float32
+        and its first label [21]. Labels are normalized, resizing keeps them
+        """
+        shards = self.shard_reader(imgpath)
+        if shards is not None:
+            img, _, truths = shards.read(imgpath)
+        else:
+            img = np.asarray(Image.open(imgpath).convert('RGB'))
+            truths = read_truths(get_label_path(imgpath))
+        img = cv2.resize(img, (self.image_size, self.image_size)).astype(np.float32)
+        label = np.zeros(21, np.float32)
+        if len(truths):
+            label[:] = truths[0]
+        return img, label
+
+    def random_background(self):
+        """
+        Return a random VOC background, [h, w, 3] uint8
+        """
+        if self.bg_pool is not None:
+            return self.bg_pool.sample()
+        bgpath = self.bg_files[random.randint(0, len(self.bg_files) - 1)]
+        return np.asarray(Image.open(bgpath).convert('RGB'))
+
+    def refresh_backgrounds(self):
+        if self.bg_pool is not None:
+            self.bg_pool.refresh(cfg.BG_POOL_REFRESH)
 
     def distort_image(self, im, hue, sat, val):
-        im = im.convert('HSV')
-        cs = list(im.split())
-        cs[1] = cs[1].point(lambda i: i * sat)
-        cs[2] = cs[2].point(lambda i: i * val)
-
-        def change_hue(x):
-            x += hue*255
-            if x > 255:
-                x -= 255
-            if x < 0:
-                x += 255
-            return x
-        cs[0] = cs[0].point(change_hue)
-        im = Image.merge(im.mode, tuple(cs))
-
-        im = im.convert('RGB')
-        return im
+        """
+        im: RGB image, [h, w, 3], uint8 numpy array
+        """
+        return augment.distort_image(im, hue, sat, val)
 
     def rand_scale(self, s):
         scale = random.uniform(1, s)
@@ -189,9 +273,13 @@ class Linemod(object):
         res  = self.distort_image(im, dhue, dsat, dexp)
         return res
 
-    def data_augmentation(self, img, shape, jitter, hue, saturation, exposure):
-
-        ow, oh = img.size
+    def data_augmentation(self, img, mask, bg, shape, jitter, hue, saturation, exposure):
+        """
+        img, bg: [h, w, 3] uint8 numpy arrays, mask: [h, w] uint8 numpy array
+        Jitter crop, resize (and flip) image and mask with a single warp,
+        then composite the background and distort colors at output resolution
+        """
+        oh, ow = img.shape[:2]
 
         dw =int(ow*jitter)
         dh =int(oh*jitter)
@@ -204,126 +292,142 @@ class Linemod(object):
         swidth =  ow - pleft - pright
         sheight = oh - ptop - pbot
 
-        sx = float(swidth)  / ow
-        sy = float(sheight) / oh
+        # mirroring the image would also mirror the object, which breaks the
+        # corner order of the 3D bounding box, so it is off unless self.flip
+        flip = random.randint(1,10000)%2 if self.flip else 0
+        crop = (pleft, ptop, swidth, sheight)
 
-        flip = random.randint(1,10000)%2
-        cropped = img.crop( (pleft, ptop, pleft + swidth - 1, ptop + sheight - 1))
-
-        dx = (float(pleft)/ow)/sx
-        dy = (float(ptop) /oh)/sy
-
-        sized = cropped.resize(shape)
+        matrix = augment.crop_matrix(crop, shape, flip)
+        sized  = augment.warp_image(img, matrix, shape)
+        mask   = augment.warp_image(mask, matrix, shape, cv2.INTER_NEAREST)
+        sized  = self.change_background(sized, mask, bg)
 
         img = self.random_distort_image(sized, hue, saturation, exposure)
 
-        return img, flip, dx,dy,sx,sy
+        return img, crop, flip
 
-    def fill_truth_detection(self, labpath, w, h, flip, dx, dy, sx, sy):
-        max_boxes = 1
+    def fill_truth_detection(self, bs, crop, size, flip):
+        """
+        bs: [N, 21] labels normalized to the image of size (width, height)
+        crop, flip: parameters returned by data_augmentation
+        """
+        max_boxes = self.max_objects
         label = np.zeros((max_boxes,21))
-        if os.path.getsize(labpath):
-            bs = np.loadtxt(labpath)
-            if bs is None:
-                return label
-            bs = np.reshape(bs, (-1, 21))
-            cc = 0
-            for i in range(bs.shape[0]):
-                x0 = bs[i][1]
-                y0 = bs[i][2]
-                x1 = bs[i][3]
-                y1 = bs[i][4]
-                x2 = bs[i][5]
-                y2 = bs[i][6]
-                x3 = bs[i][7]
-                y3 = bs[i][8]
-                x4 = bs[i][9]
-                y4 = bs[i][10]
-                x5 = bs[i][11]
-                y5 = bs[i][12]
-                x6 = bs[i][13]
-                y6 = bs[i][14]
-                x7 = bs[i][15]
-                y7 = bs[i][16]
-                x8 = bs[i][17]
-                y8 = bs[i][18]
-
-                x0 = min(0.999, max(0, x0 * sx - dx))
-                y0 = min(0.999, max(0, y0 * sy - dy))
-                x1 = min(0.999, max(0, x1 * sx - dx))
-                y1 = min(0.999, max(0, y1 * sy - dy))
-                x2 = min(0.999, max(0, x2 * sx - dx))
-                y2 = min(0.999, max(0, y2 * sy - dy))
-                x3 = min(0.999, max(0, x3 * sx - dx))
-                y3 = min(0.999, max(0, y3 * sy - dy))
-                x4 = min(0.999, max(0, x4 * sx - dx))
-                y4 = min(0.999, max(0, y4 * sy - dy))
-                x5 = min(0.999, max(0, x5 * sx - dx))
-                y5 = min(0.999, max(0, y5 * sy - dy))
-                x6 = min(0.999, max(0, x6 * sx - dx))
-                y6 = min(0.999, max(0, y6 * sy - dy))
-                x7 = min(0.999, max(0, x7 * sx - dx))
-                y7 = min(0.999, max(0, y7 * sy - dy))
-                x8 = min(0.999, max(0, x8 * sx - dx))
-                y8 = min(0.999, max(0, y8 * sy - dy))
-
-                bs[i][1] = x0
-                bs[i][2] = y0
-                bs[i][3] = x1
-                bs[i][4] = y1
-                bs[i][5] = x2
-                bs[i][6] = y2
-                bs[i][7] = x3
-                bs[i][8] = y3
-                bs[i][9] = x4
-                bs[i][10] = y4
-                bs[i][11] = x5
-                bs[i][12] = y5
-                bs[i][13] = x6
-                bs[i][14] = y6
-                bs[i][15] = x7
-                bs[i][16] = y7
-                bs[i][17] = x8
-                bs[i][18] = y8
-
-                label[cc] = bs[i]
-                cc += 1
-                if cc >= 50:
-                    break
+        bs = augment.warp_labels(bs, crop, size, flip)
+        cc = min(bs.shape[0], max_boxes)
+        label[:cc] = bs[:cc]
 
         label = np.reshape(label, (-1))
         return label
 
     def change_background(self, img, mask, bg):
-        # oh = img.height
-        # ow = img.width
-        ow, oh = img.size
-        bg = bg.resize((ow, oh)).convert('RGB')
+        """
+        img, bg: [h, w, 3] uint8 numpy arrays, mask: [h, w] uint8 numpy array
+        bg is resized to the image size
+        """
+        oh, ow = img.shape[:2]
+        if bg.shape[:2] != (oh, ow):
+            bg = cv2.resize(bg, (ow, oh))
+        return augment.change_background(img, mask, bg)
+
+    def shard_reader(self, imgpath):
+        """
+        The ShardReader holding imgpath, None to read it from the image files
+        """
+        if self.shards is not None and imgpath in self.shards:
+            return self.shards
+        return None
 
-        imcs = list(img.split())
-        bgcs = list(bg.split())
-        maskcs = list(mask.split())
-        fics = list(Image.new(img.mode, img.size).split())
+    def read_sample(self, imgpath):
+        """
+        Return image [h, w, 3] uint8, mask [h, w] uint8 and labels [N, 21]
+        """
+        shards = self.shard_reader(imgpath)
+        if shards is not None:
+            return shards.read(imgpath)
+        img = np.asarray(Image.open(imgpath).convert('RGB'))
+        mask = np.asarray(Image.open(get_mask_path(imgpath)).convert('L'))
+        return img, mask, read_truths(get_label_path(imgpath))
+
+    def load_data_detection(self, imgpath, shape, jitter, hue, saturation, exposure, bg):
+        ## data augmentation
+        img, mask, truths = self.read_sample(imgpath)
 
-        for c in range(len(imcs)):
-            negmask = maskcs[c].point(lambda i: 1 - i / 255)
-            posmask = maskcs[c].point(lambda i: i / 255)
-            fics[c] = ImageMath.eval("a * c + b * d", a=imcs[c], b=bgcs[c], c=posmask, d=negmask).convert('L')
-        out = Image.merge(img.mode, tuple(fics))
+        oh, ow = img.shape[:2]
+        img,crop,flip = self.data_augmentation(img, mask, bg, shape, jitter, hue, saturation, exposure)
+        label = self.fill_truth_detection(truths, crop, (ow, oh), flip)
+        return img,label
 
-        return out
 
-    def load_data_detection(self, imgpath, shape, jitter, hue, saturation, exposure, bgpath):
-        labpath = imgpath.replace('images', 'labels').replace('JPEGImages', 'labels').replace('.jpg', '.txt').replace('.png','.txt')
-        maskpath = imgpath.replace('JPEGImages', 'mask').replace('/00', '/').replace('.jpg', '.png')
+class MultiLinemod(Linemod):
+    """
+    Merged sampler of several LINEMOD objects (one .data file each) for a
+    network shared by all of them: the frames of every object go into one
+    shuffled list and the class of each label is the index of its object.
+    Mesh, backup dir and thresholds of the first object are kept as the
+    single-object attributes, meshnames, vx_thresholds and symmetries hold
+    all of them
+    """
+
+    def __init__(self, phase, args, shards=None):
+        self.datacfgs      = list(args)
+        self.objects       = [read_data_cfg(datacfg) for datacfg in self.datacfgs]
+        self.categories    = [options['name'] for options in self.objects]
+        self.meshnames     = [options['mesh'] for options in self.objects]
+        self.vx_thresholds = [float(options['diam']) * 0.1 for options in self.objects]
+        self.symmetries    = [name in cfg.SYMMETRIC_OBJECTS for name in self.categories]
+        self.class_of      = {}
+        self.shard_readers = None
+        Linemod.__init__(self, phase, arg=self.datacfgs[0])
+        print("   {} objects: {}".format(len(self.categories), ', '.join(self.categories)))
+        if shards:
+            split = 'train' if self.phase == 'train' else 'valid'
+            self.shard_readers = [ShardReader(shard_dir(shards, name, split)) for name in self.categories]
+            print("   reading {} frames from {}".format(sum(len(r) for r in self.shard_readers), shards))
+
+    def merged_list(self, split):
+        """
+        Image paths of the split ('train' or 'valid') of every object,
+        remembering the class of each frame
+        """
+        imgname = []
+        for label, options in enumerate(self.objects):
+            with open(options[split], 'r') as f:
+                frames = [x.strip() for x in f.readlines() if x.strip()]
+            self.class_of.update((frame, label) for frame in frames)
+            imgname.extend(frames)
+        return imgname
 
-        ## data augmentation
-        img = Image.open(imgpath).convert('RGB')
-        mask = Image.open(maskpath).convert('RGB')
-        bg = Image.open(bgpath).convert('RGB')
-
-        img = self.change_background(img, mask, bg)
-        img,flip,dx,dy,sx,sy = self.data_augmentation(img, shape, jitter, hue, saturation, exposure)
-        ow, oh = img.size
-        label = self.fill_truth_detection(labpath, ow, oh, flip, dx, dy, 1./sx, 1./sy)
-        return img,label
+    def prepare(self, phase):
+        Linemod.prepare(self, phase)
+        if phase == 'train':
+            self.imgname = self.merged_list('train')
+            if self.shuffle:
+                random.shuffle(self.imgname)
+        elif phase == 'test':
+            self.imgname = self.merged_list('valid')
+
+    def load_test_list(self):
+        if self.test_imgname is None:
+            self.test_imgname = self.merged_list('valid')
+        return self.test_imgname
+
+    def gt_cache_dir(self):
+        return None  # the frames of the merged list belong to different meshes
+
+    def shard_reader(self, imgpath):
+        if self.shard_readers is None:
+            return None
+        shards = self.shard_readers[self.class_of[imgpath]]
+        return shards if imgpath in shards else None
+
+    def read_sample(self, imgpath):
+        img, mask, truths = Linemod.read_sample(self, imgpath)
+        truths = np.array(truths, np.float32).reshape(-1, 21)
+        truths[:, 0] = self.class_of[imgpath]
+        return img, mask, truths
+
+    def load_test_sample(self, imgpath):
+        img, label = Linemod.load_test_sample(self, imgpath)
+        label[0] = self.class_of[imgpath]
+        return img, label
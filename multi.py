@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------
+# poses of all the LINEMOD objects from one forward pass of a multi-object network
+# ---------------------
+
+from __future__ import print_function
+
+import argparse
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import yolo.config as cfg
+from linemod import MultiLinemod, datacfg_list
+from utils.decode import decode_batch
+from utils.evaluation import PoseEvaluator, mesh_vertices
+from utils.timer import Timer
+from utils.utils import *
+from yolo.yolo_6d_net import YOLO6D_net
+
+
+class MultiPoseEstimator(object):
+    """
+    One box per class is decoded from the shared output map (the cell with the
+    highest confidence * p(class)), then solved by PnP against the class mesh
+    """
+
+    def __init__(self, meshnames, internal_calibration=None,
+                 im_width=cfg.IMAGE_WIDTH, im_height=cfg.IMAGE_HEIGHT):
+        self.num_classes = len(meshnames)
+        self.K           = np.array(get_camera_intrinsic() if internal_calibration is None else internal_calibration, dtype='float32')
+        self.im_width    = im_width
+        self.im_height   = im_height
+        self.points3D    = []
+        for meshname in meshnames:
+            corners3D = get_3D_corners(mesh_vertices(meshname))
+            self.points3D.append(np.array(np.transpose(np.concatenate((np.zeros((3, 1)), corners3D[:3, :]), axis=1)), dtype='float32'))
+
+    def boxes(self, logit):
+        """
+        logit: network output of one frame [cell, cell, 19 + nC], nC >= num_classes
+        Return boxes [num_classes, 18] (normalized coords) and scores [num_classes]
+        """
+        boxes, scores = get_predict_boxes_per_class(logit, logit.shape[2] - 19)
+        return boxes[:self.num_classes], scores[:self.num_classes]
+
+    def poses(self, boxes, scores):
+        """
+        boxes, scores: returned by boxes()
+        Return [(score, R [3, 3], t [3, 1])] for every class
+        """
+        corners2D = np.reshape(boxes, [self.num_classes, 9, 2]) * np.array([self.im_width, self.im_height], np.float32)
+        return [(scores[c],) + tuple(pnp(self.points3D[c], corners2D[c], self.K)) for c in range(self.num_classes)]
+
+    def detections(self, logits):
+        """
+        Every instance found in a batch of frames (several per class in
+        cluttered scenes), see get_detections
+        logits: network output [batch, cell, cell, 19 + nC]
+        Return a list of [K, 20] arrays per frame, best first
+        """
+        detections = get_detections(logits, logits.shape[3] - 19)
+        return [d[d[:, 19] < self.num_classes] for d in detections]
+
+    def instance_poses(self, detections):
+        """
+        detections: [K, 20] of one frame, returned by detections()
+        Return [(class, score, R [3, 3], t [3, 1])], best first
+        """
+        corners2D = np.reshape(detections[:, :18], [-1, 9, 2]) * np.array([self.im_width, self.im_height], np.float32)
+        poses = []
+        for det, corners in zip(detections, corners2D):
+            label = int(det[19])
+            poses.append((label, det[18]) + tuple(pnp(self.points3D[label], corners, self.K)))
+        return poses
+
+
+def time_single_networks(netcfg, images, estimator):
+    """
+    The single-object baseline, measured: every image goes through one
+    single-object network (netcfg) per class, each output decoded and solved
+    on its own. The weights are random, only the time is used
+    Return ms per frame
+    """
+    timer = Timer()
+    with tf.Graph().as_default():
+        net = YOLO6D_net(is_training=False, cfgfile=netcfg, top_k=0)
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            sess.run(net.logit, feed_dict={net.input_images: images[:1]})  # warm up
+            for image in images:
+                timer.tic()
+                for c in range(estimator.num_classes):
+                    logit = sess.run(net.logit, feed_dict={net.input_images: image[np.newaxis]}) * cfg.OUTPUT_SCALE
+                    corners, _, _ = decode_batch(logit, refine=cfg.DECODE_REFINE)
+                    pnp(estimator.points3D[c], corners[0], estimator.K)
+                timer.toc()
+    return timer.average_time * 1000
+
+def evaluate(weights_file, datacfg, num_frames, shards='', single_netcfg='', timing_frames=50, instances=False):
+    """
+    Every frame of the merged valid lists goes once through the network, the
+    poses of all the classes are estimated and the one of the annotated
+    object is scored. The single-object baseline (one network of
+    single_netcfg per object, '': not measured) is timed on the first
+    timing_frames frames.
+    instances: decode every instance with keypoint NMS (get_detections) and
+               solve all their poses instead of the best cell per class, the
+               best instance of the annotated class is scored (the best cell
+               of the class when none was found)
+    Return (categories, [PoseEvaluator.summary()], forward ms, decode + PnP ms,
+            single-object networks ms per frame or None,
+            (instances per frame, frames where the annotated object was not found) or None)
+    """
+    cfg.DISP = False
+    data = MultiLinemod('test', datacfg_list(datacfg), shards=shards)
+    frames = []
+    for label in range(len(data.categories)):
+        object_frames = [f for f in data.imgname if data.class_of[f] == label]
+        frames.extend(object_frames[:num_frames] if num_frames > 0 else object_frames)
+
+    estimator  = MultiPoseEstimator(data.meshnames)
+    evaluators = [PoseEvaluator(mesh_vertices(m), vx, symmetric=sym)
+                  for m, vx, sym in zip(data.meshnames, data.vx_thresholds, data.symmetries)]
+
+    net = YOLO6D_net(is_training=False)
+    assert net.logit.get_shape()[3].value >= 19 + len(data.categories), \
+        'the network cfg needs at least 19 + {} output channels'.format(len(data.categories))
+    forward_timer = Timer()
+    post_timer    = Timer()
+    num_instances = missed = 0
+    with tf.Session() as sess:
+        tf.train.Saver(net.variables).restore(sess, weights_file)
+        run = lambda image: sess.run(net.logit, feed_dict={net.input_images: image})
+        run(data.load_test_sample(frames[0])[0][np.newaxis])
+        for imgpath in frames:
+            image, truth = data.load_test_sample(imgpath)
+            forward_timer.tic()
+            logit = run(image[np.newaxis])[0] * cfg.OUTPUT_SCALE  # same decoding as Solver.test
+            forward_timer.toc()
+            label = int(truth[0])
+            post_timer.tic()
+            if instances:
+                detections = estimator.detections(logit[np.newaxis])[0]
+                estimator.instance_poses(detections)
+                post_timer.toc()
+                found = detections[detections[:, 19] == label]
+                num_instances += len(detections)
+                if len(found):
+                    evaluators[label].add_box(found[0, :18], truth)
+                    continue
+                missed += 1
+                boxes, _ = estimator.boxes(logit)
+            else:
+                boxes, scores = estimator.boxes(logit)
+                estimator.poses(boxes, scores)
+                post_timer.toc()
+            evaluators[label].add_box(boxes[label], truth)
+
+    single_ms = None
+    if single_netcfg:
+        images = np.stack([data.load_test_sample(f)[0] for f in frames[:timing_frames]])
+        single_ms = time_single_networks(single_netcfg, images, estimator)
+
+    return (data.categories, [e.summary() for e in evaluators],
+            forward_timer.average_time * 1000, post_timer.average_time * 1000, single_ms,
+            (num_instances / float(len(frames)), missed) if instances else None)
+
+def print_results(categories, stats, forward_ms, post_ms, single_ms=None, instances=None):
+    print('\n   {:>12}{:>10}{:>10}{:>10}{:>14}'.format('object', '2D 5px', 'ADD', '5cm5deg', 'corner err'))
+    for name, s in zip(categories, stats):
+        print('   {:>12}{:>9.2f}%{:>9.2f}%{:>9.2f}%{:>14.2f}'.format(
+            name, s['acc'], s['acc3d'], s['acc5cm5deg'], s['mean_corner_err']))
+
+    n = len(categories)
+    multi_ms  = forward_ms + post_ms
+    if instances is not None:
+        print('\n   {:.2f} instances per frame, annotated object not found in {} frames'.format(*instances))
+    print('\n   all {} objects per frame: forward {:.2f} ms, decode + PnP {:.2f} ms'.format(n, forward_ms, post_ms))
+    print('   {:<34}{:>10.2f} frames/s'.format('shared multi-object network', 1000.0 / multi_ms))
+    if single_ms is not None:
+        print('   {:<34}{:>10.2f} frames/s (measured)'.format('{} single-object networks'.format(n), 1000.0 / single_ms))
+        print('   speedup {:.1f}x'.format(single_ms / multi_ms))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datacfg', default='all', type=str, help='comma separated .data files or all')
+    parser.add_argument('--weights', default='yolo_6d_multi.ckpt', type=str)
+    parser.add_argument('--data_dir', default='data', type=str)
+    parser.add_argument('--weight_dir', default='weights', type=str)
+    parser.add_argument('--frames', default=0, type=int, help='valid frames per object, 0: all')
+    parser.add_argument('--shards', default='', type=str)
+    parser.add_argument('--netcfg', default=os.path.join('cfg', 'yolo-pose-multi.cfg'), type=str, help='Darknet cfg of the network')
+    parser.add_argument('--image_size', default=cfg.IMAGE_SIZE, type=int, help='network input, a multiple of 32')
+    parser.add_argument('--single_netcfg', default=os.path.join('cfg', 'yolo-pose.cfg'), type=str,
+                        help='Darknet cfg of the single-object baseline, timed with one network per object, empty: skipped')
+    parser.add_argument('--timing_frames', default=50, type=int, help='frames the single-object baseline is timed on')
+    parser.add_argument('--instances', action='store_true',
+                        help='decode every instance with keypoint NMS instead of the best cell per object')
+    args = parser.parse_args()
+
+    weight_file = os.path.join(args.data_dir, args.weight_dir, args.weights)
+    cfg.set_image_size(args.image_size)
+    cfg.NET_CFG = args.netcfg
+    print_results(*evaluate(weight_file, args.datacfg, args.frames, args.shards, args.single_netcfg, args.timing_frames,
+                            args.instances))
+
+if __name__ == "__main__":
+
+    main()
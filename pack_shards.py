@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------
+# pack a LINEMOD split into pre-decoded uint8 shards
+# ---------------------
+
+from __future__ import print_function
+
+import argparse
+import os
+
+import numpy as np
+from PIL import Image
+
+from linemod import get_label_path, get_mask_path
+from utils.shards import ShardWriter, shard_dir
+from utils.timer import Timer
+from utils.utils import read_data_cfg, read_truths
+
+
+def pack(datacfg, split, root, frames_per_shard):
+    data_options = read_data_cfg(datacfg)
+    with open(data_options[split], 'r') as f:
+        imgnames = [x.strip() for x in f.readlines() if x.strip()]
+    directory = shard_dir(root, data_options['name'], split)
+
+    first = np.asarray(Image.open(imgnames[0]).convert('RGB'))
+    writer = ShardWriter(directory, len(imgnames), first.shape, frames_per_shard)
+    timer = Timer()
+    for i, imgpath in enumerate(imgnames):
+        timer.tic()
+        img  = np.asarray(Image.open(imgpath).convert('RGB'))
+        mask = np.asarray(Image.open(get_mask_path(imgpath)).convert('L'))
+        writer.add(imgpath, img, mask, read_truths(get_label_path(imgpath)))
+        timer.toc()
+        if (i + 1) % 100 == 0:
+            print('   {}/{} frames, {:.1f} ms/frame'.format(i + 1, len(imgnames), timer.average_time * 1000))
+    writer.close()
+    print('   packed {} frames into {}'.format(len(imgnames), directory))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datacfg', default='cfg/ape.data', type=str)
+    parser.add_argument('--split', default='train', type=str, choices=['train', 'valid'])
+    parser.add_argument('--out', default=os.path.join('data', 'shards'), type=str)
+    parser.add_argument('--frames_per_shard', default=1024, type=int)
+    args = parser.parse_args()
+
+    pack(args.datacfg, args.split, args.out, args.frames_per_shard)
+
+if __name__ == "__main__":
+
+    main()
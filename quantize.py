@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------
+# post-training int8 quantization (TFLite) calibrated on LINEMOD frames
+# ---------------------
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+import yolo.config as cfg
+from export import load_inference_model
+from linemod import Linemod
+from utils.evaluation import PoseEvaluator, evaluate_frames, mesh_vertices
+
+
+def split_frames(data, num_calib, num_eval, seed=0):
+    """
+    Shuffle the valid list once and return disjoint (calibration, evaluation) frames
+    """
+    frames = list(data.imgname)
+    random.Random(seed).shuffle(frames)
+    calib = frames[:num_calib]
+    rest  = frames[num_calib:]
+    return calib, rest[:num_eval] if num_eval > 0 else rest
+
+def convert(sess, net, data, calib_frames):
+    """
+    Full integer conversion: every op runs in int8, the float input and output
+    are (de)quantized at the graph boundary with the calibrated ranges
+    """
+    def representative_dataset():
+        for imgpath in calib_frames:
+            image, _ = data.load_test_sample(imgpath)
+            yield [image[np.newaxis]]
+
+    converter = tf.lite.TFLiteConverter.from_session(sess, [net.input_images], [net.logit])
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+def quantize(weights_file, datacfg, output_file, num_calib, num_eval, threads, shards=''):
+    if not hasattr(tf, 'lite') or not hasattr(tf.lite, 'Optimize'):
+        print('   int8 conversion needs tf.lite with post-training quantization (TensorFlow >= 1.14)')
+        return False
+    cfg.DISP = False
+
+    data = Linemod('test', arg=datacfg, shards=shards)
+    calib_frames, eval_frames = split_frames(data, num_calib, num_eval)
+    print('   {} calibration frames, {} evaluation frames'.format(len(calib_frames), len(eval_frames)))
+
+    sess, net = load_inference_model(weights_file)
+    tflite_model = convert(sess, net, data, calib_frames)
+    output_dir = os.path.dirname(output_file)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    with open(output_file, 'wb') as f:
+        f.write(tflite_model)
+    print('   int8 model ({:.1f} MB) written to {}'.format(len(tflite_model) / 1e6, output_file))
+
+    interpreter = tf.lite.Interpreter(model_path=output_file, num_threads=threads) if threads > 0 \
+        else tf.lite.Interpreter(model_path=output_file)
+    interpreter.allocate_tensors()
+    input_index  = interpreter.get_input_details()[0]['index']
+    output_index = interpreter.get_output_details()[0]['index']
+
+    def run_float(image):
+        return sess.run(net.logit, feed_dict={net.input_images: image})
+
+    def run_int8(image):
+        interpreter.set_tensor(input_index, image)
+        interpreter.invoke()
+        return interpreter.get_tensor(output_index)
+
+    vertices = mesh_vertices(data.meshname)
+    float_eval = PoseEvaluator(vertices, data.vx_threshold, symmetric=data.symmetric)
+    int8_eval  = PoseEvaluator(vertices, data.vx_threshold, symmetric=data.symmetric)
+    float_ms = evaluate_frames(data, eval_frames, run_float, float_eval)
+    int8_ms  = evaluate_frames(data, eval_frames, run_int8, int8_eval)
+    sess.close()
+
+    float_stats = float_eval.summary()
+    int8_stats  = int8_eval.summary()
+    print('\n   {:<28}{:>10}{:>10}{:>10}'.format('', 'float32', 'int8', 'delta'))
+    rows = [('latency (ms/frame)', float_ms, int8_ms),
+            ('2D projection acc (%)', float_stats['acc'], int8_stats['acc']),
+            ('ADD acc (%)', float_stats['acc3d'], int8_stats['acc3d']),
+            ('5cm 5deg acc (%)', float_stats['acc5cm5deg'], int8_stats['acc5cm5deg']),
+            ('mean corner error (px)', float_stats['mean_corner_err'], int8_stats['mean_corner_err'])]
+    for name, before, after in rows:
+        print('   {:<28}{:>10.2f}{:>10.2f}{:>+10.2f}'.format(name, before, after, after - before))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datacfg', default='cfg/ape.data', type=str)
+    parser.add_argument('--weights', default='yolo_6d.ckpt', type=str)
+    parser.add_argument('--data_dir', default='data', type=str)
+    parser.add_argument('--weight_dir', default='weights', type=str)
+    parser.add_argument('--output', default=os.path.join('data', 'export', 'yolo_6d_int8.tflite'), type=str)
+    parser.add_argument('--calib', default=300, type=int, help='calibration frames from the valid list')
+    parser.add_argument('--eval', default=0, type=int, help='evaluation frames, 0: the rest of the valid list')
+    parser.add_argument('--threads', default=0, type=int, help='TFLite interpreter threads, 0: default')
+    parser.add_argument('--shards', default='', type=str)
+    parser.add_argument('--netcfg', default=cfg.NET_CFG, type=str, help='Darknet cfg of the network')
+    parser.add_argument('--image_size', default=cfg.IMAGE_SIZE, type=int, help='network input, a multiple of 32')
+    args = parser.parse_args()
+
+    weight_file = os.path.join(args.data_dir, args.weight_dir, args.weights)
+    cfg.set_image_size(args.image_size)
+    cfg.NET_CFG = args.netcfg
+    if not quantize(weight_file, args.datacfg, args.output, args.calib, args.eval, args.threads, args.shards):
+        sys.exit(1)
+
+if __name__ == "__main__":
+
+    main()
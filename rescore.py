@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------
+# recompute the pose metrics from stored predictions (valid.py --store_dir), without TensorFlow
+# ---------------------
+
+from __future__ import print_function
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+import yolo.config as cfg
+from utils.evaluation import PoseEvaluator, mesh_vertices, save_curves
+from utils.gt_cache import GroundTruthCache
+from utils.prediction_store import load_store
+
+
+def rescore(store_file, px_threshold=0, vx_threshold=0, symmetric=None, batch_size=256):
+    """
+    Score the stored poses again, with the thresholds of the run unless given
+    Return the filled PoseEvaluator
+    """
+    meta, columns = load_store(store_file)
+    evaluator = PoseEvaluator(mesh_vertices(meta['meshname']), vx_threshold or meta['vx_threshold'],
+                              np.array(meta['internal_calibration']), px_threshold or meta['px_threshold'],
+                              meta['im_width'], meta['im_height'],
+                              meta['symmetric'] if symmetric is None else symmetric)
+
+    indices = columns['indices']
+    if cfg.GT_CACHE and meta.get('gt_cache'):
+        # the labels of the whole split, as scored by valid.py
+        truths = np.zeros((indices.max() + 1, 21), np.float32)
+        truths[indices] = columns['truths']
+        evaluator.use_cache(GroundTruthCache(meta['gt_cache'], evaluator, truths))
+
+    for i in range(0, len(indices), batch_size):
+        batch = slice(i, i + batch_size)
+        evaluator.add_batch(columns['corners'][batch], columns['truths'][batch], indices[batch],
+                            poses=(columns['R'][batch], columns['t'][batch]))
+    return evaluator
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('stores', nargs='+', type=str, help='.npz files written by valid.py')
+    parser.add_argument('--px', default=0, type=float, help='2D projection threshold (pixels), 0: the one of the run')
+    parser.add_argument('--vx', default=0, type=float, help='ADD threshold (meters), 0: the one of the run')
+    parser.add_argument('--add_points', default=cfg.ADD_POINTS, type=int, help='farthest point samples of the mesh for ADD, 0: all')
+    parser.add_argument('--symmetric', default='', type=str, choices=['', 'yes', 'no'], help='ADD-S instead of ADD, empty: as in the run')
+    parser.add_argument('--curves', default='', type=str, help='directory of the accuracy vs threshold curves, one text file per store')
+    args = parser.parse_args()
+
+    cfg.ADD_POINTS = args.add_points
+    symmetric = None if not args.symmetric else args.symmetric == 'yes'
+    for store_file in args.stores:
+        print('\n----------{}--'.format(store_file))
+        start = time.time()
+        evaluator = rescore(store_file, args.px, args.vx, symmetric)
+        ms = (time.time() - start) * 1000
+        evaluator.report()
+        print('   {} frames rescored in {:.1f} ms'.format(len(evaluator), ms))
+        if args.curves:
+            if not os.path.exists(args.curves):
+                os.makedirs(args.curves)
+            save_curves(evaluator, os.path.join(args.curves, os.path.splitext(os.path.basename(store_file))[0] + '.txt'))
+
+if __name__ == "__main__":
+
+    main()
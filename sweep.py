@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------
+# latency and accuracy of one checkpoint at several input resolutions
+# ---------------------
+
+from __future__ import print_function
+
+import argparse
+import os
+
+import tensorflow as tf
+
+import yolo.config as cfg
+from linemod import Linemod
+from utils.evaluation import PoseEvaluator, evaluate_frames, mesh_vertices
+from yolo.yolo_6d_net import YOLO6D_net
+
+
+def sweep(weights_file, datacfg, sizes, num_frames, shards=''):
+    """
+    The network is fully convolutional, the same checkpoint runs at every
+    multiple of 32, only the output grid changes (size / 32)
+    Return [(size, cell, ms per frame, PoseEvaluator.summary())]
+    """
+    cfg.DISP = False
+    data = Linemod('test', arg=datacfg, shards=shards)
+    frames = data.imgname[:num_frames] if num_frames > 0 else data.imgname
+    evaluator = PoseEvaluator(mesh_vertices(data.meshname), data.vx_threshold, symmetric=data.symmetric)
+
+    results = []
+    for size in sizes:
+        cfg.set_image_size(size)
+        data.image_size = size
+        tf.reset_default_graph()
+        net = YOLO6D_net(is_training=False)
+        with tf.Session() as sess:
+            tf.train.Saver(net.variables).restore(sess, weights_file)
+            run = lambda image: sess.run(net.logit, feed_dict={net.input_images: image})
+            ms = evaluate_frames(data, frames, run, evaluator)
+        results.append((size, cfg.CELL_SIZE, ms, evaluator.summary()))
+        print('   {}x{} done'.format(size, size))
+    return results
+
+def print_results(results):
+    print('\n   {:>6}{:>6}{:>12}{:>10}{:>10}{:>10}{:>14}'.format(
+        'size', 'grid', 'ms/frame', '2D 5px', 'ADD', '5cm5deg', 'corner err'))
+    for size, cell, ms, stats in results:
+        print('   {:>6}{:>6}{:>12.2f}{:>9.2f}%{:>9.2f}%{:>9.2f}%{:>14.2f}'.format(
+            size, cell, ms, stats['acc'], stats['acc3d'], stats['acc5cm5deg'], stats['mean_corner_err']))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datacfg', default='cfg/ape.data', type=str)
+    parser.add_argument('--weights', default='yolo_6d.ckpt', type=str)
+    parser.add_argument('--data_dir', default='data', type=str)
+    parser.add_argument('--weight_dir', default='weights', type=str)
+    parser.add_argument('--sizes', default='320,416,512,608', type=str)
+    parser.add_argument('--frames', default=0, type=int, help='valid frames to evaluate, 0: all')
+    parser.add_argument('--shards', default='', type=str)
+    parser.add_argument('--netcfg', default=cfg.NET_CFG, type=str, help='Darknet cfg of the network')
+    args = parser.parse_args()
+
+    weight_file = os.path.join(args.data_dir, args.weight_dir, args.weights)
+    cfg.NET_CFG = args.netcfg
+    sizes = [int(s) for s in args.sizes.split(',')]
+    results = sweep(weight_file, args.datacfg, sizes, args.frames, args.shards)
+    print_results(results)
+
+if __name__ == "__main__":
+
+    main()
@@ -17,8 +17,11 @@ import numpy as np
 import tensorflow as tf
 
 import yolo.config as cfg
-from linemod import Linemod
+from linemod import datacfg_list, load_dataset
 from utils.MeshPly import MeshPly
+from utils.decode import decode_batch
+from utils.evaluation import PoseEvaluator, attach_gt_cache
+from utils.loader import PrefetchLoader
 from utils.timer import Timer
 from utils.utils import *
 from yolo.yolo_6d_net import YOLO6D_net
@@ -32,11 +35,14 @@ class Solver(object):
         self.meshname = data.meshname
         self.backupdir = data.backupdir
         self.vx_threshold = data.vx_threshold
+        self.symmetric = data.symmetric
 
         self.mesh = MeshPly(self.meshname)
         self.vertices = np.c_[np.array(self.mesh.vertices), np.ones((len(self.mesh.vertices), 1))].T
         self.corners3D = get_3D_corners(self.vertices)
         self.internal_calibration = get_camera_intrinsic()
+        self.evaluator = PoseEvaluator(self.vertices, self.vx_threshold, self.internal_calibration, symmetric=self.symmetric)
+        self.gt_cache_attached = False  # on the first test(), training alone never needs it
         self.best_acc = -1
         self.testing_errors_trans = []
         self.testing_errors_angle = []
@@ -49,6 +55,13 @@ class Solver(object):
             self.batch_size = cfg.BATCH_SIZE
         else:
             self.batch_size = arg.batch
+        # the network batch dimension is dynamic, only the data side needs to know it
+        self.data.batch_size = self.batch_size
+        # start loader processes before any TensorFlow session exists
+        if arg.workers > 0:
+            self.loader = PrefetchLoader(data, arg.workers)
+        else:
+            self.loader = data
         self.epoch = cfg.EPOCH
         self.weight_file = os.path.join(cfg.WEIGHTS_DIR, arg.weights)
         self.cache_file  = cfg.CACHE_FILE
@@ -61,10 +74,11 @@ class Solver(object):
         self.save_iter = cfg.SAVE_ITER
         self.output_dir = cfg.OUTPUT_DIR
 
+        # the loss has no variables, the last 2 network variables are the 30_conv head
         if arg.pre:
-            self.variable_to_restore = tf.global_variables()[:-2]
+            self.variable_to_restore = self.net.variables
         else:
-            self.variable_to_restore = tf.global_variables()[:-10]
+            self.variable_to_restore = self.net.variables[:-2]
 
         self.variable_to_save = tf.global_variables()
         self.restorer = tf.train.Saver(self.variable_to_restore, max_to_keep=3)
@@ -103,10 +117,16 @@ class Solver(object):
         # for i in range(len(trainable)-8):
             # self.sess.run(trainable[i].initializer)
 
+        self.restore()
+        self.writer.add_graph(self.sess.graph)
+
+    def restore(self):
         if self.weight_file is not None:
             print('\n----------Restoring weights from: {}------batch: {}--'.format(self.weight_file, self.batch_size))
             self.restorer.restore(self.sess, self.weight_file)
-        self.writer.add_graph(self.sess.graph)
+
+    def get_feed_dict(self, images, gt_label):
+        return {self.net.input_images: images, self.net.target: gt_label}
 
 
     def train(self):
@@ -117,12 +137,13 @@ class Solver(object):
         epoch = 0
         best_loss = 1e8
         while epoch <= self.epoch:
-            for step in range(1, self.max_iter-1):
+            # every batch of the list once per epoch, the prefetching loader follows the same epochs
+            for step in range(1, self.max_iter + 1):
                 load_timer.tic()
-                images, gt_label, labels = self.data.next_batches()
+                images, gt_label = self.loader.next_batches()
                 load_timer.toc()
 
-                feed_dict = {self.net.input_images: images, self.net.target: gt_label, self.net.labels: labels}
+                feed_dict = self.get_feed_dict(images, gt_label)
 
                 if step % self.summary_iter == 0:
                     if step % (self.summary_iter * 4) == 0:
@@ -186,9 +207,11 @@ class Solver(object):
                                     global_step=self.global_step)
             epoch += 1
             self.data.batch = 0
+            self.data.refresh_backgrounds()
 
         print('\n   Save final checkpoint file to: {}'.format(self.weight_file))
         self.saver.save(self.sess, self.weight_file, global_step=self.global_step)
+        self.close_loader()
 
 
     def test(self):
@@ -196,133 +219,48 @@ class Solver(object):
         self.net.evaluation()
         test_timer = Timer()
         load_timer = Timer()
-        im_width = 640
-        im_height = 480
-        eps = 1e-5
 
         load_timer.tic()
         images, labels = self.data.next_batches_test()
         truths = self.data.get_truths() #2-D [Batch, params]
         load_timer.toc()
 
-        feed_dict = {self.net.input_images: images, self.net.labels: labels}
-        #predicts: [batch, cell, cell, coords + classes + confidence]
-        predicts = self.sess.run(self.net.logit, feed_dict=feed_dict)  # run
-        #confidence = predicts[:, :, :, -1]
-        testing_error_trans = 0.0
-        testing_error_angle = 0.0
-        testing_error_pixel = 0.0
-        testing_samples = 0.0
-        errs_2d = []
-        errs_3d = []
-        errs_trans = []
-        errs_angle = []
-        errs_corner2D = []
-
-        #all_boxes = []
-        #Iterate throught test examples
-        for batch_idx in range(cfg.BATCH_SIZE):
+        if not self.gt_cache_attached:
+            attach_gt_cache(self.evaluator, self.data)
+            self.gt_cache_attached = True
+
+        feed_dict = {self.net.input_images: images}
+        self.evaluator.reset()
+        if self.net.detections is not None and not cfg.DECODE_REFINE:
+            # decoded in the graph, only [batch, k, 20] leaves the session
+            detections = self.sess.run(self.net.detections, feed_dict=feed_dict)
             test_timer.tic()
-            #conf_sco = confidence_score[batch_idx]
-            logit = predicts[batch_idx] # 3-D
-            logit = logit * 10.0
-            truth = truths[batch_idx]
-            #num_gts = truth[0]
-
-            # prune tensors with low confidence (< 0.1)
-            #logit = confidence_thresh(conf_sco, pred)
-
-            # get the maximum of 3x3 neighborhood
-            #logit_nms = nms33(logit, conf_sco)
-            #logit = nms(logit, conf_sco)
-
-            # compute weighted average of 3x3 neighborhood
-            #logit = compute_average(predicts[batch_idx], conf_sco, logit_nms)
-
-            # get all the boxes coordinates
-            # 1st: ground true boxes
-            box_gt = [truth[1], truth[2], truth[3], truth[4], truth[5],
-                      truth[6], truth[7], truth[8], truth[9], truth[10],
-                      truth[11], truth[12], truth[13], truth[14], truth[15],
-                      truth[16], truth[17], truth[18], 1.0, 1.0, truth[0]]
-
-            # 2nd: predict boxes
-            box_pr = get_predict_boxes(logit, cfg.NUM_CLASSES)
-
-            #denomalize the corner prediction
-            corners2D_gt = np.array(np.reshape(box_gt[:18], [9, 2]), dtype='float32')
-            corners2D_pr = np.array(np.reshape(box_pr[:18], [9, 2]), dtype='float32')
-            corners2D_gt[:, 0] = corners2D_gt[:, 0] * im_width
-            corners2D_gt[:, 1] = corners2D_gt[:, 1] * im_height
-            corners2D_pr[:, 0] = corners2D_pr[:, 0] * im_width
-            corners2D_pr[:, 1] = corners2D_pr[:, 1] * im_height
-
-            # Compute corner prediction error
-            corner_norm = np.linalg.norm(corners2D_gt - corners2D_pr, axis=1)
-            corner_dist = np.mean(corner_norm)
-            errs_corner2D.append(corner_dist)
-
-            # Compute [R|t] by pnp
-            R_gt, t_gt = pnp(np.array(np.transpose(np.concatenate((np.zeros((3, 1)), self.corners3D[:3, :]), axis=1)), dtype='float32'),
-                                corners2D_gt, np.array(self.internal_calibration, dtype='float32'))
-            R_pr, t_pr = pnp(np.array(np.transpose(np.concatenate((np.zeros((3, 1)), self.corners3D[:3, :]), axis=1)), dtype='float32'),
-                                corners2D_pr, np.array(self.internal_calibration, dtype='float32'))
-
-            # Compute errors
-
-            # Compute translation error
-            trans_dist   = np.sqrt(np.sum(np.square(t_gt - t_pr)))
-            errs_trans.append(trans_dist)
-
-            # Compute angle error
-            angle_dist   = calcAngularDistance(R_gt, R_pr)
-            errs_angle.append(angle_dist)
-
-            # Compute pixel error
-            Rt_gt        = np.concatenate((R_gt, t_gt), axis=1)
-            Rt_pr        = np.concatenate((R_pr, t_pr), axis=1)
-            proj_2d_gt   = compute_projection(self.vertices, Rt_gt, self.internal_calibration)
-            proj_2d_pred = compute_projection(self.vertices, Rt_pr, self.internal_calibration)
-            norm         = np.linalg.norm(proj_2d_gt - proj_2d_pred, axis=0)
-            pixel_dist   = np.mean(norm)
-            errs_2d.append(pixel_dist)
-
-            # Compute 3D distances
-            transform_3d_gt   = compute_transformation(self.vertices, Rt_gt)
-            transform_3d_pred = compute_transformation(self.vertices, Rt_pr)
-            norm3d            = np.linalg.norm(transform_3d_gt - transform_3d_pred, axis=0)
-            vertex_dist       = np.mean(norm3d)
-            errs_3d.append(vertex_dist)
-
-            # Sum errors
-            testing_error_trans  += trans_dist
-            testing_error_angle  += angle_dist
-            testing_error_pixel  += pixel_dist
-            testing_samples      += 1
-        test_timer.toc()
+            self.evaluator.add_batch(np.reshape(detections[:, 0, :18], [-1, 9, 2]), truths, self.data.test_indices)
+            test_timer.toc()
+        else:
+            #predicts: [batch, cell, cell, coords + confidence + classes]
+            predicts = self.sess.run(self.net.logit, feed_dict=feed_dict)  # run
+
+            # the whole batch is decoded and solved at once
+            test_timer.tic()
+            corners, _, _ = decode_batch(predicts * cfg.OUTPUT_SCALE, refine=cfg.DECODE_REFINE)
+            self.evaluator.add_batch(corners, truths, self.data.test_indices)
+            test_timer.toc()
         # Compute 2D projection, 6D pose and 5cm5degree scores
-        px_threshold = 5
-        acc = len(np.where(np.array(errs_2d) <= px_threshold)[0]) * 100. / (len(errs_2d)+eps)
-        acc3d = len(np.where(np.array(errs_3d) <= self.vx_threshold)[0]) * 100. / (len(errs_3d)+eps)
-        acc5cm5deg = len(np.where((np.array(errs_trans) <= 0.05) & (np.array(errs_angle) <= 5))[0]) * 100. / (len(errs_trans)+eps)
-        mean_corner_err_2d = np.mean(errs_corner2D)
-        nts = float(testing_samples)
-        # Print test statistics
-        print("   Mean corner error is %f" % (mean_corner_err_2d))
-        print('   Acc using {} px 2D Projection = {:.2f}%'.format(px_threshold, acc))
-        print('   Acc using {} vx 3D Transformation = {:.2f}%'.format(self.vx_threshold, acc3d))
-        print('   Acc using 5 cm 5 degree metric = {:.2f}%'.format(acc5cm5deg))
-        print('   Translation error: %f, angle error: %f' % (testing_error_trans/(nts+eps), testing_error_angle/(nts+eps)) )
+        stats = self.evaluator.report()
 
         # Register losses and errors for saving later on
-        self.testing_errors_trans.append(testing_error_trans/(nts+eps))
-        self.testing_errors_angle.append(testing_error_angle/(nts+eps))
-        self.testing_errors_pixel.append(testing_error_pixel/(nts+eps))
-        self.testing_accuracies.append(acc)
-        test_timer.average_time
-        load_timer.average_time
+        self.testing_errors_trans.append(stats['trans_err'])
+        self.testing_errors_angle.append(stats['angle_err'])
+        self.testing_errors_pixel.append(stats['pixel_err'])
+        self.testing_accuracies.append(stats['acc'])
+
+    def close_loader(self):
+        if self.loader is not self.data:
+            self.loader.close()
 
     def __del__(self):
+        self.close_loader()
         self.sess.close()
 
 
@@ -336,12 +274,18 @@ def update_config_paths(data_dir, weights_file):
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--datacfg', default='cfg/ape.data', type=str)
+    parser.add_argument('--datacfg', default='cfg/ape.data', type=str,
+                        help='.data file, a comma separated list of them or all (multi-object network)')
     parser.add_argument('--pre', default=False, type=bool)
     parser.add_argument('--gpu', default='2', type=str)
     parser.add_argument('--data_dir', default="data", type=str)
     parser.add_argument('--weights', default="yolo_6d.ckpt", type=str)
     parser.add_argument('--batch', default=0, type=int)
+    parser.add_argument('--workers', default=0, type=int)
+    parser.add_argument('--shards', default='', type=str)
+    parser.add_argument('--xla', action='store_true', help='compile the network with XLA')
+    parser.add_argument('--netcfg', default=cfg.NET_CFG, type=str, help='Darknet cfg of the network')
+    parser.add_argument('--image_size', default=cfg.IMAGE_SIZE, type=int, help='network input, a multiple of 32')
     args = parser.parse_args()
 
     if len(args.datacfg) == 0:
@@ -355,13 +299,25 @@ def main():
 
     if args.data_dir != cfg.DATA_DIR:
         update_config_paths(args.data_dir, args.weights)
+    num_objects = len(datacfg_list(args.datacfg))
+    if num_objects > 1 and args.netcfg == cfg.NET_CFG:
+        # the default cfg has a single class channel
+        args.netcfg = os.path.join(os.path.dirname(cfg.NET_CFG), 'yolo-pose-multi.cfg')
+        print('   {} objects: training {}'.format(num_objects, args.netcfg))
+    cfg.set_image_size(args.image_size)
+    cfg.NET_CFG = args.netcfg
+    cfg.XLA = args.xla
 
     gpu_device = '/gpu:' + args.gpu
     # os.environ['CUDA_VISABLE_DEVICES'] = args.gpu
 
     with tf.device(gpu_device):
         yolo = YOLO6D_net()
-        datasets = Linemod('train', arg=args.datacfg)
+        datasets = load_dataset('train', args.datacfg, shards=args.shards)
+        if num_objects > 1:
+            assert yolo.logit.get_shape()[3].value >= 19 + len(datasets.categories), \
+                '{} has {} output channels, {} objects need at least {}'.format(
+                    args.netcfg, yolo.logit.get_shape()[3].value, len(datasets.categories), 19 + len(datasets.categories))
         solver = Solver(yolo, datasets, arg=args)
 
         print("\n-----------------------------start training----------------------------")
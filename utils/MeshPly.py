@@ -1,52 +1,191 @@
 # -*- coding: utf-8 -*-
-# Class to read 
+# Class to read ASCII and binary PLY meshes into NumPy arrays, cached as .npz next to the mesh
+
+import os
+
+import numpy as np
+
+# PLY property types -> NumPy type codes
+PLY_TYPES = {'char': 'i1', 'uchar': 'u1', 'short': 'i2', 'ushort': 'u2', 'int': 'i4', 'uint': 'u4',
+             'float': 'f4', 'double': 'f8', 'int8': 'i1', 'uint8': 'u1', 'int16': 'i2', 'uint16': 'u2',
+             'int32': 'i4', 'uint32': 'u4', 'float32': 'f4', 'float64': 'f8'}
+BYTE_ORDER = {'ascii': '=', 'binary_little_endian': '<', 'binary_big_endian': '>'}
+CACHE_VERSION = 1
+
+
+def read_header(f):
+    """
+    f: PLY file opened in binary mode, left at the first byte of the data
+    Return the format and the elements [(name, count, [(property, type, list count type or None)])]
+    """
+    if f.readline().strip() != b'ply':
+        raise ValueError('{} is not a PLY file'.format(f.name))
+    fmt, elements = None, []
+    for line in iter(f.readline, b''):
+        words = line.decode('ascii').split()
+        if not words or words[0] in ('comment', 'obj_info'):
+            continue
+        if words[0] == 'format':
+            fmt = words[1]
+        elif words[0] == 'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == 'property':
+            if words[1] == 'list':
+                elements[-1][2].append((words[4], PLY_TYPES[words[3]], PLY_TYPES[words[2]]))
+            else:
+                elements[-1][2].append((words[2], PLY_TYPES[words[1]], None))
+        elif words[0] == 'end_header':
+            return fmt, elements
+    raise ValueError('{} has no end_header'.format(f.name))
+
+def read_ascii_element(f, count, properties):
+    """
+    count rows of an ASCII element as a float64 array [count, columns] when
+    every row has the same length (e.g. triangles only), else a list of rows
+    """
+    lines = [f.readline() for _ in range(count)]
+    values = np.fromstring(b' '.join(lines).decode('ascii'), dtype=np.float64, sep=' ')
+    if count and values.size % count == 0:
+        rows = values.reshape(count, -1)
+        if not any(lst for _, _, lst in properties) or np.all(rows[:, 0] == rows[0, 0]):
+            return rows
+    return [np.array(line.split(), np.float64) for line in lines]
+
+def read_binary_element(data, offset, count, properties, order):
+    """
+    count rows of a binary element starting at data[offset:]
+    Return (structured array, or list of rows for variable length lists, next offset)
+    """
+    lists = [p for p in properties if p[2] is not None]
+    if not lists:
+        dtype = np.dtype([(name, order + kind) for name, kind, _ in properties])
+        return np.frombuffer(data, dtype, count, offset), offset + dtype.itemsize * count
+    if len(properties) == 1 and count:
+        # a single list (faces): fixed size when the first length repeats everywhere
+        name, kind, length_kind = properties[0]
+        length = int(np.frombuffer(data, order + length_kind, 1, offset)[0])
+        dtype = np.dtype([('length', order + length_kind), (name, order + kind, (length,))])
+        if offset + dtype.itemsize * count <= len(data):
+            rows = np.frombuffer(data, dtype, count, offset)
+            if np.all(rows['length'] == length):
+                return rows, offset + dtype.itemsize * count
+    rows = []
+    for _ in range(count):
+        row = []
+        for name, kind, length_kind in properties:
+            if length_kind is None:
+                value = np.frombuffer(data, order + kind, 1, offset)
+            else:
+                length = int(np.frombuffer(data, order + length_kind, 1, offset)[0])
+                offset += np.dtype(length_kind).itemsize
+                value = np.frombuffer(data, order + kind, length, offset)
+            offset += value.nbytes
+            row.extend(value.tolist())
+        rows.append(row)
+    return rows, offset
+
+def columns(rows, properties, names):
+    """
+    Columns names [count, len(names)] of an element without list properties,
+    None when one is missing
+    """
+    position = [p[0] for p in properties]
+    if not all(name in position for name in names):
+        return None
+    if rows.dtype.names:  # binary
+        return np.stack([rows[name].astype(np.float64) for name in names], 1)
+    return rows[:, [position.index(name) for name in names]]
+
+def face_indices(rows, ascii):
+    """
+    The first 3 vertex indices of every face [F, 3]
+    """
+    if isinstance(rows, np.ndarray):
+        if rows.dtype.names:  # binary, fixed length
+            return rows[rows.dtype.names[1]][:, :3].astype(np.int64)
+        return rows[:, 1:4].astype(np.int64)
+    # ASCII rows start with their length, binary ones were read without it
+    start = 1 if ascii else 0
+    return np.array([row[start:start + 3] for row in rows], np.int64).reshape(-1, 3)
+
+def read_ply(filename):
+    """
+    Return {'vertices', 'normals', 'colors' (0..255), 'indices'}, empty [0, 3] when missing
+    """
+    arrays = {'vertices': np.zeros((0, 3)), 'normals': np.zeros((0, 3)),
+              'colors': np.zeros((0, 3)), 'indices': np.zeros((0, 3), np.int64)}
+    with open(filename, 'rb') as f:
+        fmt, elements = read_header(f)
+        if fmt not in BYTE_ORDER:
+            raise ValueError('{}: unknown PLY format {}'.format(filename, fmt))
+        ascii = fmt == 'ascii'
+        data = None if ascii else f.read()
+        offset = 0
+        for name, count, properties in elements:
+            if ascii:
+                rows = read_ascii_element(f, count, properties)
+            else:
+                rows, offset = read_binary_element(data, offset, count, properties, BYTE_ORDER[fmt])
+            if name == 'vertex':
+                for key, names in (('vertices', ('x', 'y', 'z')), ('normals', ('nx', 'ny', 'nz')),
+                                   ('colors', ('red', 'green', 'blue'))):
+                    values = columns(rows, properties, names)
+                    if values is not None:
+                        arrays[key] = values
+            elif name == 'face' and count:
+                arrays['indices'] = face_indices(rows, ascii)
+    return arrays
+
 
 class MeshPly:
+    """
+    vertices [N, 3], normals [N, 3], colors [N, 3] (0..1, color when the mesh
+    has none) and triangle indices [F, 3] of a PLY mesh (ASCII or binary).
+    The arrays are cached in <filename>.npz, rebuilt when the mesh changes
+    """
+
     def __init__(self, filename, color=[0., 0., 0.]):
+        arrays = self.load_cache(filename)
+        if arrays is None:
+            arrays = read_ply(filename)
+            self.save_cache(filename, arrays)
+
+        self.vertices = arrays['vertices']
+        self.normals  = arrays['normals'] if len(arrays['normals']) else np.zeros_like(self.vertices)
+        self.indices  = arrays['indices']
+        if len(arrays['colors']):
+            self.colors = arrays['colors'] / 255.
+        else:
+            self.colors = np.tile(np.array(color, np.float64) / 255., (len(self.vertices), 1))
+
+    @staticmethod
+    def source_key(filename):
+        stat = os.stat(filename)
+        return np.array([CACHE_VERSION, stat.st_size, stat.st_mtime], np.float64)
+
+    def load_cache(self, filename):
+        cache = filename + '.npz'
+        if not os.path.exists(cache):
+            return None
+        try:
+            with np.load(cache) as f:
+                if not np.array_equal(f['source'], self.source_key(filename)):
+                    return None
+                return dict((key, f[key]) for key in ('vertices', 'normals', 'colors', 'indices'))
+        except (IOError, OSError, KeyError, ValueError):
+            return None
 
-        f = open(filename, 'r')
-        self.vertices = []
-        self.colors = []
-        self.indices = []
-        self.normals = []
-
-        vertex_mode = False
-        face_mode = False
-
-        nb_vertices = 0
-        nb_faces = 0
-
-        idx = 0
-
-        with f as open_file_object:
-            for line in open_file_object:
-                elements = line.split()
-                if vertex_mode:
-                    self.vertices.append([float(i) for i in elements[:3]])
-                    self.normals.append([float(i) for i in elements[3:6]])
-
-                    if elements[6:9]:
-                        self.colors.append([float(i) / 255. for i in elements[6:9]])
-                    else:
-                        self.colors.append([float(i) / 255. for i in color])
-
-                    idx += 1
-                    if idx == nb_vertices:
-                        vertex_mode = False
-                        face_mode = True
-                        idx = 0
-                elif face_mode:
-                    self.indices.append([float(i) for i in elements[1:4]])
-                    idx += 1
-                    if idx == nb_faces:
-                        face_mode = False
-                elif elements[0] == 'element':
-                    if elements[1] == 'vertex':
-                        nb_vertices = int(elements[2])
-                    elif elements[1] == 'face':
-                        nb_faces = int(elements[2])
-                elif elements[0] == 'end_header':
-                    vertex_mode = True
+    def save_cache(self, filename, arrays):
+        """
+        Written to a private file and moved in place, a read-only mesh directory only skips the cache
+        """
+        tmp = '{}.{}.tmp.npz'.format(filename, os.getpid())
+        try:
+            np.savez(tmp, source=self.source_key(filename), **arrays)
+            os.replace(tmp, filename + '.npz')
+        except (IOError, OSError):
+            if os.path.exists(tmp):
+                os.remove(tmp)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# ---------------------
+# photometric augmentation on uint8 numpy images
+# ---------------------
+
+import cv2
+import numpy as np
+
+
+def distort_lut(hue, sat, val):
+    """
+    Build a [256, 1, 3] uint8 lookup table for the H, S and V channels
+    hue: hue shift in [-1, 1] of the full circle
+    sat: saturation scale
+    val: exposure (value) scale
+    Same rounding and wrapping as the former PIL point lambdas
+    """
+    i = np.arange(256, dtype=np.float64)
+
+    h = i + hue * 255
+    h = np.where(h > 255, h - 255, h)
+    h = np.where(h < 0, h + 255, h)
+    s = i * sat
+    v = i * val
+
+    lut = np.stack([h, s, v], axis=1)
+    lut = np.clip(lut, 0, 255).astype(np.uint8)
+    return lut.reshape(256, 1, 3)
+
+def distort_image(img, hue, sat, val):
+    """
+    img: RGB image, [h, w, 3], uint8
+    Hue shift, saturation and exposure scaling in one pass over HSV
+    """
+    hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV_FULL)
+    hsv = cv2.LUT(hsv, distort_lut(hue, sat, val))
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB_FULL)
+
+def change_background(img, mask, bg):
+    """
+    img : RGB image, [h, w, 3], uint8
+    mask: object mask, [h, w] or [h, w, c], uint8 (0 background, 255 object)
+    bg  : RGB background already resized to [h, w, 3], uint8
+    Return img where the mask is set and bg everywhere else
+    """
+    if mask.ndim == 3:
+        mask = mask[:, :, 0]
+    mask = cv2.compare(np.ascontiguousarray(mask), 127, cv2.CMP_GT)
+    out = np.array(bg, dtype=np.uint8, copy=True)
+    # masked copy: pixels outside the mask keep the background
+    cv2.bitwise_and(img, img, dst=out, mask=mask)
+    return out
+
+def crop_matrix(crop, shape, flip=False):
+    """
+    crop : (left, top, width, height) of the jitter window in input pixels,
+           it may reach past the image borders
+    shape: (width, height) of the output image
+    flip : mirror the output horizontally
+    Return the [2, 3] affine matrix mapping input pixels to output pixels
+    (crop + resize + flip), using pixel centers like cv2.resize
+    """
+    left, top, width, height = crop
+    sx = float(shape[0]) / width
+    sy = float(shape[1]) / height
+    matrix = np.array([[sx, 0., (0.5 - left) * sx - 0.5],
+                       [0., sy, (0.5 - top)  * sy - 0.5]], np.float64)
+    if flip:
+        matrix[0] = -matrix[0]
+        matrix[0, 2] += shape[0] - 1
+    return matrix
+
+def warp_image(img, matrix, shape, interpolation=cv2.INTER_LINEAR):
+    """
+    Apply crop_matrix to an image or a mask, pixels outside the input are 0
+    """
+    return cv2.warpAffine(img, matrix, tuple(shape), flags=interpolation,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+def warp_labels(labels, crop, size, flip=False):
+    """
+    labels: [N, 21] (class, 9 x (x, y) normalized to the input image, x range, y range)
+    crop  : same window as crop_matrix
+    size  : (width, height) of the input image
+    Return the labels normalized to the output image, clipped to [0, 0.999]
+    """
+    left, top, width, height = crop
+    labels = np.array(labels, dtype=np.float64, copy=True)
+    coords = labels[:, 1:19].reshape(-1, 9, 2)
+
+    coords[:, :, 0] = (coords[:, :, 0] * size[0] - left) / width
+    coords[:, :, 1] = (coords[:, :, 1] * size[1] - top)  / height
+    if flip:
+        coords[:, :, 0] = 1.0 - coords[:, :, 0]
+
+    labels[:, 1:19] = np.clip(coords, 0, 0.999).reshape(-1, 18)
+    return labels
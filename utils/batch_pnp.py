@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# ---------------------
+# PnP of a whole batch of frames at once (DLT + Gauss-Newton), without TensorFlow
+# ---------------------
+
+import itertools
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:  # only needed by the optional refinement
+    cv2 = None
+
+
+def rodrigues(omega):
+    """
+    Rotation matrices [B, 3, 3] of the rotation vectors omega [B, 3]
+    """
+    theta = np.linalg.norm(omega, axis=1).reshape(-1, 1, 1)
+    k = omega / np.maximum(theta.reshape(-1, 1), 1e-12)
+    K = np.zeros((len(omega), 3, 3))
+    K[:, 0, 1], K[:, 0, 2] = -k[:, 2], k[:, 1]
+    K[:, 1, 0], K[:, 1, 2] = k[:, 2], -k[:, 0]
+    K[:, 2, 0], K[:, 2, 1] = -k[:, 1], k[:, 0]
+    return np.eye(3) + np.sin(theta) * K + (1.0 - np.cos(theta)) * np.matmul(K, K)
+
+def nearest_rotation(M):
+    """
+    Closest rotation matrices [B, 3, 3] (Frobenius norm) of M [B, 3, 3]
+    """
+    U, _, Vt = np.linalg.svd(M)
+    D = np.ones((len(M), 3))
+    D[:, 2] = np.sign(np.linalg.det(np.matmul(U, Vt)))
+    return np.matmul(U * D[:, np.newaxis, :], Vt)
+
+def dlt(points3D, rays):
+    """
+    Linear pose from the direct linear transform
+    points3D: [N, 3], rays: normalized image points [B, N, 2]
+    Return R [B, 3, 3], t [B, 3]
+    """
+    nB, N = rays.shape[:2]
+    # condition the object points: centered, unit mean distance
+    center = np.mean(points3D, 0)
+    scale  = np.mean(np.linalg.norm(points3D - center, axis=1)) + 1e-12
+    X = np.c_[(points3D - center) / scale, np.ones(N)]  # [N, 4]
+
+    A = np.zeros((nB, N, 2, 12))
+    A[:, :, 0, 0:4]  = X
+    A[:, :, 1, 4:8]  = X
+    A[:, :, 0, 8:12] = -rays[:, :, 0:1] * X
+    A[:, :, 1, 8:12] = -rays[:, :, 1:2] * X
+    A = A.reshape(nB, 2 * N, 12)
+    # the object center is in front of the camera, so the last entry of the
+    # projection matrix (its depth) can be fixed to 1: linear least squares in the 11 others
+    AtA = np.matmul(A[:, :, :11].transpose(0, 2, 1), A[:, :, :11])
+    Atb = -np.einsum('bki,bk->bi', A[:, :, :11], A[:, :, 11])
+    P = np.concatenate([np.linalg.solve(AtA, Atb[:, :, np.newaxis])[:, :, 0], np.ones((nB, 1))], 1).reshape(nB, 3, 4)
+
+    R = nearest_rotation(P[:, :, :3])
+    s = np.sum(R * P[:, :, :3], (1, 2)) / 3.0  # least squares scale of P[:, :, :3] ~ s R
+    t = P[:, :, 3] / s.reshape(nB, 1)
+    # back to the original object coordinates
+    t = t * scale - np.matmul(R, center)
+    return R, t
+
+def gauss_newton(points3D, rays, R, t, iters=5, damping=1e-9):
+    """
+    Refine the poses on the reprojection error of the normalized image
+    points, left rotation updates R <- exp(w) R and additive t updates
+    """
+    nB, N = rays.shape[:2]
+    for _ in range(iters):
+        PR = np.einsum('bij,nj->bni', R, points3D)  # [B, N, 3], rotated points
+        Pc = PR + t[:, np.newaxis, :]
+        z  = np.where(np.abs(Pc[:, :, 2]) > 1e-12, Pc[:, :, 2], 1e-12)
+        u  = Pc[:, :, 0] / z
+        v  = Pc[:, :, 1] / z
+        r  = np.stack([u - rays[:, :, 0], v - rays[:, :, 1]], 2).reshape(nB, 2 * N)
+
+        # d projection / d camera point, [B, N, 2, 3]
+        dpi = np.zeros((nB, N, 2, 3))
+        dpi[:, :, 0, 0] = 1.0 / z
+        dpi[:, :, 0, 2] = -u / z
+        dpi[:, :, 1, 1] = 1.0 / z
+        dpi[:, :, 1, 2] = -v / z
+        # d camera point / d w = -[R X]x
+        skew = np.zeros((nB, N, 3, 3))
+        skew[:, :, 0, 1], skew[:, :, 0, 2] = PR[:, :, 2], -PR[:, :, 1]
+        skew[:, :, 1, 0], skew[:, :, 1, 2] = -PR[:, :, 2], PR[:, :, 0]
+        skew[:, :, 2, 0], skew[:, :, 2, 1] = PR[:, :, 1], -PR[:, :, 0]
+        J = np.concatenate([np.matmul(dpi, skew), dpi], 3).reshape(nB, 2 * N, 6)
+
+        JtJ = np.matmul(J.transpose(0, 2, 1), J) + damping * np.eye(6)
+        Jtr = np.einsum('bki,bk->bi', J, r)
+        # poses gone behind the camera or diverged stay where they are
+        lost = ~(np.all(Pc[:, :, 2] > 1e-6, 1) & np.all(np.abs(JtJ) < 1e12, (1, 2)) & np.all(np.isfinite(Jtr), 1))
+        JtJ[lost], Jtr[lost] = np.eye(6), 0.0
+        delta = -np.linalg.solve(JtJ, Jtr[:, :, np.newaxis])[:, :, 0]
+        R = np.matmul(rodrigues(delta[:, :3]), R)
+        t = t + delta[:, 3:]
+    return R, t
+
+def cube_rotations():
+    """
+    The 24 rotations of the cube [24, 3, 3], spread starting points of the
+    restarts
+    """
+    rotations = []
+    for axes in itertools.permutations(range(3)):
+        for signs in itertools.product((1, -1), repeat=3):
+            M = np.zeros((3, 3))
+            M[range(3), axes] = signs
+            if np.linalg.det(M) > 0:
+                rotations.append(M)
+    return np.array(rotations)
+
+def reprojection_error(points3D, points2D, K, R, t):
+    """
+    Mean pixel distance between points2D [B, N, 2] and the projected points3D, [B]
+    """
+    Pc = np.einsum('bij,nj->bni', R, points3D) + t[:, np.newaxis, :]
+    uv = np.einsum('ij,bnj->bni', K, Pc)
+    uv = uv[:, :, :2] / uv[:, :, 2:]
+    return np.mean(np.linalg.norm(uv - points2D, axis=2), 1)
+
+def batch_pnp(points3D, points2D, K, iters=5, refine_px=0.0, use_cv2=False):
+    """
+    Poses of a batch of frames sharing the object points
+    points3D: [N, 3] object points (N >= 6, not coplanar)
+    points2D: [B, N, 2] their projections in pixels
+    K: camera intrinsic [3, 3]
+    refine_px: frames whose mean reprojection error stays above it are
+               restarted from several rotations, the pose reprojecting
+               better is kept, 0: never
+    use_cv2: what is still above refine_px is also solved by cv2.solvePnP
+    Return R [B, 3, 3], t [B, 3, 1], like utils.pnp frame by frame
+    """
+    points3D = np.asarray(points3D, np.float64)
+    points2D = np.asarray(points2D, np.float64)
+    K = np.asarray(K, np.float64)
+    homogeneous = np.concatenate([points2D, np.ones(points2D.shape[:2] + (1,))], 2)
+    rays = np.einsum('ij,bnj->bni', np.linalg.inv(K), homogeneous)[:, :, :2]
+
+    R_lin, t_lin = dlt(points3D, rays)
+    R, t = gauss_newton(points3D, rays, R_lin, t_lin, iters)
+    errors = reprojection_error(points3D, points2D, K, R, t)
+    # far from the linear pose the steps can diverge or end behind the
+    # camera, keep the linear one then
+    linear = reprojection_error(points3D, points2D, K, R_lin, t_lin)
+    diverged = ~(errors <= linear) | (t[:, 2] <= 0)
+    R[diverged], t[diverged], errors[diverged] = R_lin[diverged], t_lin[diverged], linear[diverged]
+
+    outliers = np.where(errors > refine_px)[0] if refine_px > 0 else []
+    if len(outliers):
+        # noisy far objects can put the linear rotation in the mirrored pose:
+        # restart from the 24 rotations of the cube, keep the best one
+        starts = cube_rotations()
+        nO, nS = len(outliers), len(starts)
+        R_s, t_s = gauss_newton(points3D, np.repeat(rays[outliers], nS, 0), np.tile(starts, (nO, 1, 1)),
+                                np.repeat(t_lin[outliers], nS, 0), 2 * iters)
+        errors_s = reprojection_error(points3D, np.repeat(points2D[outliers], nS, 0), K, R_s, t_s)
+        errors_s = np.where(np.isfinite(errors_s) & (t_s[:, 2] > 0), errors_s, np.inf).reshape(nO, nS)
+        best = np.argmin(errors_s, 1)
+        better = errors_s[np.arange(nO), best] < errors[outliers]
+        picked = (np.arange(nO) * nS + best)[better]
+        R[outliers[better]], t[outliers[better]] = R_s[picked], t_s[picked]
+        errors[outliers[better]] = errors_s[np.arange(nO), best][better]
+
+    if len(outliers) and use_cv2 and cv2 is not None:
+        # cv2 from its own initialization on what is left, kept when it reprojects better
+        for b in outliers[errors[outliers] > refine_px]:
+            _, rvec, tvec = cv2.solvePnP(points3D, np.ascontiguousarray(points2D[b]).reshape(-1, 1, 2), K, np.zeros((8, 1)))
+            R_cv, t_cv = cv2.Rodrigues(rvec)[0][np.newaxis], tvec.reshape(1, 3)
+            if reprojection_error(points3D, points2D[b:b + 1], K, R_cv, t_cv)[0] < errors[b]:
+                R[b], t[b] = R_cv[0], t_cv[0]
+    return R, t[:, :, np.newaxis]
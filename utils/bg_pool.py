@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# ---------------------
+# shared pool of pre-resized VOC backgrounds
+# ---------------------
+
+import fcntl
+import json
+import os
+import random
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.utils import get_all_files
+
+
+class BackgroundPool(object):
+    """
+    size background images decoded and resized to shape (width, height) once
+    and stored in a memory-mapped uint8 array [size, h, w, 3].
+    Every trainer using the same file reads it through the page cache, so
+    only the first one pays the decode and resize cost.
+    refresh() writes the new images of the oldest slots into a file of their
+    own (<path>.<generation>) and points these slots at it in the json index,
+    the other slots are neither copied nor touched. Other processes pick up
+    the new index on their next sample() and never see a half-written
+    background. A single process refreshes a pool: the first one to call
+    refresh() keeps a lock on <path>.lock until it exits, the refresh() of
+    the others returns at once.
+    """
+
+    def __init__(self, path, bg_dir, size, shape):
+        self.path      = path
+        self.meta_path = path + '.json'
+        self.bg_dir    = bg_dir
+        self.size      = size
+        self.shape     = tuple(shape)  # (w, h)
+        self.bg_files  = None
+        self.lock_file = None
+        self.maps      = {}  # generation -> memmap of its images
+        if not os.path.exists(self.meta_path):
+            self.build()
+        self.open()
+
+    def array_shape(self, count=None):
+        return (self.size if count is None else count, self.shape[1], self.shape[0], 3)
+
+    def generation_path(self, generation):
+        """
+        Generation 0 is the pool built at first, the next ones hold the refreshed slots
+        """
+        return self.path if generation == 0 else '{}.{}'.format(self.path, generation)
+
+    def open(self):
+        """
+        Read the current index and map the files it points at, mappings of
+        files no longer used are dropped (views already returned stay valid)
+        """
+        while True:
+            self.meta_inode = os.stat(self.meta_path).st_ino
+            meta = self.read_meta()
+            self.slots = np.array(meta.get('slots', [[0, i] for i in range(self.size)]), np.int64)  # [size, 2]
+            used = set(int(g) for g in np.unique(self.slots[:, 0]))
+            try:
+                for generation in used - set(self.maps):
+                    count = meta.get('counts', {}).get(str(generation), self.size)
+                    self.maps[generation] = np.memmap(self.generation_path(generation), np.uint8, 'r',
+                                                      shape=self.array_shape(count))
+            except (IOError, OSError):  # retired by a refresh meanwhile, read the new index
+                continue
+            self.maps = dict((g, m) for g, m in self.maps.items() if g in used)
+            return
+
+    def list_files(self):
+        if self.bg_files is None:
+            self.bg_files = get_all_files(self.bg_dir)
+        return self.bg_files
+
+    def load(self, bgpath):
+        bg = np.asarray(Image.open(bgpath).convert('RGB'))
+        return cv2.resize(bg, self.shape, interpolation=cv2.INTER_AREA)
+
+    def read_meta(self):
+        with open(self.meta_path, 'r') as f:
+            return json.load(f)
+
+    def write_meta(self, meta):
+        tmp = '{}.{}.tmp'.format(self.meta_path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def write_images(self, filename, bgpaths):
+        """
+        Decode bgpaths into a private file and move it in place, so concurrent
+        trainers never read a half-written file
+        """
+        tmp = '{}.{}.tmp'.format(filename, os.getpid())
+        images = np.memmap(tmp, np.uint8, 'w+', shape=self.array_shape(len(bgpaths)))
+        for i, bgpath in enumerate(bgpaths):
+            images[i] = self.load(bgpath)
+        images.flush()
+        del images
+        os.replace(tmp, filename)
+
+    def build(self):
+        print("   building background pool of {} images in {}".format(self.size, self.path))
+        files = self.list_files()
+        chosen = [random.choice(files) for _ in range(self.size)]
+        self.write_images(self.path, chosen)
+        self.write_meta({'files': chosen, 'next_slot': 0, 'generation': 0,
+                         'slots': [[0, i] for i in range(self.size)], 'counts': {}, 'retired': []})
+
+    def is_refresher(self):
+        """
+        Take the refresh lock of the pool, False when another process holds it
+        """
+        if self.lock_file is None:
+            lock_file = open(self.path + '.lock', 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                lock_file.close()
+                return False
+            self.lock_file = lock_file  # released when the process exits
+        return True
+
+    def refresh(self, count):
+        """
+        Replace the count oldest slots with newly decoded random images, written
+        to the file of a new generation. Files no longer pointed at are deleted
+        one refresh later, so a reader holding the previous index can still map
+        them. Does nothing unless this process is the refresher of the pool
+        """
+        if count <= 0 or not self.is_refresher():
+            return
+        count = min(count, self.size)
+        files = self.list_files()
+        meta = self.read_meta()
+        generation = meta.get('generation', 0) + 1
+        slots = meta.get('slots', [[0, i] for i in range(self.size)])
+        counts = meta.get('counts', {})
+
+        chosen = [random.choice(files) for _ in range(count)]
+        self.write_images(self.generation_path(generation), chosen)
+        for i, bgpath in enumerate(chosen):
+            slot = meta['next_slot']
+            slots[slot] = [generation, i]
+            meta['files'][slot] = bgpath
+            meta['next_slot'] = (slot + 1) % self.size
+        counts[str(generation)] = count
+
+        used = set(g for g, _ in slots)
+        for old in meta.get('retired', []):
+            if os.path.exists(self.generation_path(old)):
+                os.remove(self.generation_path(old))
+            counts.pop(str(old), None)
+        meta['retired'] = sorted(int(g) for g in counts if int(g) not in used)
+        if 0 not in used and os.path.exists(self.path) and 0 not in meta['retired']:
+            meta['retired'].append(0)
+        meta.update({'generation': generation, 'slots': slots, 'counts': counts})
+        self.write_meta(meta)
+        self.open()
+
+    def sample(self):
+        """
+        Return a random background, [h, w, 3] uint8 (read-only view)
+        """
+        if os.stat(self.meta_path).st_ino != self.meta_inode:  # refreshed by the refresher
+            self.open()
+        generation, index = self.slots[random.randint(0, self.size - 1)]
+        return self.maps[generation][index]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# ---------------------
+# batched NumPy decoding of the output maps, without TensorFlow
+# ---------------------
+
+import numpy as np
+
+import yolo.config as cfg
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+def grid_corners(outputs):
+    """
+    9 points predicted by every cell, normalized to the image
+    outputs: [batch, h, w, 19 + num_classes]
+    Return [batch, h, w, 9, 2]
+    """
+    nB, h, w = outputs.shape[:3]
+    corners = np.array(outputs[..., :18], np.float32).reshape(nB, h, w, 9, 2)
+    corners[..., 0, :] = sigmoid(corners[..., 0, :])
+    corners[..., 0] += np.arange(w, dtype=np.float32).reshape(1, 1, w, 1)
+    corners[..., 1] += np.arange(h, dtype=np.float32).reshape(1, h, 1, 1)
+    corners /= np.array([w, h], np.float32)
+    return corners
+
+def decode_batch(outputs, conf_thresh=cfg.CONF_THRESHOLD, refine=True, im_width=cfg.IMAGE_WIDTH, im_height=cfg.IMAGE_HEIGHT):
+    """
+    Keypoints of the most confident cell of every output map at once
+    outputs: [batch, h, w, 19 + num_classes], already scaled by cfg.OUTPUT_SCALE
+    refine: average the 9 points predicted by the 3x3 neighborhood of the
+            best cell, weighted by their confidence; neighbors below
+            conf_thresh are left out
+    The confidences are those the loss trained, the sigmoid of the unscaled
+    logits: on the scaled map they saturate to 1 and every neighbor would
+    weigh the same
+    Return corners [batch, 9, 2] in pixels, confidence of the best cell [batch]
+           and found [batch], confidence >= conf_thresh
+    """
+    nB, h, w = outputs.shape[:3]
+    raw  = outputs[..., 18].reshape(nB, h * w) / cfg.OUTPUT_SCALE
+    best = np.argmax(raw, 1)
+    conf = sigmoid(raw[np.arange(nB), best])
+    rows, cols = best // w, best % w
+
+    corners = grid_corners(outputs)
+    if refine:
+        weights = sigmoid(raw).reshape(nB, h, w)
+        weights = np.where(weights >= conf_thresh, weights, 0.0)
+        # one cell of zero padding, the neighborhood of a border cell stays 3x3
+        corners = np.pad(corners, ((0, 0), (1, 1), (1, 1), (0, 0), (0, 0)), 'constant')
+        weights = np.pad(weights, ((0, 0), (1, 1), (1, 1)), 'constant')
+        offsets = np.arange(3)
+        ii = rows.reshape(nB, 1, 1) + offsets.reshape(1, 3, 1)  # [batch, 3, 1], padded coords
+        jj = cols.reshape(nB, 1, 1) + offsets.reshape(1, 1, 3)  # [batch, 1, 3]
+        bb = np.arange(nB).reshape(nB, 1, 1)
+        weights = weights[bb, ii, jj]  # [batch, 3, 3]
+        weights[:, 1, 1] = np.maximum(weights[:, 1, 1], cfg.EPSILON)  # the best cell always counts
+        corners = np.einsum('bij,bijkc->bkc', weights, corners[bb, ii, jj]) / \
+            np.sum(weights, (1, 2)).reshape(nB, 1, 1)
+    else:
+        corners = corners[np.arange(nB), rows, cols]
+
+    corners = corners * np.array([im_width, im_height], np.float32)
+    return corners, conf, conf >= conf_thresh
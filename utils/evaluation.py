@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# ---------------------
+# pose accuracy metrics shared by Solver.test and the deployment tools
+# ---------------------
+
+import time
+
+import numpy as np
+
+import yolo.config as cfg
+from utils.MeshPly import MeshPly
+from utils.batch_pnp import batch_pnp
+from utils.decode import decode_batch
+from utils.geometry import get_3D_corners, get_camera_intrinsic
+from utils.gt_cache import GroundTruthCache
+from utils.pose_metrics import MeshMetric
+from utils.timer import Timer
+
+
+def mesh_vertices(meshname):
+    """
+    Homogeneous vertices [4, N] of a .ply mesh
+    """
+    mesh = MeshPly(meshname)
+    return np.c_[np.array(mesh.vertices), np.ones((len(mesh.vertices), 1))].T
+
+def attach_gt_cache(evaluator, data):
+    """
+    Let evaluator read the ground truth side of the valid list of data from
+    its cache (built on first use), when cfg.GT_CACHE is set
+    """
+    directory = data.gt_cache_dir()
+    if cfg.GT_CACHE and directory is not None:
+        evaluator.use_cache(GroundTruthCache(directory, evaluator, data.load_test_truths()))
+
+def save_curves(evaluator, filename):
+    """
+    Write the accuracy vs threshold curves (PoseEvaluator.curves) as columns of a text file
+    """
+    curves  = evaluator.curves()
+    columns = ['scale', 'px', 'acc', 'vx', 'acc3d', 'cm', 'acc5cm5deg']
+    np.savetxt(filename, np.stack([curves[c] for c in columns], 1), fmt='%.6f', header=' '.join(columns))
+    print('   accuracy curves written to {}'.format(filename))
+
+def evaluate_frames(data, frames, run, evaluator):
+    """
+    Feed every frame alone through run: image [1, size, size, 3] -> logit [1, cell, cell, 20]
+    data: Linemod, frames: image paths
+    Return ms per frame (after one warm up run), the evaluator holds the accuracies
+    """
+    timer = Timer()
+    evaluator.reset()
+    run(data.load_test_sample(frames[0])[0][np.newaxis])
+    for imgpath in frames:
+        image, truth = data.load_test_sample(imgpath)
+        timer.tic()
+        logit = run(image[np.newaxis])
+        timer.toc()
+        # same decoding as Solver.test
+        evaluator.add(logit[0] * cfg.OUTPUT_SCALE, truth)
+    return timer.average_time * 1000
+
+def evaluate_stream(data, loader, run, evaluator, store=None):
+    """
+    Score every frame of the valid list once, batch by batch
+    data: Linemod, loader: PrefetchLoader building data.get_test_batch, or
+          None to build the batches in order here
+    run: images [n, size, size, 3] -> predicted corners [n, 9, 2] in pixels,
+         confidences [n] and flat indices of the best cells [n]
+    store: PredictionStore receiving the decoded frames and their poses
+    Raise RuntimeError unless every frame was scored exactly once
+    Return {'frames', 'load_ms', 'run_ms', 'score_ms' (per frame), 'fps' (whole pass)}
+    """
+    load_timer  = Timer()
+    run_timer   = Timer()
+    score_timer = Timer()
+    evaluator.reset()
+    scored = []
+    start = time.time()
+    for batch_idx in range(data.num_test_batches()):
+        load_timer.tic()
+        images, truths, indices = loader.next_batches() if loader is not None else data.get_test_batch(batch_idx)
+        load_timer.toc()
+        run_timer.tic()
+        corners, confidences, cells = run(images)
+        run_timer.toc()
+        score_timer.tic()
+        R, t = evaluator.add_batch(corners, truths, indices)
+        score_timer.toc()
+        if store is not None:
+            store.add(indices, truths, corners, confidences, cells, R, t)
+        scored.append(indices)
+    scored = np.sort(np.concatenate(scored)) if scored else np.zeros(0, np.int64)
+    if not np.array_equal(scored, np.arange(len(data.load_test_list()))):
+        raise RuntimeError('the valid list has {} frames but {} were scored, {} distinct'.format(
+            len(data.load_test_list()), len(scored), len(np.unique(scored))))
+    frames = float(max(len(evaluator), 1))
+    return {'frames':   len(evaluator),
+            'load_ms':  load_timer.total_time * 1000 / frames,
+            'run_ms':   run_timer.total_time * 1000 / frames,
+            'score_ms': score_timer.total_time * 1000 / frames,
+            'fps':      frames / (time.time() - start)}
+
+
+class PoseEvaluator(object):
+    """
+    Accumulates the per-frame errors of a LINEMOD object and reports the
+    2D projection, 3D transformation (ADD) and 5cm 5degree accuracies.
+    vertices: homogeneous mesh vertices [4, N]
+    symmetric: score ADD-S instead of ADD (see utils/pose_metrics.py)
+    """
+
+    def __init__(self, vertices, vx_threshold, internal_calibration=None, px_threshold=5,
+                 im_width=cfg.IMAGE_WIDTH, im_height=cfg.IMAGE_HEIGHT, symmetric=False):
+        self.vertices             = vertices
+        self.metric               = MeshMetric(vertices, symmetric, cfg.ADD_POINTS)
+        self.corners3D            = get_3D_corners(vertices)
+        self.vx_threshold         = vx_threshold
+        self.px_threshold         = px_threshold
+        self.internal_calibration = get_camera_intrinsic() if internal_calibration is None else internal_calibration
+        self.im_width             = im_width
+        self.im_height            = im_height
+        self.pnp_refine_px        = cfg.PNP_REFINE_PX
+        self.points3D = np.array(np.transpose(np.concatenate((np.zeros((3, 1)), self.corners3D[:3, :]), axis=1)), dtype='float32')
+        self.gt_cache = None
+        self.reset()
+
+    def reset(self):
+        self.errs_2d       = []
+        self.errs_3d       = []
+        self.errs_3d_bound = []
+        self.errs_trans    = []
+        self.errs_angle    = []
+        self.errs_corner2D = []
+
+    def __len__(self):
+        return len(self.errs_2d)
+
+    def add(self, logit, truth):
+        """
+        logit: network output of one frame [cell, cell, 19 + num_classes]
+        truth: label of the frame [21] (class, 9 x (x, y) normalized coords, x range, y range)
+        """
+        corners, _, _ = decode_batch(logit[np.newaxis], refine=cfg.DECODE_REFINE, im_width=self.im_width, im_height=self.im_height)
+        self.add_corners(corners[0], truth)
+
+    def add_box(self, box_pr, truth):
+        """
+        box_pr: predicted 9 points of the frame [18], normalized coords
+        truth: label of the frame [21]
+        """
+        #denomalize the corner prediction
+        corners2D_pr = np.array(np.reshape(box_pr, [9, 2]), dtype='float32')
+        corners2D_pr[:, 0] = corners2D_pr[:, 0] * self.im_width
+        corners2D_pr[:, 1] = corners2D_pr[:, 1] * self.im_height
+        self.add_corners(corners2D_pr, truth)
+
+    def add_corners(self, corners2D_pr, truth):
+        """
+        corners2D_pr: predicted 9 points of the frame [9, 2] in pixels (net.detections)
+        truth: label of the frame [21]
+        """
+        self.add_batch(np.reshape(corners2D_pr, [1, 9, 2]), np.reshape(truth, [1, 21]))
+
+    def use_cache(self, gt_cache):
+        """
+        gt_cache: GroundTruthCache of the evaluated split, or None
+        """
+        self.gt_cache = gt_cache
+
+    def ground_truth_corners(self, truths):
+        return np.reshape(truths[:, 1:19], [len(truths), 9, 2]) * np.array([self.im_width, self.im_height], np.float64)
+
+    def project(self, R, t):
+        """
+        Mesh vertices of the poses R [B, 3, 3], t [B, 3, 1] in the camera frame
+        [B, 3, N] and projected on the image [B, 2, N]
+        """
+        transform_3d = np.matmul(np.concatenate((R, t), axis=2), self.vertices)
+        proj_2d = np.matmul(self.internal_calibration, transform_3d)
+        return transform_3d, proj_2d[:, :2] / proj_2d[:, 2:]
+
+    def solve_ground_truth(self, truths):
+        """
+        truths: labels of a batch of frames [B, 21]
+        Return the ground truth side of add_batch: R, t, transformed and projected vertices
+        """
+        R, t = batch_pnp(self.points3D, self.ground_truth_corners(truths),
+                         self.internal_calibration, refine_px=self.pnp_refine_px)
+        return (R, t) + self.project(R, t)
+
+    def add_batch(self, corners2D_pr, truths, indices=None, poses=None):
+        """
+        corners2D_pr: predicted 9 points of a batch of frames [B, 9, 2] in pixels
+        truths: labels of the frames [B, 21]
+        indices: positions of the frames in the split, the ground truth side
+                 is then read from the cache (see use_cache) instead of solved
+        poses: predicted (R [B, 3, 3], t [B, 3, 1]) when already solved (rescore.py)
+        The poses of the whole batch are solved at once
+        Return the predicted poses R, t
+        """
+        nB = len(truths)
+        corners2D_gt = self.ground_truth_corners(truths)
+        corners2D_pr = np.array(corners2D_pr, np.float64)
+
+        # Compute corner prediction error
+        self.errs_corner2D.extend(np.mean(np.linalg.norm(corners2D_gt - corners2D_pr, axis=2), 1))
+
+        # Compute [R|t] by pnp
+        gt = None
+        if self.gt_cache is not None and indices is not None:
+            gt = self.gt_cache.lookup(indices, truths)
+        if poses is not None:
+            R_pr, t_pr = poses
+            gt = self.solve_ground_truth(truths) if gt is None else gt
+        elif gt is None:
+            R, t = batch_pnp(self.points3D, np.concatenate([corners2D_gt, corners2D_pr]),
+                             self.internal_calibration, refine_px=self.pnp_refine_px)
+            gt = (R[:nB], t[:nB]) + self.project(R[:nB], t[:nB])
+            R_pr, t_pr = R[nB:], t[nB:]
+        else:
+            R_pr, t_pr = batch_pnp(self.points3D, corners2D_pr, self.internal_calibration, refine_px=self.pnp_refine_px)
+        R_gt, t_gt, transform_3d_gt, proj_2d_gt = gt
+        transform_3d_pred, proj_2d_pred = self.project(R_pr, t_pr)
+
+        # Compute translation and angle errors
+        self.errs_trans.extend(np.linalg.norm(t_gt - t_pr, axis=(1, 2)))
+        cos = (np.trace(np.matmul(R_gt, R_pr.transpose(0, 2, 1)), axis1=1, axis2=2) - 1.0) / 2.0
+        self.errs_angle.extend(np.rad2deg(np.arccos(np.clip(cos, -1.0, 1.0))))
+
+        # Compute 3D distances, ADD or ADD-S
+        if len(self.metric.index) < self.metric.num_vertices:
+            points_gt, points_pr = transform_3d_gt[:, :, self.metric.index], None
+        else:
+            points_gt, points_pr = transform_3d_gt, transform_3d_pred
+        self.errs_3d.extend(self.metric.distances(points_gt, R_pr, t_pr, points_pr))
+        self.errs_3d_bound.extend(self.metric.error_bound(R_gt, R_pr))
+
+        # Compute pixel error
+        self.errs_2d.extend(np.mean(np.linalg.norm(proj_2d_gt - proj_2d_pred, axis=1), 1))
+        return R_pr, t_pr
+
+    def summary(self):
+        """
+        Return {metric name: value}, accuracies in percent
+        """
+        eps = 1e-5
+        errs_2d    = np.array(self.errs_2d)
+        errs_3d    = np.array(self.errs_3d)
+        errs_trans = np.array(self.errs_trans)
+        errs_angle = np.array(self.errs_angle)
+        nts = float(len(errs_2d))
+        return {'acc':             len(np.where(errs_2d <= self.px_threshold)[0]) * 100. / (nts + eps),
+                'acc3d':           len(np.where(errs_3d <= self.vx_threshold)[0]) * 100. / (nts + eps),
+                'acc5cm5deg':      len(np.where((errs_trans <= 0.05) & (errs_angle <= 5))[0]) * 100. / (nts + eps),
+                'mean_corner_err': np.mean(self.errs_corner2D) if self.errs_corner2D else 0.0,
+                'add_bound':       np.max(self.errs_3d_bound) if self.errs_3d_bound else 0.0,
+                'trans_err':       np.sum(errs_trans) / (nts + eps),
+                'angle_err':       np.sum(errs_angle) / (nts + eps),
+                'pixel_err':       np.sum(errs_2d) / (nts + eps)}
+
+    def curves(self, scales=np.linspace(0, 4, 41)):
+        """
+        Accuracies (percent) with every threshold scaled by scales: 2D
+        projection at scales * px_threshold, ADD at scales * vx_threshold
+        and n cm n degree at scales * (5 cm, 5 degree)
+        Return {'scale', 'px', 'acc', 'vx', 'acc3d', 'cm', 'acc5cm5deg'}, arrays of len(scales)
+        """
+        scales     = np.asarray(scales, np.float64)
+        nts        = float(max(len(self.errs_2d), 1))
+        errs_2d    = np.array(self.errs_2d).reshape(-1, 1)
+        errs_3d    = np.array(self.errs_3d).reshape(-1, 1)
+        errs_trans = np.array(self.errs_trans).reshape(-1, 1)
+        errs_angle = np.array(self.errs_angle).reshape(-1, 1)
+        return {'scale':      scales,
+                'px':         scales * self.px_threshold,
+                'acc':        np.sum(errs_2d <= scales * self.px_threshold, 0) * 100. / nts,
+                'vx':         scales * self.vx_threshold,
+                'acc3d':      np.sum(errs_3d <= scales * self.vx_threshold, 0) * 100. / nts,
+                'cm':         scales * 5,
+                'acc5cm5deg': np.sum((errs_trans <= scales * 0.05) & (errs_angle <= scales * 5), 0) * 100. / nts}
+
+    def report(self):
+        """
+        Print the test statistics and return summary()
+        """
+        stats = self.summary()
+        print("   Mean corner error is %f" % (stats['mean_corner_err']))
+        print('   Acc using {} px 2D Projection = {:.2f}%'.format(self.px_threshold, stats['acc']))
+        print('   Acc using {} vx 3D Transformation{} = {:.2f}%'.format(
+            self.vx_threshold, ' (ADD-S)' if self.metric.symmetric else '', stats['acc3d']))
+        if self.metric.radius > 0:
+            print('   3D distances on {} of {} vertices, within {:f} of all of them'.format(
+                len(self.metric.index), self.metric.num_vertices, stats['add_bound']))
+        print('   Acc using 5 cm 5 degree metric = {:.2f}%'.format(stats['acc5cm5deg']))
+        print('   Translation error: %f, angle error: %f' % (stats['trans_err'], stats['angle_err']))
+        return stats
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# ---------------------
+# LINEMOD camera and mesh geometry, without TensorFlow
+# ---------------------
+
+import numpy as np
+
+
+def get_3D_corners(vertices):
+
+    min_x = np.min(vertices[0,:])
+    max_x = np.max(vertices[0,:])
+    min_y = np.min(vertices[1,:])
+    max_y = np.max(vertices[1,:])
+    min_z = np.min(vertices[2,:])
+    max_z = np.max(vertices[2,:])
+
+    corners = np.array([[min_x, min_y, min_z],
+                        [min_x, min_y, max_z],
+                        [min_x, max_y, min_z],
+                        [min_x, max_y, max_z],
+                        [max_x, min_y, min_z],
+                        [max_x, min_y, max_z],
+                        [max_x, max_y, min_z],
+                        [max_x, max_y, max_z]])
+
+    corners = np.concatenate((np.transpose(corners), np.ones((1,8)) ), axis=0)
+    return corners
+
+def get_camera_intrinsic():
+    K = np.zeros((3, 3), dtype='float64')
+    K[0, 0], K[0, 2] = 572.4114, 325.2611
+    K[1, 1], K[1, 2] = 573.5704, 242.0489
+    K[2, 2] = 1.
+    return K
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# ---------------------
+# ground truth poses and mesh projections of a valid list, solved once
+# ---------------------
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+ARRAYS = ('truths', 'R', 't', 'transformed', 'projected')
+
+
+class GroundTruthCache(object):
+    """
+    The ground truth side of PoseEvaluator.add_batch for every frame of a
+    split: R [F, 3, 3], t [F, 3, 1], mesh vertices in the camera frame
+    [F, 3, N] and projected on the image [F, 2, N], stored as .npy files in
+    directory and read back through np.memmap.
+    The cache is rebuilt when the mesh, the camera or the image size change,
+    frames whose labels differ from the cached ones are solved again by lookup().
+    When directory can not be written (read-only dataset), the arrays are only
+    kept in memory for the life of the object
+    """
+
+    def __init__(self, directory, evaluator, truths):
+        self.directory = directory
+        self.meta_path = os.path.join(directory, 'meta.json')
+        self.key       = self.make_key(evaluator)
+        if self.is_valid(len(truths)):
+            self.arrays = dict((name, np.load(self.array_path(name), mmap_mode='r')) for name in ARRAYS)
+        else:
+            self.arrays = self.build(evaluator, truths)
+
+    def array_path(self, name):
+        return os.path.join(self.directory, name + '.npy')
+
+    @staticmethod
+    def make_key(evaluator):
+        """
+        Digest of everything the cached arrays depend on besides the labels
+        """
+        digest = hashlib.sha1()
+        for array in (evaluator.vertices, evaluator.internal_calibration,
+                      [evaluator.im_width, evaluator.im_height]):
+            digest.update(np.ascontiguousarray(array, np.float64).tobytes())
+        return digest.hexdigest()
+
+    def is_valid(self, num_frames):
+        if not os.path.exists(self.meta_path):
+            return False
+        with open(self.meta_path, 'r') as f:
+            meta = json.load(f)
+        return meta['key'] == self.key and meta['frames'] == num_frames
+
+    def build(self, evaluator, truths, batch_size=256):
+        """
+        Solve the whole split in batches and move the files in place, so that
+        concurrent evaluations never read a half-written cache
+        Return the arrays {name: array}, still in memory
+        """
+        print("   caching the ground truth poses of {} frames in {}".format(len(truths), self.directory))
+        truths = np.asarray(truths, np.float32).reshape(-1, 21)
+        parts = [evaluator.solve_ground_truth(truths[i:i + batch_size]) for i in range(0, len(truths), batch_size)]
+        arrays = [truths] + [np.concatenate([p[i] for p in parts]) for i in range(4)]
+        arrays = dict((name, array.astype(np.float64 if name in ('R', 't') else np.float32))
+                      for name, array in zip(ARRAYS, arrays))
+        try:
+            self.save(arrays, len(truths))
+        except (IOError, OSError) as e:
+            print("   {} can not be written ({}), the ground truth is kept in memory only".format(self.directory, e))
+        return arrays
+
+    def save(self, arrays, num_frames):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        for name in ARRAYS:
+            tmp = '{}.{}.tmp.npy'.format(os.path.join(self.directory, name), os.getpid())
+            try:
+                np.save(tmp, arrays[name])
+                os.replace(tmp, self.array_path(name))
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        tmp = '{}.{}.tmp'.format(self.meta_path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'key': self.key, 'frames': num_frames}, f)
+        os.replace(tmp, self.meta_path)
+
+    def lookup(self, indices, truths):
+        """
+        indices: frames of the split [B], truths: their labels [B, 21]
+        Return (R, t, transformed, projected) of the frames, None when a label
+        changed since the cache was built
+        """
+        indices = np.asarray(indices)
+        if not np.allclose(self.arrays['truths'][indices], truths, atol=1e-6):
+            return None
+        return tuple(np.asarray(self.arrays[name][indices]) for name in ARRAYS[1:])
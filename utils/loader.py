@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# ---------------------
+# multi-process batch prefetching for Linemod
+# ---------------------
+
+import multiprocessing as mp
+import queue
+import random
+import time
+import traceback
+
+import numpy as np
+
+
+class WorkerError(Exception):
+    """
+    An exception raised by a worker while building a batch, re-raised by
+    next_batches() with the traceback of the worker
+    """
+
+    def __init__(self, batch_idx, trace):
+        super(WorkerError, self).__init__(batch_idx, trace)
+        self.batch_idx = batch_idx
+        self.trace     = trace
+
+    def __str__(self):
+        return 'building batch {} failed in a loader worker:\n{}'.format(self.batch_idx, self.trace)
+
+
+def _worker_loop(data, build, task_queue, batch_queue, seed):
+    """
+    Worker process: build every (task number, batch index) received from
+    task_queue with data.<build> and put (task number, batch) into
+    batch_queue, stop on None. A failing batch is put as a WorkerError instead
+    """
+    random.seed(seed)
+    np.random.seed(seed % (2 ** 32))
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        number, batch_idx = task
+        try:
+            batch = getattr(data, build)(batch_idx)
+        except Exception:
+            batch = WorkerError(batch_idx, traceback.format_exc())
+        batch_queue.put((number, batch))
+
+
+class PrefetchLoader(object):
+    """
+    Builds Linemod batches in num_workers processes ahead of time.
+    At most queue_size batches are in flight (queued or being built),
+    so next_batches() only pays a queue pop once the workers keep up.
+    The batch order inside an epoch is not preserved, but every epoch
+    returns each of the num_batches batches exactly once: batches of the
+    next epoch that are ready early wait until the current one is complete,
+    so a consumer taking num_batches batches per epoch stays aligned.
+    build: Linemod method building a batch from its index, get_test_batch
+    streams the valid list (num_batches = Linemod.num_test_batches())
+    cycle: keep queuing batches epoch after epoch, else queue every batch
+    index once and stop (a single pass, e.g. over the valid list)
+    """
+
+    def __init__(self, data, num_workers, queue_size=0, seed=None, build='get_batch', num_batches=0, cycle=True):
+        self.data        = data
+        self.num_workers = num_workers
+        self.num_batches = num_batches if num_batches > 0 else len(data.imgname) // data.batch_size
+        self.queue_size  = queue_size if queue_size > 0 else 2 * num_workers
+        self.cycle       = cycle
+        self.batch       = 0
+        self.next_task   = 0
+        self.early       = {}  # task number -> batch of a later epoch
+        self.closed      = False
+        if seed is None:
+            seed = random.randint(0, 2 ** 31 - 1)
+
+        self.task_queue  = mp.Queue()
+        self.batch_queue = mp.Queue(self.queue_size)
+        self.workers     = []
+        for i in range(self.num_workers):
+            worker = mp.Process(target=_worker_loop,
+                                args=(data, build, self.task_queue, self.batch_queue, seed + i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+        for _ in range(self.queue_size):
+            self.put_task()
+
+    def put_task(self):
+        if not self.cycle and self.next_task >= self.num_batches:
+            return
+        self.task_queue.put((self.next_task, self.next_task % self.num_batches))
+        self.next_task += 1
+
+    def next_batches(self):
+        """
+        Same return values as Linemod.next_batches
+        Without cycle, only num_batches calls return
+        """
+        if not self.cycle and self.batch >= self.num_batches:
+            raise StopIteration('all the {} batches were returned'.format(self.num_batches))
+        epoch_end = (self.batch // self.num_batches + 1) * self.num_batches
+        ready = [number for number in self.early if number < epoch_end]
+        if ready:
+            batch = self.early.pop(ready[0])
+        else:
+            number, batch = self.get_result()
+            while number >= epoch_end:
+                self.early[number] = batch
+                number, batch = self.get_result()
+        if isinstance(batch, WorkerError):
+            raise batch
+        self.put_task()
+        self.batch += 1
+        return batch
+
+    def get_result(self, poll=1.0):
+        """
+        Wait for the next built batch, raise RuntimeError when a worker died
+        (killed, out of memory ...) instead of waiting forever
+        """
+        while True:
+            try:
+                return self.batch_queue.get(timeout=poll)
+            except queue.Empty:
+                for worker in self.workers:
+                    if not worker.is_alive():
+                        raise RuntimeError('loader worker {} exited with code {}'.format(worker.pid, worker.exitcode))
+
+    def close(self, timeout=5.0):
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.workers:
+            self.task_queue.put(None)
+        # drain results so that workers blocked on a full queue can exit
+        deadline = time.time() + timeout
+        while time.time() < deadline and any(worker.is_alive() for worker in self.workers):
+            try:
+                self.batch_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        self.task_queue.close()
+        self.batch_queue.close()
+        self.task_queue.cancel_join_thread()
+        self.batch_queue.cancel_join_thread()
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# ---------------------
+# batched ADD / ADD-S mesh distances, without TensorFlow
+# ---------------------
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # ADD-S falls back to a chunked brute force search
+    cKDTree = None
+
+
+def farthest_point_sample(points, num_points):
+    """
+    Greedy farthest point sampling of points [N, 3], starting from the
+    vertex farthest from the centroid
+    Return the sampled indices [num_points], the fraction of the vertices
+    closest to each of them [num_points] and the covering radius, the largest
+    distance of a vertex to its closest sample
+    """
+    points = np.asarray(points, np.float64)
+    first = np.argmax(np.linalg.norm(points - np.mean(points, 0), axis=1))
+    index = [first]
+    dists = np.linalg.norm(points - points[first], axis=1)
+    owner = np.zeros(len(points), np.int64)
+    for i in range(1, num_points):
+        index.append(np.argmax(dists))
+        new = np.linalg.norm(points - points[index[-1]], axis=1)
+        owner[new < dists] = i
+        dists = np.minimum(dists, new)
+    weights = np.bincount(owner, minlength=num_points) / float(len(points))
+    return np.array(index), weights, float(np.max(dists))
+
+def nearest_distances(tree, points, queries, chunk=1 << 22):
+    """
+    Distance of every query [M, 3] to its nearest point, through the KD-tree
+    when there is one, else by brute force over chunks of queries
+    """
+    if tree is not None:
+        return tree.query(queries)[0]
+    sq_points = np.sum(points ** 2, 1)
+    rows = max(1, chunk // len(points))
+    out = np.empty(len(queries))
+    for i in range(0, len(queries), rows):
+        q = queries[i:i + rows]
+        sq = np.sum(q ** 2, 1)[:, np.newaxis] + sq_points - 2.0 * np.dot(q, points.T)
+        out[i:i + rows] = np.sqrt(np.maximum(np.min(sq, 1), 0.0))
+    return out
+
+
+class MeshMetric(object):
+    """
+    ADD (mean distance between the mesh vertices under the true and the
+    predicted pose) or, for symmetric objects, ADD-S (mean distance of every
+    true vertex to the closest predicted one) of a batch of frames at once.
+    vertices: homogeneous mesh vertices [4, N]
+    num_points: average over a farthest point subsample of the vertices, each
+                sample weighted by the share of vertices closest to it; the
+                result is then within error_bound() of the full one. 0: all
+    """
+
+    def __init__(self, vertices, symmetric=False, num_points=0):
+        vertices = np.asarray(vertices, np.float64)[:3].T  # [N, 3]
+        self.symmetric    = symmetric
+        self.num_vertices = len(vertices)
+        if 0 < num_points < len(vertices):
+            self.index, self.weights, self.radius = farthest_point_sample(vertices, num_points)
+        else:
+            self.index   = np.arange(len(vertices))
+            self.weights = np.full(len(vertices), 1.0 / len(vertices))
+            self.radius  = 0.0
+        self.points   = vertices[self.index]  # [n, 3]
+        self.points_t = np.ascontiguousarray(self.points.T)
+        # nearest neighbors are searched among all the vertices, in the object frame
+        self.vertices = vertices
+        self.tree     = cKDTree(vertices) if symmetric and cKDTree is not None else None
+
+    def transform(self, R, t):
+        """
+        Sampled vertices under the poses R [B, 3, 3], t [B, 3, 1] in the camera frame [B, 3, n]
+        """
+        return np.matmul(R, self.points_t) + t
+
+    def distances(self, points_gt, R_pr, t_pr, points_pr=None):
+        """
+        points_gt: sampled vertices under the true poses [B, 3, n] (transform())
+        R_pr, t_pr: predicted poses [B, 3, 3], [B, 3, 1]
+        points_pr: sampled vertices under the predicted poses when already known
+        Return ADD, or ADD-S for symmetric meshes, of every frame [B]
+        """
+        if not self.symmetric:
+            diff = points_gt - (self.transform(R_pr, t_pr) if points_pr is None else points_pr)
+            return np.dot(np.linalg.norm(diff, axis=1), self.weights)
+        # the true vertices brought back to the object frame by the predicted pose
+        queries = np.einsum('bji,bjn->bni', R_pr, points_gt - t_pr)  # [B, n, 3]
+        nB, n = queries.shape[:2]
+        dists = nearest_distances(self.tree, self.vertices, queries.reshape(nB * n, 3))
+        return np.dot(dists.reshape(nB, n), self.weights)
+
+    def error_bound(self, R_gt, R_pr):
+        """
+        Largest difference [B] between distances() on the subsample and on all
+        the vertices: each vertex is within radius of its sample, and the
+        per-vertex ADD changes by at most |R_gt - R_pr| = 2 sin(angle / 2)
+        times that (ADD-S by at most radius)
+        """
+        if self.symmetric:
+            return np.full(len(R_gt), self.radius)
+        cos = (np.trace(np.matmul(R_gt, R_pr.transpose(0, 2, 1)), axis1=1, axis2=2) - 1.0) / 2.0
+        return 2.0 * np.sqrt((1.0 - np.clip(cos, -1.0, 1.0)) / 2.0) * self.radius
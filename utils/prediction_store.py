@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# ---------------------
+# per-frame predictions of a checkpoint on a split, kept for offline re-scoring
+# ---------------------
+
+import json
+import os
+
+import numpy as np
+
+COLUMNS = ('indices', 'truths', 'corners', 'confidences', 'cells', 'R', 't')
+
+
+def store_path(store_dir, weights_file, dataset_name, testlist):
+    """
+    <store_dir>/<checkpoint>_<object>_<split>.npz, e.g. yolo_6d.ckpt-4000_ape_test.npz
+    """
+    split = os.path.splitext(os.path.basename(testlist))[0]
+    return os.path.join(store_dir, '{}_{}_{}.npz'.format(os.path.basename(weights_file), dataset_name, split))
+
+
+class PredictionStore(object):
+    """
+    Columns of every scored frame: position in the split, label [21],
+    decoded corners [9, 2] in pixels, confidence and flat index of the best
+    cell, predicted pose R [3, 3], t [3, 1]. Saved as one uncompressed .npz
+    with a json description of the run (mesh, thresholds, camera ...)
+    """
+
+    def __init__(self, **meta):
+        self.meta    = meta
+        self.columns = dict((name, []) for name in COLUMNS)
+
+    def __len__(self):
+        return sum(len(c) for c in self.columns['indices'])
+
+    def add(self, indices, truths, corners, confidences, cells, R, t):
+        for name, value in zip(COLUMNS, (indices, truths, corners, confidences, cells, R, t)):
+            self.columns[name].append(np.asarray(value))
+
+    def save(self, filename):
+        """
+        Written to a private file and moved in place
+        """
+        directory = os.path.dirname(filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        arrays = {'indices':     np.concatenate(self.columns['indices']).astype(np.int32),
+                  'truths':      np.concatenate(self.columns['truths']).astype(np.float32),
+                  'corners':     np.concatenate(self.columns['corners']).astype(np.float32),
+                  'confidences': np.concatenate(self.columns['confidences']).astype(np.float32),
+                  'cells':       np.concatenate(self.columns['cells']).astype(np.int32),
+                  'R':           np.concatenate(self.columns['R']).astype(np.float64),
+                  't':           np.concatenate(self.columns['t']).astype(np.float64)}
+        tmp = '{}.{}.tmp.npz'.format(filename, os.getpid())
+        np.savez(tmp, meta=np.array(json.dumps(self.meta)), **arrays)
+        os.replace(tmp, filename)
+        print('   {} predictions written to {}'.format(len(arrays['indices']), filename))
+
+
+def load_store(filename):
+    """
+    Return (meta dict, {column: array}) of a saved PredictionStore
+    """
+    with np.load(filename) as f:
+        meta = json.loads(str(f['meta']))
+        return meta, dict((name, f[name]) for name in COLUMNS)
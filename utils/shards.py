@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# ---------------------
+# pre-decoded, memory-mapped LINEMOD shards
+# ---------------------
+
+import json
+import os
+
+import numpy as np
+
+INDEX_FILE = 'index.json'
+
+
+def shard_dir(root, name, split):
+    """
+    Directory of the shards of one data cfg split, e.g. data/shards/ape_train
+    """
+    return os.path.join(root, '{}_{}'.format(name, split))
+
+def generation_file(directory, filename, generation):
+    """
+    Generation 0 is the first pack of a directory, the files of the next
+    ones carry their generation: images_000.u8, images_000.1.u8, ...
+    """
+    if generation:
+        root, ext = os.path.splitext(filename)
+        filename = '{}.{}{}'.format(root, generation, ext)
+    return os.path.join(directory, filename)
+
+def images_file(directory, shard, generation=0):
+    return generation_file(directory, 'images_{:03d}.u8'.format(shard), generation)
+
+def masks_file(directory, shard, generation=0):
+    return generation_file(directory, 'masks_{:03d}.u8'.format(shard), generation)
+
+def labels_file(directory, generation=0):
+    return generation_file(directory, 'labels.npy', generation)
+
+def offsets_file(directory, generation=0):
+    return generation_file(directory, 'label_offsets.npy', generation)
+
+def read_index(directory):
+    with open(os.path.join(directory, INDEX_FILE), 'r') as f:
+        return json.load(f)
+
+
+class ShardWriter(object):
+    """
+    Writes decoded uint8 images [h, w, 3], uint8 masks [h, w] and float32
+    labels [N, 21] into raw shard files plus a json index.
+    Frames must be added in order and all have the same size.
+    Packing into a directory that already holds shards writes the files of
+    a new generation next to them and the index switches to it last, so a
+    reader never sees half-written shards. The files of the previous
+    generation are deleted one pack later, readers still holding its index
+    can go on opening them.
+    """
+
+    def __init__(self, directory, num_frames, image_shape, frames_per_shard=1024):
+        self.directory        = directory
+        self.num_frames       = num_frames
+        self.image_shape      = tuple(image_shape)  # (h, w, 3)
+        self.frames_per_shard = frames_per_shard
+        self.names            = []
+        self.labels           = []
+        self.images           = None
+        self.masks            = None
+        self.shard            = -1
+        self.previous         = None  # index of the generation being replaced
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        elif os.path.exists(os.path.join(directory, INDEX_FILE)):
+            self.previous = read_index(directory)
+        self.generation = 0 if self.previous is None else self.previous.get('generation', 0) + 1
+
+    def open_shard(self, shard):
+        self.flush()
+        start = shard * self.frames_per_shard
+        count = min(self.frames_per_shard, self.num_frames - start)
+        h, w, c = self.image_shape
+        self.images = np.memmap(images_file(self.directory, shard, self.generation), np.uint8, 'w+', shape=(count, h, w, c))
+        self.masks  = np.memmap(masks_file(self.directory, shard, self.generation), np.uint8, 'w+', shape=(count, h, w))
+        self.shard  = shard
+
+    def add(self, name, image, mask, labels):
+        idx = len(self.names)
+        assert idx < self.num_frames, 'more frames than announced'
+        assert image.shape == self.image_shape, '{}: image shape {} != {}'.format(name, image.shape, self.image_shape)
+        shard, row = divmod(idx, self.frames_per_shard)
+        if shard != self.shard:
+            self.open_shard(shard)
+        self.images[row] = image
+        self.masks[row]  = mask
+        self.names.append(name)
+        self.labels.append(np.reshape(np.asarray(labels, np.float32), (-1, 21)))
+
+    def flush(self):
+        if self.images is not None:
+            self.images.flush()
+            self.masks.flush()
+            self.images = None
+            self.masks  = None
+
+    def close(self):
+        self.flush()
+        counts  = [len(l) for l in self.labels]
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        labels  = np.concatenate(self.labels) if self.labels else np.zeros((0, 21), np.float32)
+        np.save(labels_file(self.directory, self.generation), labels.astype(np.float32))
+        np.save(offsets_file(self.directory, self.generation), offsets)
+
+        index = {'names': self.names,
+                 'image_shape': list(self.image_shape),
+                 'frames_per_shard': self.frames_per_shard,
+                 'generation': self.generation}
+        if self.previous is not None:
+            index['retired'] = {'generation': self.previous.get('generation', 0),
+                                'shards': num_shards(self.previous)}
+        tmp = os.path.join(self.directory, INDEX_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        # every file is in place before the index points at it
+        os.replace(tmp, os.path.join(self.directory, INDEX_FILE))
+        if self.previous is not None and 'retired' in self.previous:
+            self.remove_generation(**self.previous['retired'])
+
+    def remove_generation(self, generation, shards):
+        """
+        Delete the files of a generation no index points at any more
+        """
+        if generation == self.generation:
+            return
+        files = [labels_file(self.directory, generation), offsets_file(self.directory, generation)]
+        for shard in range(shards):
+            files += [images_file(self.directory, shard, generation), masks_file(self.directory, shard, generation)]
+        for filename in files:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
+def num_shards(index):
+    return (len(index['names']) + index['frames_per_shard'] - 1) // index['frames_per_shard']
+
+
+class ShardReader(object):
+    """
+    Serves (image, mask, labels) of a packed split through np.memmap,
+    the arrays are read-only views so several processes share the page cache
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        index = read_index(directory)
+        self.names            = index['names']
+        self.image_shape      = tuple(index['image_shape'])
+        self.frames_per_shard = index['frames_per_shard']
+        self.generation       = index.get('generation', 0)
+        self.frame_idx        = dict((name, i) for i, name in enumerate(self.names))
+        self.labels           = np.load(labels_file(directory, self.generation))
+        self.label_offsets    = np.load(offsets_file(directory, self.generation))
+        self.images           = {}
+        self.masks            = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.frame_idx
+
+    def open_shard(self, shard):
+        h, w, c = self.image_shape
+        images = np.memmap(images_file(self.directory, shard, self.generation), np.uint8, 'r')
+        masks  = np.memmap(masks_file(self.directory, shard, self.generation), np.uint8, 'r')
+        self.images[shard] = images.reshape(-1, h, w, c)
+        self.masks[shard]  = masks.reshape(-1, h, w)
+
+    def read(self, name):
+        """
+        Return image [h, w, 3] uint8, mask [h, w] uint8 and labels [N, 21]
+        """
+        idx = self.frame_idx[name]
+        shard, row = divmod(idx, self.frames_per_shard)
+        if shard not in self.images:
+            self.open_shard(shard)
+        labels = self.labels[self.label_offsets[idx]:self.label_offsets[idx + 1]]
+        return self.images[shard][row], self.masks[shard][row], labels
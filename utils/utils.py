@@ -5,6 +5,7 @@
 # @Email: fmo@nullmax.ai
 # ---------------------
 
+import contextlib
 import os
 
 import cv2
@@ -12,6 +13,7 @@ import numpy as np
 import tensorflow as tf
 
 import yolo.config as cfg
+from utils.geometry import get_3D_corners, get_camera_intrinsic
 
 
 def sigmoid_func(x, derivative=False):
@@ -114,10 +116,11 @@ def confidence9(pred_x, pred_y, gt_x, gt_y):
     one = tf.constant(1.0, dtype=tf.float32)
     epsilon = tf.constant(cfg.EPSILON, dtype=tf.float32)
 
-    pred_x = pred_x / 13.0 * 640
-    pred_y = pred_y / 13.0 * 480
-    gt_x   = gt_x   / 13.0 * 640
-    gt_y   = gt_y   / 13.0 * 480
+    nH, nW = int(pred_x_shape[1]), int(pred_x_shape[2])
+    pred_x = pred_x / nW * cfg.IMAGE_WIDTH
+    pred_y = pred_y / nH * cfg.IMAGE_HEIGHT
+    gt_x   = gt_x   / nW * cfg.IMAGE_WIDTH
+    gt_y   = gt_y   / nH * cfg.IMAGE_HEIGHT
     dist_x = tf.squared_difference(pred_x, gt_x)
     dist_y = tf.squared_difference(pred_y, gt_y)
     dist   = tf.sqrt(dist_x + dist_y)
@@ -139,8 +142,8 @@ def get_max_index(confidence):
     confidence: 2-D tensor [cell_size, cell_size]
     return the index of maximum value of confidence
     """
-    assert(confidence.get_shape()[0]==13)
-    assert(confidence.get_shape()[1]==13)
+    assert(confidence.get_shape()[0]==cfg.CELL_SIZE)
+    assert(confidence.get_shape()[1]==cfg.CELL_SIZE)
     max_val  = tf.reduce_max(confidence)
     bool_idx = tf.equal(confidence, max_val)
     int_idx  = tf.where(bool_idx)
@@ -148,7 +151,7 @@ def get_max_index(confidence):
     maxj = int_idx[0, 1]
     return maxi, maxj
 
-def corner_confidences9(gt_corners, pr_corners, th=80, sharpness=2, im_width=640, im_height=480):
+def corner_confidences9(gt_corners, pr_corners, th=80, sharpness=2, im_width=cfg.IMAGE_WIDTH, im_height=cfg.IMAGE_HEIGHT):
     """
     gt_corners: Ground-truth 2D projections of the 3D bounding box corners, shape: (18 x 169)
     pr_corners: Prediction for the 2D projections of the 3D bounding box corners, shape: (18 x 169)
@@ -179,7 +182,7 @@ def corner_confidences9(gt_corners, pr_corners, th=80, sharpness=2, im_width=640
     mean_conf = tf.reduce_mean(conf, 1)
     return mean_conf
 
-def corner_confidence9(gt_corners, pr_corners, th=80, sharpness=2.0, im_width=640, im_height=480):
+def corner_confidence9(gt_corners, pr_corners, th=80, sharpness=2.0, im_width=cfg.IMAGE_WIDTH, im_height=cfg.IMAGE_HEIGHT):
     ''' gt_corners: Ground-truth 2D projections of the 3D bounding box corners, shape: (18,) type: tensor
         pr_corners: Prediction for the 2D projections of the 3D bounding box corners, shape: (18,), type: tensor
         th        : distance threshold, type: int
@@ -207,39 +210,120 @@ def corner_confidence9(gt_corners, pr_corners, th=80, sharpness=2.0, im_width=64
     conf  = mask * conf
     return tf.reduce_mean(conf)
 
+def corner_confidences_grid(gt_corners, pr_corners, th=80, sharpness=2.0, im_width=cfg.IMAGE_WIDTH, im_height=cfg.IMAGE_HEIGHT):
+    """
+    gt_corners: Ground-truth 2D projections of the 3D bounding box corners, shape: (..., 18), type: tensor
+    pr_corners: Prediction for the 2D projections, shape: (..., 18), broadcastable with gt_corners
+    th        : distance threshold, type: int
+    sharpness : sharpness of the exponential that assigns a confidence value to the distance
+    -----------
+    return    : a tensor of shape (...) with the mean confidence of the 9 corners
+    """
+    dist   = gt_corners - pr_corners
+    dist_x = dist[..., 0::2] * im_width
+    dist_y = dist[..., 1::2] * im_height
+    dist   = tf.sqrt(tf.square(dist_x) + tf.square(dist_y))  # (..., 9)
+
+    mask  = tf.cast(dist < th, tf.float32)
+    conf  = tf.exp(sharpness * (1.0 - dist / th)) - 1.0
+    conf0 = np.exp(sharpness) - 1.0 + cfg.EPSILON
+    conf  = mask * conf / conf0
+    return tf.reduce_mean(conf, -1)
+
 def get_predict_boxes(output, num_classes):
-    h, w, _ = output.shape[0], output.shape[1], output.shape[2]
-    output_coord = output[:, :, :18]
-    output_coord = np.concatenate([sigmoid_func(output_coord[:, :, :2]), output_coord[:, :, 2:]], 2)
-    # output_cls   = output[:, :, 18:-1]
-    output_conf  = output[:, :, -1]
-
-    max_conf = np.max(output_conf)
-    max_conf_id = np.where(output_conf == max_conf)
-    idi, idj = max_conf_id[0][0], max_conf_id[1][0]
-
-    xc = output_coord[idi][idj][0] + idj
-    yc = output_coord[idi][idj][1] + idi
-    x1 = output_coord[idi][idj][2] + idj
-    y1 = output_coord[idi][idj][3] + idi
-    x2 = output_coord[idi][idj][4] + idj
-    y2 = output_coord[idi][idj][5] + idi
-    x3 = output_coord[idi][idj][6] + idj
-    y3 = output_coord[idi][idj][7] + idi
-    x4 = output_coord[idi][idj][8] + idj
-    y4 = output_coord[idi][idj][9] + idi
-    x5 = output_coord[idi][idj][10] + idj
-    y5 = output_coord[idi][idj][11] + idi
-    x6 = output_coord[idi][idj][12] + idj
-    y6 = output_coord[idi][idj][13] + idi
-    x7 = output_coord[idi][idj][14] + idj
-    y7 = output_coord[idi][idj][15] + idi
-    x8 = output_coord[idi][idj][16] + idj
-    y8 = output_coord[idi][idj][17] + idi
-
-    box = [xc/13, yc/13, x1/13, y1/13, x2/13, y2/13, x3/13, y3/13, x4/13, y4/13,
-           x5/13, y5/13, x6/13, y6/13, x7/13, y7/13, x8/13, y8/13]
-    return box
+    """
+    Box (18 normalized coords) of the most confident cell, whatever its class
+    output: [cell, cell, 19 + num_classes], coords(18) ==> confidence(1) ==> classes
+    """
+    output_conf = output[:, :, 18]
+    max_conf_id = np.where(output_conf == np.max(output_conf))
+    return cell_box(output, max_conf_id[0][0], max_conf_id[1][0])
+
+def get_predict_boxes_per_class(output, num_classes):
+    """
+    One box per class from a single output map: for class c the cell with the
+    highest confidence * p(c | object) is decoded
+    output: [cell, cell, 19 + num_classes]
+    Return boxes [num_classes, 18] (normalized coords) and scores [num_classes]
+    """
+    h, w = output.shape[:2]
+    conf  = sigmoid_func(output[:, :, 18:19])
+    cls   = softmax(output[:, :, 19:19 + num_classes], axis=2)
+    score = np.reshape(conf * cls, [h * w, num_classes])
+
+    cells  = np.argmax(score, 0)
+    boxes  = np.array([cell_box(output, cell // w, cell % w) for cell in cells], np.float32)
+    return boxes, score[cells, np.arange(num_classes)]
+
+def get_detections(outputs, num_classes, conf_thresh=cfg.CONF_THRESHOLD, nms_thresh=cfg.NMS_THRESHOLD,
+                   top_k=cfg.NMS_TOP_K):
+    """
+    Every instance of a batch of output maps: the top_k cells of every image
+    scoring (confidence * best class probability) above conf_thresh, then
+    keypoint-aware NMS, a box is dropped when its 9 points match those of a
+    kept better box of the same class with a corner confidence above nms_thresh.
+    Candidates and suppression are computed for the whole batch at once
+    outputs: [batch, cell, cell, 19 + num_classes], scaled by cfg.OUTPUT_SCALE (as in Solver.test),
+             the scores are those of the logits the loss was trained on
+    Return a list of [K, 20] arrays per image, best first:
+           9 x (x, y) normalized coords(18) ==> score(1) ==> class(1)
+    """
+    nB, h, w = outputs.shape[:3]
+    coords = np.array(outputs[..., :18], np.float64)
+    coords[..., :2] = sigmoid_func(coords[..., :2])
+    coords[..., 0::2] = (coords[..., 0::2] + np.arange(w).reshape(1, 1, w, 1)) / w
+    coords[..., 1::2] = (coords[..., 1::2] + np.arange(h).reshape(1, h, 1, 1)) / h
+    logits = outputs[..., 18:19 + num_classes] / cfg.OUTPUT_SCALE
+    conf = sigmoid_func(logits[..., 0])
+    if num_classes > 1:
+        cls   = softmax(logits[..., 1:], axis=3)
+        label = np.argmax(cls, 3)
+        score = conf * np.max(cls, 3)
+    else:
+        label = np.zeros(conf.shape, np.int64)
+        score = conf
+    dets = np.concatenate([coords, score[..., None], label[..., None]], 3).reshape(nB, h * w, 20)
+
+    # top_k candidates of every image, best first [batch, K, 20]
+    order = np.argsort(-dets[:, :, 18], 1)[:, :top_k]
+    cand  = dets[np.arange(nB)[:, None], order]
+    valid = cand[:, :, 18] > conf_thresh  # [batch, K]
+
+    # i suppresses j: i ranks first, same class, 9 points close enough [batch, K, K]
+    K = cand.shape[1]
+    suppress = corner_confidences_np(cand[:, :, None, :18], cand[:, None, :, :18]) > nms_thresh
+    suppress &= cand[:, :, None, 19] == cand[:, None, :, 19]
+    suppress &= np.triu(np.ones((K, K), bool), 1)
+    # greedy NMS as a fixed point: a box is kept unless a kept box suppresses it,
+    # after n rounds the n best boxes are settled, it usually takes a few
+    keep = valid
+    for _ in range(K):
+        update = valid & ~np.any(suppress & keep[:, :, None], 1)
+        if np.array_equal(update, keep):
+            break
+        keep = update
+    return [cand[b][keep[b]].astype(np.float32) for b in range(nB)]
+
+def corner_confidences_np(gt_corners, pr_corners, th=80, sharpness=2.0, im_width=cfg.IMAGE_WIDTH, im_height=cfg.IMAGE_HEIGHT):
+    """
+    NumPy version of corner_confidences_grid, shapes (..., 18) broadcastable
+    """
+    dist = np.reshape(gt_corners - pr_corners, np.broadcast(gt_corners, pr_corners).shape[:-1] + (9, 2))
+    dist = np.sqrt(np.sum(np.square(dist * np.array([im_width, im_height])), -1))  # (..., 9)
+    conf = (np.exp(sharpness * (1.0 - dist / th)) - 1.0) * (dist < th)
+    return np.mean(conf / (np.exp(sharpness) - 1.0 + cfg.EPSILON), -1)
+
+def cell_box(output, idi, idj):
+    """
+    Decode the 9 points predicted by the cell (row idi, column idj),
+    x normalized by the grid width and y by the grid height
+    """
+    h, w = float(output.shape[0]), float(output.shape[1])
+    coord = np.array(output[idi, idj, :18], np.float64)
+    coord[:2] = sigmoid_func(coord[:2])
+    coord[0::2] = (coord[0::2] + idj) / w
+    coord[1::2] = (coord[1::2] + idi) / h
+    return list(coord)
 
 def calcAngularDistance(gt_rot, pr_rot):
     rotDiff = np.dot(gt_rot, np.transpose(pr_rot))
@@ -276,6 +360,23 @@ def pnp(points_3D, points_2D, cameraMatrix):
     # Rt = np.c_[R, t]
     return R, t
 
+@contextlib.contextmanager
+def xla_scope(enabled=True):
+    """
+    Ops created inside are JIT-compiled with XLA (on CPU as well), the
+    gradients tf.gradients builds for them are compiled with them
+    """
+    if not enabled:
+        yield
+        return
+    try:
+        jit_scope = tf.xla.experimental.jit_scope
+    except AttributeError:
+        from tensorflow.contrib.compiler import jit
+        jit_scope = jit.experimental_jit_scope
+    with jit_scope():
+        yield
+
 ###############################################################################
 
 def get_all_files(directory):
@@ -291,10 +392,10 @@ def get_all_files(directory):
 def read_truths(lab_path):
     if os.path.getsize(lab_path):
         truths = np.loadtxt(lab_path)
-        truths = truths.reshape(truths.size/21, 21) # to avoid single truth problem
+        truths = truths.reshape(-1, 21) # to avoid single truth problem
         return truths
     else:
-        return np.array([])
+        return np.zeros((0, 21))
 
 def read_truths_args(lab_path, min_box_scale):
     truths = read_truths(lab_path)
@@ -333,34 +434,29 @@ def read_data_cfg(datacfg):
         options[key] = value
     return options
 
+def parse_cfg(cfgfile):
+    """
+    Read a Darknet network cfg into a list of blocks,
+    every block is a dict of its options plus 'type' ('net', 'convolutional', ...)
+    """
+    blocks = []
+    block  = None
+    with open(cfgfile, 'r') as fp:
+        lines = fp.readlines()
+
+    for line in lines:
+        line = line.split('#')[0].strip()
+        if line == '':
+            continue
+        if line[0] == '[':
+            block = dict()
+            block['type'] = line.lstrip('[').rstrip(']').strip()
+            blocks.append(block)
+        else:
+            key,value = line.split('=')
+            block[key.strip()] = value.strip()
+    return blocks
+
 def makedirs(path):
     if not os.path.exists(path):
         os.makedirs(path)
-
-def get_3D_corners(vertices):
-
-    min_x = np.min(vertices[0,:])
-    max_x = np.max(vertices[0,:])
-    min_y = np.min(vertices[1,:])
-    max_y = np.max(vertices[1,:])
-    min_z = np.min(vertices[2,:])
-    max_z = np.max(vertices[2,:])
-
-    corners = np.array([[min_x, min_y, min_z],
-                        [min_x, min_y, max_z],
-                        [min_x, max_y, min_z],
-                        [min_x, max_y, max_z],
-                        [max_x, min_y, min_z],
-                        [max_x, min_y, max_z],
-                        [max_x, max_y, min_z],
-                        [max_x, max_y, max_z]])
-
-    corners = np.concatenate((np.transpose(corners), np.ones((1,8)) ), axis=0)
-    return corners
-
-def get_camera_intrinsic():
-    K = np.zeros((3, 3), dtype='float64')
-    K[0, 0], K[0, 2] = 572.4114, 325.2611
-    K[1, 1], K[1, 2] = 573.5704, 242.0489
-    K[2, 2] = 1.
-    return K
@@ -23,28 +23,43 @@ WEIGHTS_FILE = os.path.join(WEIGHTS_DIR, 'yolo_6d.ckpt')
 
 FLIPPED = True
 
+##LINEMOD camera frame, labels are normalized to it
+IMAGE_WIDTH  = 640
+IMAGE_HEIGHT = 480
+
+##Background parameters
+BG_DIR          = os.path.join('VOCdevkit', 'VOC2012', 'JPEGImages')
+BG_POOL_SIZE    = 2000   # 0: open a random VOC file for every batch
+BG_POOL_REFRESH = 200    # pool slots replaced after every epoch, by one of the trainers sharing it
+
 ##Network parameters
+NET_CFG      = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cfg', 'yolo-pose.cfg')
 NUM_CLASSES  = 13
 BATCH_SIZE   = 4
 WEIGHT_DECAY = 0.0005
 EPSILON      = 1e-5
 OPTIMIZER    = 'ADAMS'
-IMAGE_SIZE   = 416
+IMAGE_SIZE   = 416   # network input, a multiple of 32: 320, 416, 512, 608
 CHANNELS     = 3
 BATCH_NORM   = True
+XLA          = False  # JIT-compile forward pass, loss and gradients (see benchmark.py --task xla)
 
 ALPHA = 2.0
 Dth   = 80.0
 
-CELL_SIZE = 13
+CELL_SIZE = IMAGE_SIZE // 32   # output grid, the network downsamples 32 times
 NUM_COORD = 18
 
 BOXES_PER_CELL   = 1
+MAX_OBJECTS      = 8  # labels per training image, several instances in cluttered scenes (Occlusion-LINEMOD)
 CONF_OBJ_SCALE   = 4.9
 CONF_NOOBJ_SCALE = 0.1
 CLASS_SCALE      = 1.0
 COORD_SCALE      = 1.0
 
+DISTILL_SCALE      = 1.0  # weight of the teacher mimic loss (distill.py)
+DISTILL_HARD_SCALE = 1.0  # weight of the ground truth loss when distilling
+
 #Training parameters
 GPU = '2'
 LEARNING_RATE  = 0.0001
@@ -62,6 +77,24 @@ SUMMARY_ITER = 10
 SAVE_ITER    = 50
 
 #Test parameters
-CONF_THRESHOLD = 0.1
+CONF_THRESHOLD = 0.1   # cells less confident are left out of the 3x3 refinement (utils/decode.py) and of get_detections
 NMS_THRESHOLD  = 0.4
+NMS_TOP_K      = 50    # best cells of an image going through the keypoint NMS (get_detections)
 IOU_THRESHOLD  = 0.5
+OUTPUT_SCALE   = 10.0  # the output map is scaled by this before decoding
+DECODE_TOP_K   = 1     # best cells decoded inside the graph (net.detections), 0: no decode head
+DECODE_REFINE  = False # average the keypoints of the 3x3 cells around the best one, weighted by confidence (utils/decode.py)
+PNP_REFINE_PX  = 10.0  # poses reprojecting worse than this (pixels) are restarted from several rotations, 0: never
+GT_CACHE       = True  # solve the ground truth poses of a valid list once, cached next to it (utils/gt_cache.py)
+ADD_POINTS     = 0     # ADD / ADD-S averaged over this many farthest point samples of the mesh vertices, 0: all
+SYMMETRIC_OBJECTS = ['eggbox', 'glue']  # scored with ADD-S
+
+
+def set_image_size(size):
+    """
+    Change the network input resolution, the output grid follows
+    """
+    global IMAGE_SIZE, CELL_SIZE
+    assert size % 32 == 0, 'image size must be a multiple of 32, got {}'.format(size)
+    IMAGE_SIZE = size
+    CELL_SIZE  = size // 32
@@ -16,11 +16,20 @@ from utils.utils import *
 class YOLO6D_net:
 
 
-    def __init__(self, is_training=True):
+    def __init__(self, is_training=True, weights=None, xla=None, cfgfile=None, distill=False, top_k=None):
         """
-        Input images: [batch, 416 * 416 * 3]
-        Input labels: [batch * 13 * 13 * (19 + num_classes)]
-        output tensor: [batch, 13 * 13 * (19 + num_classes)]
+        Input images: [batch, size * size * 3], size = cfg.IMAGE_SIZE, the batch dimension is dynamic
+        Input target: [batch, M * 21], M labels (class, 9 x (x, y) normalized coords, x range, y range)
+        output tensor: [batch, cell * cell * (19 + num_classes)], cell = size / 32
+        detections: [batch, top_k, 20] decoded best cells (see decode_layer), None when top_k is 0
+        detection_cells: [batch, top_k] flat indices (row * cell + column) of these cells
+        weights: optional {layer name: (weight, biases)} with batch norm folded in,
+                 builds a constant inference graph without variables (see export.py)
+        xla: compile the network and the loss with XLA, cfg.XLA when None
+        cfgfile: Darknet cfg of the layers, cfg.NET_CFG when None
+        distill: add the teacher_logit input [batch, cell, cell, 20] and train
+                 to mimic it as well (see distill.py)
+        top_k: cells decoded inside the graph, cfg.DECODE_TOP_K when None
         """
         self.is_training    = is_training
         self.Batch_Size     = cfg.BATCH_SIZE
@@ -30,6 +39,9 @@ class YOLO6D_net:
         self.disp           = cfg.DISP
         self.boxes_per_cell = cfg.BOXES_PER_CELL
         self.image_size     = cfg.IMAGE_SIZE
+        self.im_width       = cfg.IMAGE_WIDTH
+        self.im_height      = cfg.IMAGE_HEIGHT
+        self.output_scale   = cfg.OUTPUT_SCALE
 
         self.num_class  = cfg.NUM_CLASSES
         self.Batch_Norm = cfg.BATCH_NORM
@@ -39,77 +51,98 @@ class YOLO6D_net:
         self.noobj_scale = cfg.CONF_NOOBJ_SCALE
         self.class_scale = cfg.CLASS_SCALE
         self.coord_scale = cfg.COORD_SCALE
+        self.distill_scale      = cfg.DISTILL_SCALE
+        self.distill_hard_scale = cfg.DISTILL_HARD_SCALE
         self.thresh      = 0.6
 
         self.boundry_1 = 9 * 2   ## Seperate coordinates
         self.boundry_2 = self.num_class
+        self.weights   = weights
+        self.xla       = cfg.XLA if xla is None else xla
+        self.cfgfile   = cfg.NET_CFG if cfgfile is None else cfgfile
+        self.top_k     = cfg.DECODE_TOP_K if top_k is None else top_k
+        self.detections = None
+        self.detection_cells = None
+        self.blocks    = [b for b in parse_cfg(self.cfgfile) if b['type'] not in ('net', 'region')]
+        self.variables = []      ## network variables, in creation order
+        self.layers    = []      ## {variable name: variable} of every conv layer, in creation order
+
+        self.input_images = tf.placeholder(tf.float32, [None, self.image_size, self.image_size, 3], name='images')
 
-        self.input_images = tf.placeholder(tf.float32, [self.Batch_Size, self.image_size, self.image_size, 3], name='images')
-
-        self.logit = self.build_networks(self.input_images)
+        if self.is_training:
+            self.target = tf.placeholder(tf.float32, [None, None], name='target')  # [batch, M * 21]
+            if distill:
+                self.teacher_logit = tf.placeholder(tf.float32, [None, self.cell_size, self.cell_size, None], name='teacher_logit')
+
+        with xla_scope(self.xla):
+            self.logit = tf.identity(self.build_networks(self.input_images), name='logit')
+            if self.top_k > 0:
+                detections, cells = self.decode_layer(self.logit, self.top_k)
+                self.detections      = tf.identity(detections, name='detections')
+                self.detection_cells = tf.identity(cells, name='detection_cells')
+
+            if self.is_training:
+                self.total_loss = self.Region_Loss(self.logit, self.target)
+                # self.total_loss = self.loss_layer(self.logit, self.labels)
+                if distill:
+                    self.total_loss = self.Distill_Loss(self.logit, self.teacher_logit, self.total_loss)
 
         if self.is_training:
-            self.labels     = tf.placeholder(tf.float32, [self.Batch_Size, self.cell_size, self.cell_size, 20], name='labels')
-            self.target     = tf.placeholder(tf.float32, [self.Batch_Size, 21], name='target')
-            self.total_loss = self.Region_Loss(self.logit, self.target, self.labels)
-            # self.total_loss = self.loss_layer(self.logit, self.labels)
             tf.summary.tensor_summary('Total loss', self.total_loss)
 
 # ======================== Net definition ==================================
 
     def build_networks(self, inputs):
+        """
+        Build the layers of the Darknet cfg in order, the i-th layer is named
+        '{i}_conv' / '{i}_pool' (cfg/yolo-pose.cfg gives 0_conv ... 30_conv)
+        route layers concatenate earlier outputs on the channel axis
+        """
         if self.disp:
             print("\n--------------Building network---------------")
-        net = self.conv_layer(inputs, [3, 3, 3, 32], name = '0_conv')
-
-        net = self.pooling_layer(net, name = '1_pool')
-        net = self.conv_layer(net, [3, 3, 32, 64], name = '2_conv')
-
-        net = self.pooling_layer(net, name = '3_pool')
-        net = self.conv_layer(net, [3, 3, 64, 128], name = '4_conv')
-        net = self.conv_layer(net, [1, 1, 128, 64], name = '5_conv')
-        net = self.conv_layer(net, [3, 3, 64, 128], name = '6_conv')
-
-        net = self.pooling_layer(net, name = '7_pool')
-        net = self.conv_layer(net, [3, 3, 128, 256], name = '8_conv')
-        net = self.conv_layer(net, [1, 1, 256, 128], name = '9_conv')
-        net = self.conv_layer(net, [3, 3, 128, 256], name = '10_conv')
-
-        net = self.pooling_layer(net, name = '11_pool')
-        net = self.conv_layer(net, [3, 3, 256, 512], name = '12_conv')
-        net = self.conv_layer(net, [1, 1, 512, 256], name = '13_conv')
-        net = self.conv_layer(net, [3, 3, 256, 512], name = '14_conv')
-        net = self.conv_layer(net, [1, 1, 512, 256], name = '15_conv')
-        net16 = self.conv_layer(net, [3, 3, 256, 512], name = '16_conv')
-
-        net = self.pooling_layer(net16, name = '17_pool')
-        net = self.conv_layer(net, [3, 3, 512, 1024], name = '18_conv')
-        net = self.conv_layer(net, [1, 1, 1024, 512], name = '19_conv')
-        net = self.conv_layer(net, [3, 3, 512, 1024], name = '20_conv')
-        net = self.conv_layer(net, [1, 1, 1024, 512], name = '21_conv')
-        net = self.conv_layer(net, [3, 3, 512, 1024], name = '22_conv')
-        net = self.conv_layer(net, [3, 3, 1024, 1024], name = '23_conv')
-        net24 = self.conv_layer(net, [3, 3, 1024, 1024], name = '24_conv')
-
-        net = self.conv_layer(net16, [1, 1, 512, 64], name = '26_conv')
-        net = self.reorg(net)
-
-        net = tf.concat([net, net24], 3)
-
-        net = self.conv_layer(net, [3, 3, int(net.get_shape()[3]), 1024], name = '29_conv')
-        net = self.conv_layer(net, [1, 1, 1024, 20], batch_norm=False, name = '30_conv', activation='linear')
+        outputs = []
+        net = inputs
+        for idx, block in enumerate(self.blocks):
+            layer_type = block['type']
+            if layer_type == 'convolutional':
+                size       = int(block['size'])
+                shape      = [size, size, int(net.get_shape()[3]), int(block['filters'])]
+                batch_norm = int(block.get('batch_normalize', 0)) == 1
+                net = self.conv_layer(net, shape, batch_norm=batch_norm, name='{}_conv'.format(idx),
+                                      activation=block['activation'], stride=int(block.get('stride', 1)))
+            elif layer_type == 'maxpool':
+                net = self.pooling_layer(net, name='{}_pool'.format(idx),
+                                         size=int(block['size']), stride=int(block['stride']))
+            elif layer_type == 'reorg':
+                net = self.reorg(net, int(block['stride']))
+            elif layer_type == 'route':
+                layers = [int(i) for i in block['layers'].split(',')]
+                layers = [idx + i if i < 0 else i for i in layers]
+                if len(layers) == 1:
+                    net = outputs[layers[0]]
+                else:
+                    net = tf.concat([outputs[i] for i in layers], 3)
+            else:
+                raise ValueError('{}: unknown layer type [{}]'.format(self.cfgfile, layer_type))
+            outputs.append(net)
 
         if self.disp:
             print("----------Building network complete----------\n")
         return net
 
-    def conv_layer(self, inputs, shape, batch_norm = True, name = '0_conv', activation = 'leaky'):
+    def conv_layer(self, inputs, shape, batch_norm = True, name = '0_conv', activation = 'leaky', stride = 1):
+        if self.weights is not None:
+            return self.folded_conv_layer(inputs, name, activation, stride)
+
         initializer = tf.contrib.layers.xavier_initializer()
         weight = tf.Variable(initializer(shape), name='weight')
         # weight = tf.Variable(tf.truncated_normal(shape, stddev=0.1), name='weight')
         biases = tf.Variable(tf.constant(1.0, shape=[shape[3]]), name='biases')
+        self.variables.extend([weight, biases])
+        layer = {'name': name, 'weight': weight, 'biases': biases}
+        self.layers.append(layer)
 
-        conv = tf.nn.conv2d(inputs, weight, strides=[1, 1, 1, 1], padding='SAME', name=name)
+        conv = tf.nn.conv2d(inputs, weight, strides=[1, stride, stride, 1], padding='SAME', name=name)
 
         if batch_norm:
             depth = shape[3]
@@ -117,6 +150,8 @@ class YOLO6D_net:
             shift = tf.Variable(tf.zeros([depth, ], dtype='float32'), name='shift')
             mean = tf.Variable(tf.ones([depth, ], dtype='float32'), name='rolling_mean')
             variance = tf.Variable(tf.ones([depth, ], dtype='float32'), name='rolling_variance')
+            self.variables.extend([scale, shift, mean, variance])
+            layer.update({'scale': scale, 'shift': shift, 'rolling_mean': mean, 'rolling_variance': variance})
 
             conv = tf.nn.batch_normalization(conv, mean, variance, shift, scale, 1e-05)
             conv = tf.add(conv, biases)
@@ -132,113 +167,133 @@ class YOLO6D_net:
 
         return conv
 
-    def pooling_layer(self, inputs, name = '1_pool'):
-        pool = tf.nn.max_pool(inputs, ksize = [1, 2, 2, 1], strides = [1, 2, 2, 1], padding = 'SAME', name = name)
+    def folded_conv_layer(self, inputs, name, activation, stride=1):
+        """
+        Inference only: conv with constant weights, batch norm already folded into them
+        """
+        weight, biases = self.weights[name]
+        conv = tf.nn.conv2d(inputs, tf.constant(weight), strides=[1, stride, stride, 1], padding='SAME', name=name)
+        conv = tf.nn.bias_add(conv, tf.constant(biases))
+
+        if activation == 'leaky':
+            conv = tf.nn.leaky_relu(conv, alpha=0.1)
+        elif activation == 'relu':
+            conv = tf.nn.relu(conv)
+        return conv
+
+    def pooling_layer(self, inputs, name = '1_pool', size = 2, stride = 2):
+        pool = tf.nn.max_pool(inputs, ksize = [1, size, size, 1], strides = [1, stride, stride, 1], padding = 'SAME', name = name)
         return pool
 
-    def reorg(self, inputs):
+    def reorg(self, inputs, stride = 2):
         """
-        Reorg the tensor(half the size, 4* the depth)
+        Reorg the tensor(1/stride the size, stride^2 * the depth) with one op.
+        Output channel (dy * stride + dx) * depth + c holds input[y * stride + dy, x * stride + dx, c],
+        the same order as the concat of the strided slices [::2, ::2], [::2, 1::2], [1::2, ::2], [1::2, 1::2]
         """
-        outputs_1 = inputs[:, ::2, ::2, :]
-        outputs_2 = inputs[:, ::2, 1::2, :]
-        outputs_3 = inputs[:, 1::2, ::2, :]
-        outputs_4 = inputs[:, 1::2, 1::2, :]
-        output = tf.concat([outputs_1, outputs_2, outputs_3, outputs_4], axis = 3)
-        return output
+        return tf.space_to_depth(inputs, stride)
 
 # ======================= Net definition end ===============================
 
-    def Region_Loss(self, output, target, labels, scope='Loss'):
+    def decode_layer(self, output, k, scope='Decode'):
         """
-        output: output from net, [batch, cell, cell, 20], type: tf.tensor
-        target: ground truth, [batch, 21], type: tf.tensor
-        labels: ground truth, [batch, cell, cell, 19] type: tf.tensor
+        Decode the k best cells of every image inside the graph, the session
+        then returns [batch, k, 20] instead of the whole output map
+        output: [batch, cell, cell, 19 + nC], scaled by cfg.OUTPUT_SCALE first (as in Solver.test)
+        return: [batch, k, 20], best first: 9 x (x, y) pixel coords of the camera frame(18) ==>
+                score(1) ==> class(1), score is the confidence (times the class probability when nC > 1),
+                and the flat indices of these cells [batch, k]
         """
         shape = output.get_shape()
-        nB = shape[0].value
-        nC = 1
         nH = shape[1].value
         nW = shape[2].value
+        nC = shape[3].value - 19
 
         with tf.variable_scope(scope):
-            x0  = tf.reshape(tf.nn.sigmoid(output[:,:,:,0]), (nB, nH, nW))
-            y0  = tf.reshape(tf.nn.sigmoid(output[:,:,:,1]), (nB, nH, nW))
-            x1  = tf.reshape(output[:,:,:,2], (nB, nH, nW))
-            y1  = tf.reshape(output[:,:,:,3], (nB, nH, nW))
-            x2  = tf.reshape(output[:,:,:,4], (nB, nH, nW))
-            y2  = tf.reshape(output[:,:,:,5], (nB, nH, nW))
-            x3  = tf.reshape(output[:,:,:,6], (nB, nH, nW))
-            y3  = tf.reshape(output[:,:,:,7], (nB, nH, nW))
-            x4  = tf.reshape(output[:,:,:,8], (nB, nH, nW))
-            y4  = tf.reshape(output[:,:,:,9], (nB, nH, nW))
-            x5  = tf.reshape(output[:,:,:,10], (nB, nH, nW))
-            y5  = tf.reshape(output[:,:,:,11], (nB, nH, nW))
-            x6  = tf.reshape(output[:,:,:,12], (nB, nH, nW))
-            y6  = tf.reshape(output[:,:,:,13], (nB, nH, nW))
-            x7  = tf.reshape(output[:,:,:,14], (nB, nH, nW))
-            y7  = tf.reshape(output[:,:,:,15], (nB, nH, nW))
-            x8  = tf.reshape(output[:,:,:,16], (nB, nH, nW))
-            y8  = tf.reshape(output[:,:,:,17], (nB, nH, nW))
-            conf = tf.reshape(tf.nn.sigmoid(output[:,:,:,18]), (nB, nH, nW))
-            # cls  = tf.reshape(output[:,:,:,19], (nB, nH, nW))
-
-            # Create pred boxes
-            pred_corners = np.zeros([18, nB*nH*nW], dtype=np.float32)  # [18, batch*169]
-            pred_corners = []
-            grid_x = np.tile(np.tile(np.linspace(0, nW-1, nW), (nH, 1)), (nB, 1, 1)).reshape(nB*nH*nW) # [batch*169]
-            grid_y = np.tile(np.tile(np.linspace(0, nH-1, nH), (nW, 1)), (nB, 1, 1)).reshape(nB*nH*nW) # [batch*169]
-            pred_corners.append((tf.reshape(x0, [nB*nH*nW]) + grid_x) / nW)
-            pred_corners.append((tf.reshape(y0, [nB*nH*nW]) + grid_y) / nH)
-            pred_corners.append((tf.reshape(x1, [nB*nH*nW]) + grid_x) / nW)
-            pred_corners.append((tf.reshape(y1, [nB*nH*nW]) + grid_y) / nH)
-            pred_corners.append((tf.reshape(x2, [nB*nH*nW]) + grid_x) / nW)
-            pred_corners.append((tf.reshape(y2, [nB*nH*nW]) + grid_y) / nH)
-            pred_corners.append((tf.reshape(x3, [nB*nH*nW]) + grid_x) / nW)
-            pred_corners.append((tf.reshape(y3, [nB*nH*nW]) + grid_y) / nH)
-            pred_corners.append((tf.reshape(x4, [nB*nH*nW]) + grid_x) / nW)
-            pred_corners.append((tf.reshape(y4, [nB*nH*nW]) + grid_y) / nH)
-            pred_corners.append((tf.reshape(x5, [nB*nH*nW]) + grid_x) / nW)
-            pred_corners.append((tf.reshape(y5, [nB*nH*nW]) + grid_y) / nH)
-            pred_corners.append((tf.reshape(x6, [nB*nH*nW]) + grid_x) / nW)
-            pred_corners.append((tf.reshape(y6, [nB*nH*nW]) + grid_y) / nH)
-            pred_corners.append((tf.reshape(x7, [nB*nH*nW]) + grid_x) / nW)
-            pred_corners.append((tf.reshape(y7, [nB*nH*nW]) + grid_y) / nH)
-            pred_corners.append((tf.reshape(x8, [nB*nH*nW]) + grid_x) / nW)
-            pred_corners.append((tf.reshape(y8, [nB*nH*nW]) + grid_y) / nH)
-            pred_corners = tf.convert_to_tensor(pred_corners)
-            pred_corners = tf.reshape(tf.transpose(pred_corners, (0,1)), (-1, 18))  #(nB X 169) X 18
+            logits = output
+            output = output * self.output_scale
+            coords = tf.concat([tf.nn.sigmoid(output[:, :, :, :2]), output[:, :, :, 2:18]], 3)
+            pixels = (coords + self.corner_offsets(nH, nW)) * \
+                np.tile(np.array([self.im_width / float(nW), self.im_height / float(nH)], np.float32), 9)
+            # scores of the unscaled logits the loss trained, ranked in log space
+            log_score = tf.log_sigmoid(logits[:, :, :, 18])
+            if nC > 1:
+                log_cls   = tf.nn.log_softmax(logits[:, :, :, 19:])
+                log_score = log_score + tf.reduce_max(log_cls, 3)
+                label     = tf.cast(tf.argmax(log_cls, 3), tf.float32)
+            else:
+                label     = tf.zeros_like(log_score)
+            boxes = tf.reshape(tf.concat([pixels, tf.stack([tf.exp(log_score), label], 3)], 3), [-1, nH * nW, 20])
+
+            _, cells = tf.nn.top_k(tf.reshape(log_score, [-1, nH * nW]), k)  # [batch, k]
+            batch    = tf.tile(tf.expand_dims(tf.range(tf.shape(cells)[0]), 1), [1, k])
+            return tf.gather_nd(boxes, tf.stack([batch, cells], 2)), cells
+
+    def scatter_labels(self, target, nH, nW):
+        """
+        Build the label grid from the compact target inside the graph
+        target: ground truth, [batch, M, 21], all-zero rows are padding
+        return: labels [batch, nH, nW, 20], response(1) ==> cell relative coords(18) ==> class(1),
+                zero everywhere but in the cells (row y, column x) holding an object center,
+                and owner [batch, nH * nW, M], the object assigned to every cell
+                (the last one when several centers fall into the same cell)
+        """
+        M     = tf.shape(target)[1]
+        valid = tf.cast(tf.reduce_max(tf.abs(target[:, :, 1:19]), 2) > 0, tf.float32)  # [batch, M]
+        gi = tf.cast(tf.floor(target[:, :, 1] * nW), tf.int32)  # column
+        gj = tf.cast(tf.floor(target[:, :, 2] * nH), tf.int32)  # row
+        centers = tf.one_hot(gj * nW + gi, nH * nW) * tf.expand_dims(valid, 2)  # [batch, M, cells]
+
+        rank  = centers * tf.reshape(tf.cast(tf.range(1, M + 1), tf.float32), [1, -1, 1])
+        owner = tf.one_hot(tf.argmax(rank, 1), M) * tf.expand_dims(tf.reduce_max(centers, 1), 2)
+
+        scale  = np.tile(np.array([nW, nH], np.float32), 9)  # [18,]
+        offset = tf.cast(tf.tile(tf.stack([gi, gj], 2), [1, 1, 9]), tf.float32)  # [batch, M, 18]
+        coords = target[:, :, 1:19] * scale - offset
+        values = tf.concat([tf.ones_like(target[:, :, :1]), coords, target[:, :, :1]], 2)  # [batch, M, 20]
+
+        labels = tf.reshape(tf.matmul(owner, values), [-1, nH, nW, 20])
+        return labels, owner
+
+    def Region_Loss(self, output, target, scope='Loss'):
+        """
+        output: output from net, [batch, cell, cell, 19 + nC], type: tf.tensor
+        target: ground truth, [batch, M * 21] (M objects per image, see cfg.MAX_OBJECTS), type: tf.tensor
+        All the cells of all the images are handled by the same ops,
+        so the op count does not depend on the batch size.
+        With several classes (nC > 1) the responsible cells also learn the class
+        """
+        shape = output.get_shape()
+        nH = shape[1].value
+        nW = shape[2].value
+        nC = shape[3].value - 19
+
+        with tf.variable_scope(scope):
+            target   = tf.reshape(target, [tf.shape(output)[0], -1, 21])
+            labels, owner = self.scatter_labels(target, nH, nW)  # [batch, cell, cell, 20]
+            response = labels[:, :, :, 0]     # [batch, cell, cell]
+            tcoords  = labels[:, :, :, 1:19]  # [batch, cell, cell, 18]
+
+            coords = tf.concat([tf.nn.sigmoid(output[:, :, :, :2]), output[:, :, :, 2:18]], 3)  # [batch, cell, cell, 18]
+            conf   = tf.nn.sigmoid(output[:, :, :, 18])  # [batch, cell, cell]
+
+            # Create pred boxes, normalized to the image
+            pred_corners = (coords + self.corner_offsets(nH, nW)) / np.tile(np.array([nW, nH], np.float32), 9)
 
             # Build targets
-            nGT, nCorrect, coord_mask, conf_mask, cls_mask, tx0, tx1, tx2, tx3, tx4, tx5, tx6, tx7, tx8, ty0, ty1, ty2, ty3, ty4, ty5, ty6, ty7, ty8, tconf, tcls = \
-                self.build_targets(pred_corners, target, labels, nC, nH, nW, self.noobj_scale, self.obj_scale, self.thresh)
+            conf_mask, tconf = self.build_targets(pred_corners, target, owner, response, self.noobj_scale, self.obj_scale, self.thresh)
             conf_mask = tf.sqrt(conf_mask)
 
             # Create loss
             loss       = []
-            loss_x0    = tf.losses.mean_squared_error(x0*coord_mask, tx0*coord_mask, weights=self.coord_scale)/2.0
-            loss_y0    = tf.losses.mean_squared_error(y0*coord_mask, ty0*coord_mask, weights=self.coord_scale)/2.0
-            loss_x1    = tf.losses.mean_squared_error(x1*coord_mask, tx1*coord_mask, weights=self.coord_scale)/2.0
-            loss_y1    = tf.losses.mean_squared_error(y1*coord_mask, ty1*coord_mask, weights=self.coord_scale)/2.0
-            loss_x2    = tf.losses.mean_squared_error(x2*coord_mask, tx2*coord_mask, weights=self.coord_scale)/2.0
-            loss_y2    = tf.losses.mean_squared_error(y2*coord_mask, ty2*coord_mask, weights=self.coord_scale)/2.0
-            loss_x3    = tf.losses.mean_squared_error(x3*coord_mask, tx3*coord_mask, weights=self.coord_scale)/2.0
-            loss_y3    = tf.losses.mean_squared_error(y3*coord_mask, ty3*coord_mask, weights=self.coord_scale)/2.0
-            loss_x4    = tf.losses.mean_squared_error(x4*coord_mask, tx4*coord_mask, weights=self.coord_scale)/2.0
-            loss_y4    = tf.losses.mean_squared_error(y4*coord_mask, ty4*coord_mask, weights=self.coord_scale)/2.0
-            loss_x5    = tf.losses.mean_squared_error(x5*coord_mask, tx5*coord_mask, weights=self.coord_scale)/2.0
-            loss_y5    = tf.losses.mean_squared_error(y5*coord_mask, ty5*coord_mask, weights=self.coord_scale)/2.0
-            loss_x6    = tf.losses.mean_squared_error(x6*coord_mask, tx6*coord_mask, weights=self.coord_scale)/2.0
-            loss_y6    = tf.losses.mean_squared_error(y6*coord_mask, ty6*coord_mask, weights=self.coord_scale)/2.0
-            loss_x7    = tf.losses.mean_squared_error(x7*coord_mask, tx7*coord_mask, weights=self.coord_scale)/2.0
-            loss_y7    = tf.losses.mean_squared_error(y7*coord_mask, ty7*coord_mask, weights=self.coord_scale)/2.0
-            loss_x8    = tf.losses.mean_squared_error(x8*coord_mask, tx8*coord_mask, weights=self.coord_scale)/2.0
-            loss_y8    = tf.losses.mean_squared_error(y8*coord_mask, ty8*coord_mask, weights=self.coord_scale)/2.0
-            loss_conf  = tf.losses.mean_squared_error(conf*conf_mask, tconf*conf)/2.0
-            loss_cls   = 0
-            loss_x     = loss_x0 + loss_x1 + loss_x2 + loss_x3 + loss_x4 + loss_x5 + loss_x6 + loss_x7 + loss_x8
-            loss_y     = loss_y0 + loss_y1 + loss_y2 + loss_y3 + loss_y4 + loss_y5 + loss_y6 + loss_y7 + loss_y8
-            loss_coord = loss_x + loss_y
+            loss_coord = tf.reduce_mean(tf.reduce_sum(tf.square(coords - tcoords), 3) * response) * self.coord_scale / 2.0
+            loss_conf  = tf.reduce_mean(tf.square(conf*conf_mask - tconf*conf))/2.0
+            if nC > 1:
+                cls_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
+                    labels=tf.cast(labels[:, :, :, 19], tf.int32), logits=output[:, :, :, 19:])  # [batch, cell, cell]
+                loss_cls = tf.reduce_sum(cls_loss * response) / tf.cast(tf.shape(output)[0], tf.float32) * self.class_scale
+            else:
+                loss_cls  = tf.constant(0.0)
 
             total_loss = loss_conf + loss_coord + loss_cls
 
@@ -249,125 +304,65 @@ class YOLO6D_net:
 
         return loss
 
-    def build_targets(self, pred_corners, target, labels, num_classes, nH, nW, noobject_scale, object_scale, sil_thresh):
+    def Distill_Loss(self, output, teacher, hard_loss, scope='Distill'):
+        """
+        output:    student output, [batch, cell, cell, 20], type: tf.tensor
+        teacher:   teacher output on the same images, [batch, cell, cell, 20], type: tf.tensor
+        hard_loss: Region_Loss against the ground truth
+        The student mimics the teacher confidence map in every cell, the keypoint
+        offsets weighted by the teacher confidence, and the remaining channels.
+        return: Region_Loss list with the weighted sum as total, plus the distill loss
+        """
+        with tf.variable_scope(scope):
+            teacher  = tf.stop_gradient(teacher)
+            coords   = tf.concat([tf.nn.sigmoid(output[:, :, :, :2]), output[:, :, :, 2:18]], 3)
+            tcoords  = tf.concat([tf.nn.sigmoid(teacher[:, :, :, :2]), teacher[:, :, :, 2:18]], 3)
+            conf     = tf.nn.sigmoid(output[:, :, :, 18])
+            tconf    = tf.nn.sigmoid(teacher[:, :, :, 18])
+
+            loss_coord = tf.reduce_mean(tf.reduce_sum(tf.square(coords - tcoords), 3) * tconf) * self.coord_scale / 2.0
+            loss_conf  = tf.reduce_mean(tf.square(conf - tconf)) / 2.0
+            loss_rest  = tf.reduce_mean(tf.square(output[:, :, :, 19:] - teacher[:, :, :, 19:])) / 2.0
+            loss_distill = loss_coord + loss_conf + loss_rest
+
+            total_loss = hard_loss[0] * self.distill_hard_scale + loss_distill * self.distill_scale
+
+        return [total_loss] + hard_loss[1:] + [loss_distill]
+
+    def corner_offsets(self, nH, nW):
+        """
+        Column (for x) and row (for y) index of every cell, [1, nH, nW, 18]
         """
-        pred_corners:   [(nB X 169), 18], type: tf.tensor
-        target:         [nB, 21], type: tf.tensor
-        labels:         [nB, nH, nW, 20], type: tf.tensor
-        num_classes:    1
-        nH:             13
-        nW:             13
+        grid_x = np.tile(np.arange(nW, dtype=np.float32).reshape(1, nW, 1), (nH, 1, 9))
+        grid_y = np.tile(np.arange(nH, dtype=np.float32).reshape(nH, 1, 1), (1, nW, 9))
+        offsets = np.stack([grid_x, grid_y], 3).reshape(1, nH, nW, 18)
+        return offsets
+
+    def build_targets(self, pred_corners, target, owner, response, noobject_scale, object_scale, sil_thresh):
+        """
+        pred_corners:   [nB, nH, nW, 18], normalized, type: tf.tensor
+        target:         [nB, M, 21], all-zero rows are padding, type: tf.tensor
+        owner:          [nB, nH * nW, M], the object assigned to every cell (see scatter_labels)
+        response:       [nB, nH, nW], 1 in the cells of the object centers, type: tf.tensor
         noobject_scale: 0.1
         object_scale:   5
         sil_thresh:     0.6
+        return: conf_mask and tconf, [nB, nH, nW], no gradient flows through them
         """
-        nB = self.Batch_Size
-        # nC = num_classes
-        conf_mask  = []
-        coord_mask = []
-        cls_mask   = []
-        tconf      = []
-        response   = labels[:,:,:,0]
-        tx0        = labels[:,:,:,1]
-        ty0        = labels[:,:,:,2]
-        tx1        = labels[:,:,:,3]
-        ty1        = labels[:,:,:,4]
-        tx2        = labels[:,:,:,5]
-        ty2        = labels[:,:,:,6]
-        tx3        = labels[:,:,:,7]
-        ty3        = labels[:,:,:,8]
-        tx4        = labels[:,:,:,9]
-        ty4        = labels[:,:,:,10]
-        tx5        = labels[:,:,:,11]
-        ty5        = labels[:,:,:,12]
-        tx6        = labels[:,:,:,13]
-        ty6        = labels[:,:,:,14]
-        tx7        = labels[:,:,:,15]
-        ty7        = labels[:,:,:,16]
-        tx8        = labels[:,:,:,17]
-        ty8        = labels[:,:,:,18]
-        tcls       = labels[:,:,:,19]
-
-        nAnchors = nH*nW
-        nPixels  = nH*nW
-        for b in range(nB):
-            cur_pre_corners = tf.transpose(pred_corners[b*nAnchors:(b+1)*nAnchors], (1,0)) # 18 X 169
-            gx0 = target[b][1]  * nW  # a value, in cell size
-            gy0 = target[b][2]  * nH
-            gx1 = target[b][3]  * nW
-            gy1 = target[b][4]  * nH
-            gx2 = target[b][5]  * nW
-            gy2 = target[b][6]  * nH
-            gx3 = target[b][7]  * nW
-            gy3 = target[b][8]  * nH
-            gx4 = target[b][9]  * nW
-            gy4 = target[b][10] * nH
-            gx5 = target[b][11] * nW
-            gy5 = target[b][12] * nH
-            gx6 = target[b][13] * nW
-            gy6 = target[b][14] * nH
-            gx7 = target[b][15] * nW
-            gy7 = target[b][16] * nH
-            gx8 = target[b][17] * nW
-            gy8 = target[b][18] * nH
-            cur_gt_corners = tf.transpose(tf.tile(tf.Variable([[gx0/nW,gy0/nH,gx1/nW,gy1/nH,gx2/nW,gy2/nH,gx3/nW,gy3/nH,gx4/nW,gy4/nH,\
-                gx5/nW,gy5/nH,gx6/nW,gy6/nH,gx7/nW,gy7/nH,gx8/nW,gy8/nH]]), (nAnchors, 1)), (1, 0))  # 18 X 169
-            # compute current confidence value
-            cur_confs = tf.nn.relu(corner_confidences9(cur_pre_corners, cur_gt_corners))  # [169]
-            temp = tf.reshape(tf.cast(cur_confs < sil_thresh, tf.float32), (nH, nW)) * noobject_scale
-            conf_mask.append(temp)  # a list
-
-        nGT = 0
-        nCorrect = 0
-        for b in range(nB):
-            nGT = nGT + 1
-            best_n = -1
-            gx0 = target[b][1]  * nW
-            gy0 = target[b][2]  * nH
-            gx1 = target[b][3]  * nW
-            gy1 = target[b][4]  * nH
-            gx2 = target[b][5]  * nW
-            gy2 = target[b][6]  * nH
-            gx3 = target[b][7]  * nW
-            gy3 = target[b][8]  * nH
-            gx4 = target[b][9]  * nW
-            gy4 = target[b][10] * nH
-            gx5 = target[b][11] * nW
-            gy5 = target[b][12] * nH
-            gx6 = target[b][13] * nW
-            gy6 = target[b][14] * nH
-            gx7 = target[b][15] * nW
-            gy7 = target[b][16] * nH
-            gx8 = target[b][17] * nW
-            gy8 = target[b][18] * nH
-            gi0, gj0 = get_max_index(response[b])
-
-            best_n = 0  # 1 anchor, single object
-            temp_location           = response[b]  # [nW, nH]
-            gt_box                  = tf.convert_to_tensor([gx0/nW,gy0/nH,gx1/nW,gy1/nH,gx2/nW,gy2/nH,gx3/nW,gy3/nH,gx4/nW,gy4/nH,\
-                                       gx5/nW,gy5/nH,gx6/nW,gy6/nH,gx7/nW,gy7/nH,gx8/nW,gy8/nH])
-            pred_box                = pred_corners[b*nAnchors+best_n*nPixels+gj0*nW+gi0] # [18,]
-            conf                    = corner_confidence9(gt_box, pred_box)
-            coord_mask.append(temp_location)
-            cls_mask.append(temp_location)
-            # conf_temp               = np.ones([nH, nW])
-            conf_temp               = temp_location * object_scale
-            conf_mask[b]            = conf_mask[b] + conf_temp
-            # tconf[b][gj0][gi0]      = conf
-            tconf.append(temp_location * conf)
-
-            # if conf > 0.5:
-                # nCorrect = nCorrect + 1
-            nCorrect = tf.cond(conf > 0.5, lambda: nCorrect + 1, lambda: nCorrect)
-
-        tconf      = tf.convert_to_tensor(tconf)
-        conf_mask  = tf.convert_to_tensor(conf_mask)
-        coord_mask = tf.convert_to_tensor(coord_mask)
-        cls_mask   = tf.convert_to_tensor(cls_mask)
-
-        return nGT, nCorrect, coord_mask, conf_mask, cls_mask, tx0, tx1, tx2, tx3, tx4, tx5,\
-             tx6, tx7, tx8, ty0, ty1, ty2, ty3, ty4, ty5, ty6, ty7, ty8, tconf, tcls
+        shape = tf.shape(pred_corners)
+        valid = tf.cast(tf.reduce_max(tf.abs(target[:, :, 1:19]), 2) > 0, tf.float32)  # [nB, M]
+        gt_corners = tf.expand_dims(tf.expand_dims(target[:, :, 1:19], 2), 2)  # [nB, M, 1, 1, 18]
+        # confidence of every predicted box against every ground truth
+        cur_confs  = corner_confidences_grid(gt_corners, tf.expand_dims(pred_corners, 1))  # [nB, M, nH, nW]
+        cur_confs  = cur_confs * tf.reshape(valid, [shape[0], -1, 1, 1])
+        best_confs = tf.reduce_max(cur_confs, 1)  # a prediction close to any object is not penalized
+        # the responsible cells aim at the confidence against their own object
+        own_confs  = tf.reduce_sum(owner * tf.transpose(tf.reshape(cur_confs, [shape[0], -1, shape[1] * shape[2]]), [0, 2, 1]), 2)
+
+        conf_mask  = tf.cast(best_confs < sil_thresh, tf.float32) * noobject_scale + response * object_scale
+        tconf      = response * tf.reshape(own_confs, shape[:3])
 
+        return tf.stop_gradient(conf_mask), tf.stop_gradient(tconf)
 
     def loss_layer(self, predicts, labels, scope='Loss_layer'):
         """
@@ -410,10 +405,10 @@ class YOLO6D_net:
             predict_conf      = tf.reshape(predicts[:, :, :, 0], [self.Batch_Size, self.cell_size, self.cell_size, 1])  # get predicted confidence
             predict_boxes_tr  = tf.concat([tf.nn.sigmoid(predicts[:,:,:,1:3]), predicts[:,:,:,3:self.boundry_1+1]], 3)
             # offset for predicts
-            off_set_x  = np.tile(np.reshape(np.array([np.arange(13)] * 13 ), (13, 13, 1)), (1, 1, 9))
+            off_set_x  = np.tile(np.reshape(np.array([np.arange(self.cell_size)] * self.cell_size), (self.cell_size, self.cell_size, 1)), (1, 1, 9))
             off_set_y  = np.transpose(off_set_x, (1, 0, 2))
-            off_set_x  = np.tile(np.transpose(np.reshape(off_set_x, (13, 13, 9, 1)), (3, 0, 1, 2)), (self.Batch_Size, 1, 1, 1))  # [Batch, cell, cell, 9]
-            off_set_y  = np.tile(np.transpose(np.reshape(off_set_y, (13, 13, 9, 1)), (3, 0, 1, 2)), (self.Batch_Size, 1, 1, 1))  # [Batch, cell, cell, 9]
+            off_set_x  = np.tile(np.transpose(np.reshape(off_set_x, (self.cell_size, self.cell_size, 9, 1)), (3, 0, 1, 2)), (self.Batch_Size, 1, 1, 1))  # [Batch, cell, cell, 9]
+            off_set_y  = np.tile(np.transpose(np.reshape(off_set_y, (self.cell_size, self.cell_size, 9, 1)), (3, 0, 1, 2)), (self.Batch_Size, 1, 1, 1))  # [Batch, cell, cell, 9]
             predict__x = tf.transpose(tf.stack([predict_boxes_tr[:,:,:,0],  predict_boxes_tr[:,:,:,2],  predict_boxes_tr[:,:,:,4],
                                                 predict_boxes_tr[:,:,:,6],  predict_boxes_tr[:,:,:,8],  predict_boxes_tr[:,:,:,10],
                                                 predict_boxes_tr[:,:,:,12], predict_boxes_tr[:,:,:,14], predict_boxes_tr[:,:,:,16]]),
@@ -492,7 +487,7 @@ class YOLO6D_net:
         Args:
             output tensor by net: [batch, cell_size, cell_size, 19+num_class]
         """
-        predict_classes = tf.reshape(predicts[:, :, :, 18:-1], [self.Batch_Size, self.cell_size, self.cell_size, self.num_class])
+        predict_classes = tf.reshape(predicts[:, :, :, 18:-1], [-1, self.cell_size, self.cell_size, self.num_class])
         confidence = tf.tile(confidence, [1, 1, 1, self.num_class])
 
         class_speci_conf_score = tf.multiply(predict_classes, confidence)